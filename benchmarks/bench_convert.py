@@ -0,0 +1,46 @@
+"""
+Compare the ways of converting a list of gene identifiers.
+
+Usage:
+    python benchmarks/bench_convert.py
+"""
+import timeit
+import numpy
+import pandas
+
+from genemunge import convert
+
+
+def convert_list_dataframe(converter, ids):
+    """The original implementation of IDConverter.convert_list."""
+    good_keys = converter.conversion_table.index.intersection(ids)
+    converted = list(converter.conversion_table.loc[good_keys][converter.target])
+    tmp = pandas.DataFrame(numpy.full(len(ids), numpy.NaN), index=ids)
+    tmp.loc[good_keys] = converted
+    return list(tmp[0])
+
+
+def main(sizes=[100, 1000, 10000], repeat=5):
+    converter = convert.IDConverter('ensembl_gene_id', 'symbol')
+    genes = numpy.asarray(converter.conversion_table.index, dtype=object)
+    numpy.random.seed(0)
+    print('{:>8} {:>24} {:>12}'.format('ids', 'method', 'ms per call'))
+    for size in sizes:
+        # the original implementation fails on repeated ids, so they are unique
+        # about 10% of the ids are not in the table
+        ids = numpy.random.choice(genes, size, replace=False)
+        ids[::10] = ['not_an_id_{}'.format(i) for i in range(len(ids[::10]))]
+        methods = {
+            'dataframe (original)': lambda: convert_list_dataframe(converter, list(ids)),
+            'convert_list': lambda: converter.convert_list(list(ids)),
+            'convert_array (ndarray)': lambda: converter.convert_array(ids),
+            'convert_array (Index)': lambda: converter.convert_array(pandas.Index(ids)),
+            }
+        for name, method in methods.items():
+            number = max(1, 100000 // size)
+            best = min(timeit.repeat(method, number=number, repeat=repeat)) / number
+            print('{:>8} {:>24} {:>12.3f}'.format(size, name, 1000 * best))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,8 @@
+from . import resources
 from . import convert
 from . import search
 from . import data
+from . import stream
 from . import normalize
 from . import describe
+from . import locate
@@ -1,9 +1,108 @@
-import os, pandas, numpy
+import os, pandas, numpy, warnings, functools
 from typing import List
+from cytoolz import partial
+
+from . import resources
 
 
 FILEPATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
 FILENAME = os.path.join(FILEPATH, 'hgnc_complete_set.txt')
+COLUMNPATH = os.path.join(FILEPATH, 'hgnc_columns')
+# part of the signature of the column cache, so that caches with another
+# layout are rebuilt
+COLUMN_LAYOUT = 'utf8-offsets'
+CLEANED_CACHE_SIZE = 16
+
+_cleaned_indexes = resources.IdentityCache(CLEANED_CACHE_SIZE)
+
+
+def _column_signature(filename):
+    """
+    Get the signature of a column cache built from a file.
+
+    Args:
+        filename (str): the HGNC table
+
+    Returns:
+        str
+
+    """
+    return COLUMN_LAYOUT + ':' + resources.file_hash(filename)
+
+
+def build_column_cache(filename=FILENAME, dirname=COLUMNPATH):
+    """
+    Convert the HGNC table into a pair of .npy files per column: the UTF-8
+    bytes of the values, and the offset of each value in the bytes.
+
+    Missing values are stored as empty strings.
+
+    Args:
+        filename (optional; str): the HGNC table
+        dirname (optional; str): the directory of the cache
+
+    Returns:
+        dict {str: numpy array}: the columns
+
+    """
+    table = pandas.read_table(filename, dtype=str)
+    columns = {c: table[c].fillna('').values.astype(object) for c in table.columns}
+    arrays = {}
+    for c, values in columns.items():
+        arrays[c + '_text'], arrays[c + '_offsets'] = resources.encode_strings(values)
+    try:
+        resources.save_arrays(dirname, arrays, _column_signature(filename))
+    except OSError as err:
+        warnings.warn("Could not save the HGNC column cache: {}".format(err))
+    return columns
+
+
+def _open_column_cache(filename, dirname):
+    """
+    Check that the column cache is up to date with the HGNC table,
+    building it if necessary.
+
+    Args:
+        filename (str): the HGNC table
+        dirname (str): the directory of the cache
+
+    Returns:
+        dict {str: numpy array} or None: the columns if the cache could not
+            be read from disk, otherwise None
+
+    """
+    signature = _column_signature(filename)
+    if resources.saved_signature(dirname) == signature:
+        return None
+    columns = build_column_cache(filename, dirname)
+    if resources.saved_signature(dirname) == signature:
+        return None
+    return columns
+
+
+def load_columns(columns, filename=FILENAME, dirname=COLUMNPATH):
+    """
+    Read some columns of the HGNC table from the column cache.
+    The files are memory mapped, so only the requested columns are read.
+
+    Args:
+        columns (List[str]): the columns to read
+        filename (optional; str): the HGNC table
+        dirname (optional; str): the directory of the cache
+
+    Returns:
+        dict {str: numpy array}: the columns as object arrays of str,
+            with missing values as ''
+
+    """
+    in_memory = resources.get(('hgnc_columns', filename, dirname),
+                              partial(_open_column_cache, filename, dirname))
+    if in_memory is not None:
+        return {c: in_memory[c] for c in columns}
+    return {c: resources.decode_strings(
+                numpy.load(os.path.join(dirname, c + '_text.npy'), mmap_mode='r'),
+                numpy.load(os.path.join(dirname, c + '_offsets.npy'), mmap_mode='r'))
+            for c in columns}
 
 
 def clean_ensembl_id(identifier):
@@ -22,32 +121,106 @@ def clean_ensembl_id(identifier):
     return identifier.split('.')[0].upper()
 
 
-def clean_ensembl_ids(identifiers):
+def clean_ensembl_ids(identifiers, cache=False):
     """
     Formats ensembl gene identifiers to drop the version number
 
     E.g., ENSG00000002822.15 -> ENSG00000002822
 
     Args:
-        identifiers (List[str])
+        identifiers (List[str], numpy array, or pandas.Index)
+        cache (optional; bool): remember the result for a pandas.Index, so
+            that cleaning the same index object again is free.
+
+    Returns:
+        identifiers (List[str], numpy array, or pandas.Index): the same
+            type as the input
+
+    """
+    if cache and isinstance(identifiers, pandas.Index):
+        return _cleaned_indexes.get(identifiers, partial(clean_ensembl_ids, identifiers))
+    # str methods on python strings are faster than the numpy.char or
+    # pandas .str equivalents, which loop over the same objects
+    values = identifiers.tolist() if hasattr(identifiers, 'tolist') else identifiers
+    cleaned = [i.partition('.')[0].upper() for i in values]
+    if isinstance(identifiers, pandas.Index):
+        return pandas.Index(cleaned, dtype=object, name=identifiers.name)
+    if isinstance(identifiers, numpy.ndarray):
+        return numpy.array(cleaned, dtype=object if identifiers.dtype == object else str)
+    return cleaned
+
+
+def aggregate_columns(values, labels, how='sum', sort=False):
+    """
+    Aggregate the columns of a matrix that have the same label.
+
+    The columns are gathered into groups with a single sort and reduced
+    with numpy ufunc.reduceat. Missing values are skipped by 'sum', 'mean',
+    and 'max', as in pandas; 'first' keeps the first column of each group.
+    Columns with missing labels are dropped, as by pandas groupby.
+
+    Args:
+        values (numpy array ~ (num_rows, num_columns))
+        labels (List or pandas.Index ~ (num_columns,))
+        how (optional; str): 'sum', 'first', 'mean', or 'max'
+        sort (optional; bool): sort the labels of the result. Otherwise,
+            they are in the order of their first occurrence.
 
     Returns:
-        identifiers (List[str])
+        values (numpy array ~ (num_rows, num_labels))
+        labels (pandas.Index ~ (num_labels,))
 
     """
-    return list(map(clean_ensembl_id, identifiers))
+    assert how in ['sum', 'first', 'mean', 'max'], "unknown aggregation {}".format(how)
+    codes, uniques = pandas.factorize(numpy.asarray(labels, dtype=object), sort=sort)
+    uniques = pandas.Index(uniques, dtype=object)
+    labeled = codes >= 0
+    if not labeled.all():
+        values, codes = values[:, labeled], codes[labeled]
+    if len(uniques) == len(codes):
+        # no duplicates
+        order = numpy.argsort(codes)
+        return values[:, order], uniques
+    order = numpy.argsort(codes, kind='stable')
+    counts = numpy.bincount(codes, minlength=len(uniques))
+    starts = numpy.concatenate([[0], numpy.cumsum(counts)[:-1]])
+    if how == 'first':
+        return values[:, order[starts]], uniques
+    grouped = values[:, order]
+    if how == 'max':
+        return numpy.fmax.reduceat(grouped, starts, axis=1), uniques
+    missing = pandas.isnull(grouped)
+    if missing.any():
+        grouped[missing] = 0
+        counts = numpy.add.reduceat(~missing, starts, axis=1)
+    total = numpy.add.reduceat(grouped, starts, axis=1)
+    if how == 'mean':
+        return total / counts, uniques
+    return total, uniques
 
 
 class IDConverter(object):
     """
     Convert between gene identifiers.
 
+    By default, source ids that occur in more than one row of the HGNC
+    table are dropped and multi-valued fields (e.g., 'uniprot_ids') are
+    treated as opaque strings. The policy argument of the conversion methods
+    instead uses an index of the individual values separated by '|':
+        'first': the first target of each id, in HGNC order
+        'unique_only': the target of ids that have exactly one target
+        'all': every target of each id
+
     Attributes:
         potential_ids (List): a class attribute specifying the different types
             of identifiers that may be converted from/to.
+        multi_valued_ids (List): a class attribute specifying the types
+            of identifiers that hold several values separated by '|'.
+        policies (List): a class attribute specifying the one-to-many policies.
         source (str): the source id type, e.g. 'symbol'
         target (str): the target id type, e.g. 'name'
-        conversion_table (DataFrame): a conversion table between id types.
+        conversion_table (DataFrame): a conversion table between id types,
+            shared by all converters between the same id types.
 
     """
 
@@ -101,13 +274,37 @@ class IDConverter(object):
                      'intermediate_filament_db',
                      'rna_central_ids']
 
-    def __init__(self, source_id: str, target_id: str):
+    multi_valued_ids = ['alias_symbol',
+                        'alias_name',
+                        'prev_symbol',
+                        'prev_name',
+                        'gene_family',
+                        'gene_family_id',
+                        'ena',
+                        'refseq_accession',
+                        'ccds_id',
+                        'uniprot_ids',
+                        'pubmed_id',
+                        'mgd_id',
+                        'rgd_id',
+                        'lsdb',
+                        'omim_id',
+                        'enzyme_id',
+                        'rna_central_ids']
+
+    policies = ['first', 'unique_only', 'all']
+
+    def __init__(self, source_id: str, target_id: str, cache_size=None):
         """
         Create IDConverter.
 
         Args:
             source_id (str): the id type to convert
             target_id (str): the desired id type
+            cache_size (optional; int): if None, single ids are converted
+                with a dictionary of the whole conversion table that is built
+                the first time it is needed. Otherwise, the most recently
+                converted ids are kept in an LRU cache of this size.
 
         Returns:
             IDConverter
@@ -120,9 +317,35 @@ class IDConverter(object):
 
         self.source = source_id
         self.target = target_id
-        self.conversion_table = pandas.read_table(FILENAME,
-                        usecols=[source_id, target_id], dtype=str)
+        self.conversion_table = resources.get(
+                ('conversion_table', source_id, target_id),
+                self._load_conversion_table)
+        if source_id == target_id:
+            self._targets = self.conversion_table.index.values
+        else:
+            self._targets = self.conversion_table[target_id].values
+        self.cache_size = cache_size
+        self._lookup_table = None
+        if cache_size is not None:
+            self._lookup_one = functools.lru_cache(maxsize=cache_size)(self._lookup_one)
+
+    def _load_conversion_table(self):
+        """
+        Read the conversion table from the HGNC column cache.
+
+        Args:
+            None
+
+        Returns:
+            DataFrame
+
+        """
+        columns = load_columns([self.source, self.target])
+        self.conversion_table = pandas.DataFrame(
+                {c: numpy.where(v == '', numpy.nan, v)
+                 for c, v in columns.items()})
         self._clean_conversion_table()
+        return self.conversion_table
 
     def _clean_conversion_table(self):
         """
@@ -145,10 +368,135 @@ class IDConverter(object):
         # set the index to the source column
         self.conversion_table.set_index(self.source, inplace=True)
 
-    def convert(self, identifier):
+    def _load_one_to_many(self):
+        """
+        Build an index from each individual source value to all of its
+        target values. Multi-valued fields are split on '|'.
+
+        Args:
+            None
+
+        Returns:
+            dict: with keys
+                'index' (pandas.Index): the source values, sorted
+                'indptr' (numpy array): the targets of index[i] are in
+                    targets[indptr[i]:indptr[i+1]]
+                'targets' (numpy array): the target values, in HGNC order
+
+        """
+        columns = load_columns([self.source, self.target])
+        values = []
+        for c in [self.source, self.target]:
+            column = pandas.Series(columns[c])
+            if c in self.multi_valued_ids:
+                column = column.str.split('|').explode()
+            values.append(column.rename(c))
+        if self.source == self.target:
+            pairs = pandas.concat([values[0], values[0].rename(None)], axis=1)
+        else:
+            pairs = pandas.concat(values[:1], axis=1).join(values[1])
+        pairs.columns = ['source', 'target']
+        pairs = pairs[(pairs['source'] != '') & (pairs['target'] != '')]
+        pairs = pairs.drop_duplicates()
+        codes, index = pandas.factorize(pairs['source'].values, sort=True)
+        order = numpy.argsort(codes, kind='stable')
+        counts = numpy.bincount(codes, minlength=len(index))
+        return {'index': pandas.Index(index, dtype=object),
+                'indptr': numpy.concatenate([[0], numpy.cumsum(counts)]).astype(numpy.int64),
+                'targets': pairs['target'].values[order]}
+
+    @property
+    def one_to_many(self):
+        """
+        An index from each individual source value to all of its targets,
+        shared by all converters between the same id types.
+
+        Returns:
+            dict
+
+        """
+        return resources.get(('one_to_many', self.source, self.target),
+                             self._load_one_to_many)
+
+    def _lookup(self, ids, policy):
+        """
+        Find the targets of some identifiers in the one-to-many index.
+
+        Args:
+            ids (List[str]): gene identifiers to convert
+            policy (str): 'first', 'unique_only', or 'all'
+
+        Returns:
+            found (numpy array): positions of the ids that have targets
+            counts (numpy array): the number of targets of each found id
+            targets (numpy array): the targets of the found ids, in order
+
+        """
+        assert policy in self.policies, \
+        "unknown policy. known policies {}".format(self.policies)
+        table = self.one_to_many
+        rows = table['index'].get_indexer(ids)
+        found = numpy.flatnonzero(rows >= 0)
+        rows = rows[found]
+        starts = table['indptr'][rows]
+        counts = table['indptr'][rows + 1] - starts
+        if policy == 'unique_only':
+            keep = counts == 1
+            found, starts, counts = found[keep], starts[keep], counts[keep]
+        elif policy == 'first':
+            counts = numpy.ones_like(counts)
+        # the positions of the targets of each found id, concatenated
+        offsets = numpy.cumsum(counts) - counts
+        take = numpy.repeat(starts - offsets, counts) + numpy.arange(counts.sum())
+        return found, counts, table['targets'][take]
+
+    def convert_long(self, ids, policy='all'):
+        """
+        Convert gene identifiers that may have several targets.
+
+        Args:
+            ids (List[str]): gene identifiers to convert
+            policy (optional; str): 'first', 'unique_only', or 'all'
+
+        Returns:
+            pandas.DataFrame: with one row per (id, target) pair and columns
+                for the source and target id types. The index holds the
+                position of each id in ids. Ids without a target are dropped.
+
+        """
+        ids = numpy.asarray(ids, dtype=object)
+        found, counts, targets = self._lookup(ids, policy)
+        positions = numpy.repeat(found, counts)
+        return pandas.DataFrame({self.source: ids[positions], self.target: targets},
+                                index=positions, columns=[self.source, self.target])
+
+    def convert(self, identifier, policy=None):
         """
         Convert a gene identifier.
 
+        Args:
+            identifier (str): gene identifier to convert
+            policy (optional; str): None, 'first', 'unique_only', or 'all'
+
+        Returns:
+            str: converted gene identifier
+                (List[str] if the policy is 'all')
+
+        """
+        if policy is not None:
+            return self.convert_list([identifier], policy)[0]
+        if self.cache_size is not None:
+            return self._lookup_one(identifier)
+        if self._lookup_table is None:
+            self._lookup_table = resources.get(
+                    ('conversion_dict', self.source, self.target),
+                    lambda: dict(zip(self.conversion_table.index, self._targets)))
+        return self._lookup_table.get(identifier, numpy.NaN)
+
+    def _lookup_one(self, identifier):
+        """
+        Convert a gene identifier using the conversion table index.
+
         Args:
             identifier (str): gene identifier to convert
 
@@ -157,24 +505,414 @@ class IDConverter(object):
 
         """
         try:
-            return self.conversion_table.loc[identifier][self.target]
+            return self._targets[self.conversion_table.index.get_loc(identifier)]
         except KeyError:
             return numpy.NaN
 
-    # TODO: what about ids where the mapping isn't unique?
-    def convert_list(self, ids: List) -> List:
+    def convert_columns(self, data, on_duplicate='sum', on_missing='drop'):
+        """
+        Convert the column labels of a DataFrame and aggregate any columns
+        that end up with the same label.
+
+        Args:
+            data (pandas.DataFrame ~ (num_samples, num_genes))
+            on_duplicate (optional; str): how to combine columns with the same
+                label: 'sum', 'first', 'mean', or 'max'
+            on_missing (optional; str): 'drop' the columns that cannot be
+                converted, or 'keep' them with their original labels. Ids
+                whose target is empty in the HGNC table cannot be converted.
+
+        Returns:
+            pandas.DataFrame ~ (num_samples, num_converted_genes)
+
+        """
+        assert on_missing in ['drop', 'keep'], "unknown on_missing {}".format(on_missing)
+        labels = self.convert_array(data.columns.values, missing=None)
+        values = data.values
+        not_found = pandas.isnull(labels)
+        if on_missing == 'keep':
+            labels = numpy.where(not_found, data.columns.values, labels)
+        elif not_found.any():
+            values = values[:, ~not_found]
+            labels = labels[~not_found]
+        values, labels = aggregate_columns(values, labels, on_duplicate)
+        return pandas.DataFrame(values, index=data.index,
+                                columns=labels.rename(self.target))
+
+    def convert_list(self, ids: List, policy=None) -> List:
         """
         Convert a list of gene identifiers.
 
         Args:
             ids (List[str]): list of gene identifiers to convert
+            policy (optional; str): None, 'first', 'unique_only', or 'all'
 
         Returns:
             List[str]: list of converted gene identifiers
+                (List[List[str]] if the policy is 'all')
+
+        """
+        if policy == 'all':
+            found, counts, targets = self._lookup(ids, policy)
+            converted = [[] for _ in range(len(ids))]
+            for i, group in zip(found, numpy.split(targets, numpy.cumsum(counts)[:-1])):
+                converted[i] = list(group)
+            return converted
+        if policy is not None:
+            found, counts, targets = self._lookup(ids, policy)
+            converted = numpy.full(len(ids), numpy.NaN, dtype=object)
+            converted[found] = targets
+            return list(converted)
+        return list(self.convert_array(ids))
+
+    def convert_array(self, ids, missing=numpy.NaN):
+        """
+        Convert an array of gene identifiers.
+
+        The identifiers are looked up in the hash table of the conversion
+        table index, and the targets are gathered into a new array without
+        any intermediate DataFrames.
+
+        Args:
+            ids (List[str], numpy array, or pandas.Index): gene identifiers
+            missing (optional): the value for identifiers that are not found
+
+        Returns:
+            numpy array or pandas.Index (if ids is a pandas.Index)
+
+        """
+        positions = self.conversion_table.index.get_indexer(ids)
+        converted = self._targets.take(positions)
+        not_found = positions < 0
+        if not_found.any():
+            converted[not_found] = missing
+        if isinstance(ids, pandas.Index):
+            return pandas.Index(converted, name=self.target)
+        return converted
+
+
+class MultiConverter(object):
+    """
+    Convert gene identifiers to several types of identifiers at once.
+
+    As with IDConverter, source ids that occur in more than one row of the
+    HGNC table are dropped.
+
+    Attributes:
+        source (str): the source id type, e.g. 'ensembl_gene_id'
+        targets (List[str]): the target id types, e.g. ['symbol', 'name']
+        index (pandas.Index): the source ids.
+        table (numpy array ~ (num_ids + 1, num_targets)): the target ids of
+            each source id. The last row is all NaN, for ids not in the index.
+
+    """
+    def __init__(self, source_id, target_ids):
+        """
+        Create a MultiConverter.
+
+        Args:
+            source_id (str): the id type to convert
+            target_ids (List[str]): the desired id types
+
+        Returns:
+            MultiConverter
+
+        """
+        for id_type in [source_id] + list(target_ids):
+            assert id_type in IDConverter.potential_ids, \
+            "unknown id type. known types {}".format(IDConverter.potential_ids)
+        self.source = source_id
+        self.targets = list(target_ids)
+        self.index, self.table = resources.get(
+                ('multi_conversion', source_id, tuple(self.targets)), self._load_table)
+
+    def _load_table(self):
+        """
+        Read the source and target columns from the HGNC column cache.
+
+        Args:
+            None
+
+        Returns:
+            index (pandas.Index)
+            table (numpy array)
+
+        """
+        columns = load_columns(list(set([self.source] + self.targets)))
+        source = columns[self.source]
+        keep = source != ''
+        index = pandas.Index(source[keep])
+        unique = ~index.duplicated(keep=False)
+        rows = numpy.flatnonzero(keep)[unique]
+        table = numpy.full((len(rows) + 1, len(self.targets)), numpy.NaN, dtype=object)
+        for j, target in enumerate(self.targets):
+            values = columns[target][rows]
+            table[:-1, j] = numpy.where(values == '', numpy.NaN, values)
+        return index[unique], table
+
+    def convert(self, ids):
+        """
+        Convert a list of gene identifiers.
+
+        Args:
+            ids (List[str], numpy array, or pandas.Index): gene identifiers
+
+        Returns:
+            pandas.DataFrame ~ (num_ids, num_targets): indexed by the ids,
+                with NaN for ids that cannot be converted
+
+        """
+        # ids that are not found have position -1, which is the row of NaN
+        converted = self.table.take(self.index.get_indexer(ids), axis=0)
+        return pandas.DataFrame(converted, index=ids, columns=self.targets)
+
+
+class GeneUniverse(object):
+    """
+    A fixed integer index over the genes in the HGNC table, with
+    precomputed categories for selecting subsets of the genes.
+
+    Masks are boolean numpy arrays over the genes, so they can be combined
+    with &, |, and ~ and applied with a single take.
+
+    Attributes:
+        categories (List[str]): a class attribute specifying the HGNC columns
+            that can be used to select genes.
+        identifier (str): the id type of the genes, e.g. 'ensembl_gene_id'
+        genes (pandas.Index): the genes. Genes without an identifier, or that
+            share one, are dropped.
+        values (dict {str: pandas.Index}): the values of each category.
+        codes (dict {str: numpy array}): the position of the value of each
+            gene in values. For 'gene_family', which can have several values,
+            the (gene, value) pairs are stored as two arrays.
+
+    """
+    categories = ['locus_group', 'locus_type', 'status', 'gene_family']
+
+    def __init__(self, identifier='ensembl_gene_id'):
+        """
+        Create a GeneUniverse.
+
+        Args:
+            identifier (optional; str): the id type of the genes
+
+        Returns:
+            GeneUniverse
+
+        """
+        assert identifier in IDConverter.potential_ids, \
+        "unknown id type. known types {}".format(IDConverter.potential_ids)
+        self.identifier = identifier
+        self.genes, self.values, self.codes = resources.get(
+                ('gene_universe', identifier), self._load_categories)
+
+    def __len__(self):
+        return len(self.genes)
+
+    def _load_categories(self):
+        """
+        Read the categories of each gene from the HGNC column cache.
+
+        Args:
+            None
+
+        Returns:
+            genes (pandas.Index)
+            values (dict)
+            codes (dict)
+
+        """
+        columns = load_columns(list(set([self.identifier] + self.categories)))
+        ids = columns[self.identifier]
+        genes = pandas.Index(ids)
+        rows = numpy.flatnonzero((ids != '') & ~genes.duplicated(keep=False))
+        values, codes = {}, {}
+        for category in self.categories:
+            column = pandas.Series(columns[category][rows])
+            if category in IDConverter.multi_valued_ids:
+                column = column.str.split('|').explode()
+                column = column[column != '']
+                gene_codes, value_codes = column.index.values, column.values
+            else:
+                gene_codes, value_codes = None, column.values
+            value_codes, values[category] = pandas.factorize(value_codes, sort=True)
+            if gene_codes is None:
+                codes[category] = value_codes.astype(numpy.int32)
+            else:
+                codes[category] = (gene_codes.astype(numpy.int32),
+                                   value_codes.astype(numpy.int32))
+            values[category] = pandas.Index(values[category], dtype=object)
+        return genes[rows], values, codes
+
+    def mask(self, **selection):
+        """
+        Get a mask of the genes in some categories.
+
+        E.g., universe.mask(locus_group='protein-coding gene', status='Approved')
+
+        Args:
+            selection: for each category, a value or a list of values.
+                A gene is selected if it has any of the values of every
+                category.
+
+        Returns:
+            numpy array ~ (num_genes,): a boolean mask over the genes
+
+        """
+        mask = numpy.ones(len(self.genes), dtype=bool)
+        for category, wanted in selection.items():
+            assert category in self.categories, \
+            "unknown category. known categories {}".format(self.categories)
+            if isinstance(wanted, str):
+                wanted = [wanted]
+            selected = self.values[category].isin(wanted)
+            codes = self.codes[category]
+            if isinstance(codes, tuple):
+                in_category = numpy.zeros(len(self.genes), dtype=bool)
+                in_category[codes[0][selected[codes[1]]]] = True
+            else:
+                in_category = selected[codes]
+            mask &= in_category
+        return mask
+
+    def select(self, mask):
+        """
+        Get the genes in a mask.
+
+        Args:
+            mask (numpy array ~ (num_genes,)): a boolean mask over the genes
+
+        Returns:
+            pandas.Index
+
+        """
+        return self.genes[mask]
+
+    def align(self, genes):
+        """
+        Get the positions of some genes in the universe.
+
+        Args:
+            genes (List[str] or pandas.Index)
+
+        Returns:
+            numpy array: the position of each gene, or -1 if it is not found
+
+        """
+        return self.genes.get_indexer(genes)
+
+
+class SymbolResolver(object):
+    """
+    Resolve gene symbols that may be outdated.
+
+    Each id is looked up in a series of stages, by default the approved
+    symbols, then the previous symbols, then the aliases. The first stage
+    that contains the id is used. An id is ambiguous if that stage maps it
+    to more than one gene; the first gene in HGNC order is returned.
+
+    All of the stages are merged into a single index when the resolver is
+    created, so a list of ids is resolved in one vectorized lookup.
+
+    Attributes:
+        target (str): the target id type, e.g. 'ensembl_gene_id'
+        stages (List[str]): the id types to search, in order.
+        index (pandas.Index): every id in any of the stages.
+        targets (numpy array): the resolved target of each id in the index.
+        stage_codes (numpy array): the stage that matched each id in the index.
+        ambiguous (numpy array): whether each id in the index matched
+            more than one gene.
+
+    """
+    def __init__(self, target_id='symbol',
+                 stages=['symbol', 'prev_symbol', 'alias_symbol']):
+        """
+        Create a SymbolResolver.
+
+        Args:
+            target_id (optional; str): the desired id type
+            stages (optional; List[str]): the id types to search, in order
+
+        Returns:
+            SymbolResolver
+
+        """
+        for stage in [target_id] + list(stages):
+            assert stage in IDConverter.potential_ids, \
+            "unknown id type. known types {}".format(IDConverter.potential_ids)
+        self.target = target_id
+        self.stages = list(stages)
+        merged = resources.get(('symbol_resolver', target_id, tuple(stages)),
+                               self._merge_stages)
+        self.index, self.targets, self.stage_codes, self.ambiguous = merged
+
+    def _merge_stages(self):
+        """
+        Merge the stages into a single index.
+
+        Args:
+            None
+
+        Returns:
+            index (pandas.Index)
+            targets (numpy array)
+            stage_codes (numpy array)
+            ambiguous (numpy array)
+
+        """
+        columns = load_columns(list(set(self.stages + [self.target])))
+        target = columns[self.target]
+        keys, rows, stages = [], [], []
+        for k, stage in enumerate(self.stages):
+            values = pandas.Series(columns[stage])
+            if stage in IDConverter.multi_valued_ids:
+                values = values.str.split('|').explode()
+            keep = (values.values != '') & (target[values.index.values] != '')
+            keys.append(values.values[keep])
+            rows.append(values.index.values[keep])
+            stages.append(numpy.full(keep.sum(), k, dtype=numpy.int8))
+        keys, rows, stages = [numpy.concatenate(x) for x in [keys, rows, stages]]
+        codes, index = pandas.factorize(keys)
+        # sort by (id, stage, row) and keep the first stage of each id
+        order = numpy.lexsort((rows, stages, codes))
+        codes, rows, stages = codes[order], rows[order], stages[order]
+        first = numpy.concatenate([[True], codes[1:] != codes[:-1]])
+        best = stages[first][codes]
+        keep = stages == best
+        codes, rows = codes[keep], rows[keep]
+        first = first[keep]
+        # an id is ambiguous if its stage has more than one distinct target
+        _, pairs = numpy.unique(numpy.stack([codes, pandas.factorize(target[rows])[0]]),
+                                axis=1, return_index=True)
+        num_targets = numpy.bincount(codes[pairs], minlength=len(index))
+        return (pandas.Index(index, dtype=object), target[rows[first]],
+                stages[first], num_targets > 1)
+
+    def resolve(self, ids):
+        """
+        Resolve a list of gene ids.
+
+        Args:
+            ids (List[str]): the gene ids to resolve
+
+        Returns:
+            pandas.DataFrame: indexed by the ids, with columns
+                target: the resolved id (NaN if not found)
+                'stage': the id type that matched (NaN if not found)
+                'ambiguous': True if the id matched more than one gene
 
         """
-        good_keys = self.conversion_table.index.intersection(ids)
-        converted = list(self.conversion_table.loc[good_keys][self.target])
-        tmp = pandas.DataFrame(numpy.full(len(ids), numpy.NaN), index=ids)
-        tmp.loc[good_keys] = converted
-        return list(tmp[0])
+        positions = self.index.get_indexer(ids)
+        found = positions >= 0
+        positions = positions[found]
+        targets = numpy.full(len(found), numpy.NaN, dtype=object)
+        targets[found] = self.targets[positions]
+        stage_codes = numpy.full(len(found), -1, dtype=numpy.int8)
+        stage_codes[found] = self.stage_codes[positions]
+        ambiguous = numpy.zeros(len(found), dtype=bool)
+        ambiguous[found] = self.ambiguous[positions]
+        return pandas.DataFrame({
+                self.target: targets,
+                'stage': pandas.Categorical.from_codes(stage_codes, self.stages),
+                'ambiguous': ambiguous},
+                index=ids, columns=[self.target, 'stage', 'ambiguous'])
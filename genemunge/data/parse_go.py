@@ -205,10 +205,63 @@ def parse_group(group, dictionary):
             }
 
 
+def add_annotations(godict, annotationfile):
+    """
+    Add the genes annotated with each GO term to a dictionary made by
+    parse_group.
+
+    Notes:
+        Modifies godict in place!
+        Annotations of obsolete terms, with NOT qualifiers, or with evidence
+        codes that are not listed in parse_group are skipped.
+
+    Args:
+        godict (dict)
+        annotationfile (str): path to a gzipped GO annotation (GAF) file
+
+    Returns:
+        None
+
+    """
+    from genemunge import convert
+    converter = convert.IDConverter('uniprot_ids', 'ensembl_gene_id')
+
+    # collect the annotations
+    uniprot_ids, go_terms, evidence_codes = [], [], []
+    with gzip.open(annotationfile ,'rb') as annotfile:
+        for raw_line in annotfile:
+            line = raw_line.decode('utf-8')
+            if line[0] != '!': # comments
+                parsed = line.strip().split('\t')
+
+                database = parsed[0] # currently, this is always UniProtKB
+                database_id = parsed[1]
+                symbol = parsed[2] # ORF for unnamed
+                qualifier = parsed[3]
+                go_term = parsed[4]
+                database_reference = parsed[5]
+                evidence = parsed[6]
+
+                # what to do about colocalizes_with and contributes_to?
+                # we have filtered out obsolete go terms, so skip them
+                # along with any new evidence codes (e.g., HDA or HTP)
+                if 'NOT' not in qualifier and go_term in godict \
+                    and evidence in godict[go_term]['genes']:
+                    uniprot_ids.append(database_id)
+                    go_terms.append(go_term)
+                    evidence_codes.append(evidence)
+
+    # a uniprot id can be listed for several genes, so keep all of them
+    converted = converter.convert_long(uniprot_ids, policy='all')
+    for i, ensembl in zip(converted.index, converted['ensembl_gene_id']):
+        godict[go_terms[i]]['genes'][evidence_codes[i]] += [ensembl]
+
+
 def make_godict(gofile, force=False):
     """
     Parses the Gene Ontology file and creates a dictionary that is easier
-    to work with. Saves the dictionary as a json file.
+    to work with. Saves the dictionary as a json file, and as a compact
+    binary directory that the Searcher can memory map.
 
     Notes:
 
@@ -253,9 +306,6 @@ def make_godict(gofile, force=False):
         None
 
     """
-    from genemunge import convert
-    converter = convert.IDConverter('uniprot_ids', 'ensembl_gene_id')
-
     # check if the outputfile already exists
     if not force and os.path.exists(OUTPUTFILE):
         return
@@ -293,36 +343,17 @@ def make_godict(gofile, force=False):
                 godict[p]['children'] += [term]
 
     # add the annotations
-    with gzip.open(ANNOTATIONFILE ,'rb') as annotfile:
-        for raw_line in annotfile:
-            line = raw_line.decode('utf-8')
-            if line[0] != '!': # comments
-                parsed = line.strip().split('\t')
-
-                database = parsed[0] # currently, this is always UniProtKB
-                database_id = parsed[1]
-                symbol = parsed[2] # ORF for unnamed
-                qualifier = parsed[3]
-                go_term = parsed[4]
-                database_reference = parsed[5]
-                evidence = parsed[6]
-
-                # what to do about colocalizes_with and contributes_to?
-                if 'NOT' not in qualifier:
-                    try:
-                        ensembl = converter.convert(database_id)
-                        # add the identifier if it is not NaN
-                        if ensembl == ensembl:
-                            godict[go_term]['genes'][evidence] += [ensembl]
-                    except KeyError:
-                        # we have filtered out obsolete go terms
-                        # therefore, we have to catch this exception
-                        pass
+    add_annotations(godict, ANNOTATIONFILE)
 
     # write to the file
     with open(OUTPUTFILE, "w") as outfile:
         json.dump(godict, outfile)
 
+    # write the compact binary format
+    from genemunge import search, resources
+    data = search.GOData.from_dict(godict, resources.file_hash(OUTPUTFILE))
+    data.save(search.GODATANAME)
+
 
 if __name__ == "__main__":
     make_godict(GOFILE, force=True)
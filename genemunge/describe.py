@@ -6,6 +6,7 @@ from matplotlib import pyplot as plt
 
 from . import convert
 from . import search
+from . import resources
 
 
 datapath = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
@@ -26,7 +27,8 @@ class Describer(object):
         get_symbol (callable): an instance of convert.IDConverter.convert
             to get the gene symbol.
         searcher (Searcher): an instance of search.Searcher to get gene info.
-        tissue_stats (dict{str: DataFrame}): per-tissue statistics from GTEx.
+        tissue_stats (dict{str: DataFrame}): per-tissue statistics from GTEx,
+            shared by all Describers in the process.
 
     """
 
@@ -55,9 +57,9 @@ class Describer(object):
         self.searcher = search.Searcher()
         tissue_status_filename = os.path.join(gtexpath, 'tissue_stats.h5')
         if load_tissue_data:
-            self.tissue_stats = {}
-            for k in self.__stats__:
-                self.tissue_stats[k] = pandas.read_hdf(tissue_status_filename, k)
+            self.tissue_stats = dict(resources.get('tissue_stats',
+                    lambda: {k: pandas.read_hdf(tissue_status_filename, k)
+                             for k in self.__stats__}))
         else:
             self.tissue_stats = pandas.HDFStore(tissue_status_filename)
 
@@ -169,13 +171,7 @@ class Describer(object):
             GO identifiers (List[str])
 
         """
-        terms = []
-        for term in self.searcher.go:
-            has_gene = any(ensembl in self.searcher.go[term]["genes"][code]
-                        for code in self.searcher.go[term]["genes"])
-            if has_gene:
-                terms += [term]
-        return list(set(terms))
+        return self.searcher.get_terms_for_genes([ensembl])[ensembl]
 
     def get_gene_info(self, gene_identifier):
         """
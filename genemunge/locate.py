@@ -0,0 +1,226 @@
+import pandas, numpy
+
+from . import convert
+from . import resources
+
+
+CHROMOSOMES = [str(i) for i in range(1, 23)] + ['X', 'Y', 'MT']
+LOCATION = (r'^(?P<chromosome>[0-9]{1,2}|X|Y)'
+            r'(?:(?P<arm>[pq]|cen)(?P<band>[0-9.]*))?'
+            r'(?:-(?P<arm2>[pq]|cen)?(?P<band2>[0-9.]*))?'
+            r'(?:\s.*)?$')
+
+
+def _band_interval(arm, band):
+    """
+    Convert cytobands to intervals on a chromosome.
+
+    Chromosomes are placed on [-1, 1] with the centromere at 0, the p arm
+    at negative and the q arm at positive coordinates. The digits of a band
+    are read as a decimal fraction of the arm, so that sub-bands fall within
+    their band: q13 is [0.13, 0.14) and q13.12 is [0.1312, 0.1313).
+
+    Args:
+        arm (pandas.Series): 'p', 'q', 'cen', or NaN for a whole chromosome
+        band (pandas.Series): the band, e.g. '13.12', or '' for a whole arm
+
+    Returns:
+        start (numpy array)
+        end (numpy array)
+
+    """
+    digits = band.fillna('').str.replace('.', '', regex=False)
+    length = digits.str.len().values
+    value = pandas.to_numeric(digits.where(length > 0, '0')).values.astype(float)
+    scale = 10.0 ** -length
+    low = numpy.where(length > 0, value * scale, 0.0)
+    high = numpy.where(length > 0, (value + 1) * scale, 1.0)
+    arm = arm.values
+    start = numpy.select([arm == 'q', arm == 'p', arm == 'cen'], [low, -high, 0.0], -1.0)
+    end = numpy.select([arm == 'q', arm == 'p', arm == 'cen'], [high, -low, 0.0], 1.0)
+    return start, end
+
+
+def parse_locations(locations):
+    """
+    Parse HGNC chromosomal locations into intervals.
+
+    E.g., '17p13.1', '2q23.2-q26', 'X', 'Xp22.33 and Yp11.2', 'mitochondria'.
+    Each chromosome occupies [4 * c, 4 * c + 2) on a single axis, where c is
+    its position in CHROMOSOMES, so intervals on different chromosomes never
+    overlap. Locations that cannot be placed (e.g., 'reserved' or
+    'not on reference assembly') are dropped.
+
+    Args:
+        locations (List[str])
+
+    Returns:
+        pandas.DataFrame: with columns 'start' and 'end', and one row per
+            interval. The index holds the position of each location.
+
+    """
+    locations = pandas.Series(locations, dtype=object).fillna('')
+    locations = locations.str.split(' and ').explode()
+    locations = locations[~locations.str.contains('not on reference', regex=False)]
+    parts = locations.str.extract(LOCATION)
+    mitochondria = (locations == 'mitochondria').values
+    parts.loc[mitochondria, 'chromosome'] = 'MT'
+    parts = parts[parts['chromosome'].notnull()]
+    start, end = _band_interval(parts['arm'], parts['band'])
+    # a range ends in a second band, on the same arm unless another is given
+    ranged = parts['band2'].notnull() | parts['arm2'].notnull()
+    arm2 = parts['arm2'].where(parts['arm2'].notnull(), parts['arm'])
+    start2, end2 = _band_interval(arm2, parts['band2'])
+    ranged = ranged.values
+    start = numpy.where(ranged, numpy.minimum(start, start2), start)
+    end = numpy.where(ranged, numpy.maximum(end, end2), end)
+    offset = 4 * pandas.Index(CHROMOSOMES).get_indexer(parts['chromosome']) + 1
+    return pandas.DataFrame({'start': offset + start, 'end': offset + end},
+                            index=parts.index)
+
+
+class LocationIndex(object):
+    """
+    A sorted interval index over the chromosomal locations of the genes
+    in the HGNC table.
+
+    Regions are given as HGNC style locations, e.g., '17p13', '1q21-q23',
+    or 'X'. Queries over a batch of regions are answered with a few
+    vectorized searches over the sorted starts of the gene intervals.
+    The intervals are grouped by the order of magnitude of their length
+    (bands, sub-bands, arms, ...), so that the few genes placed on a whole
+    arm or chromosome do not widen the search over all of the others.
+
+    Attributes:
+        buckets (List[tuple]): for each group of intervals, the HGNC rows,
+            the starts (sorted), the ends, and the longest length.
+
+    """
+    def __init__(self):
+        """
+        Create a LocationIndex from the 'location' column of the HGNC table.
+
+        Args:
+            None
+
+        Returns:
+            LocationIndex
+
+        """
+        self.buckets = resources.get('location_index', self._build)
+
+    @staticmethod
+    def _build():
+        """
+        Parse the locations of the genes and sort them within groups
+        of similar length.
+
+        Args:
+            None
+
+        Returns:
+            List[tuple]
+
+        """
+        locations = convert.load_columns(['location'])['location']
+        intervals = parse_locations(locations)
+        start, end = intervals['start'].values, intervals['end'].values
+        length = numpy.maximum(end - start, 1e-12)
+        group = numpy.floor(numpy.log10(length)).astype(int)
+        buckets = []
+        for g in numpy.unique(group):
+            members = numpy.flatnonzero(group == g)
+            members = members[numpy.argsort(start[members], kind='stable')]
+            buckets.append((intervals.index.values[members], start[members],
+                            end[members], float(length[members].max())))
+        return buckets
+
+    def _query(self, regions, identifier, contained):
+        """
+        Find the genes that overlap, or are contained in, some regions.
+
+        Args:
+            regions (List[str]): HGNC style locations
+            identifier (str): the id type of the genes
+            contained (bool): only keep genes within the regions
+
+        Returns:
+            pandas.DataFrame
+
+        """
+        assert identifier in convert.IDConverter.potential_ids, \
+        "unknown id type. known types {}".format(convert.IDConverter.potential_ids)
+        regions = numpy.asarray(regions, dtype=object)
+        queries = parse_locations(regions)
+        q_start, q_end = queries['start'].values, queries['end'].values
+        matched_queries, matched_rows = [], []
+        for rows, start, end, max_length in self.buckets:
+            # every interval that overlaps a region starts in this window
+            first = numpy.searchsorted(start, q_start - max_length, side='left')
+            last = numpy.searchsorted(start, q_end, side='left')
+            counts = numpy.maximum(last - first, 0)
+            offsets = numpy.cumsum(counts) - counts
+            candidates = numpy.repeat(first - offsets, counts) + numpy.arange(counts.sum())
+            query = numpy.repeat(numpy.arange(len(queries)), counts)
+            if contained:
+                keep = (start[candidates] >= q_start[query]) & (end[candidates] <= q_end[query])
+            else:
+                keep = (start[candidates] < q_end[query]) & (end[candidates] > q_start[query])
+            matched_queries.append(query[keep])
+            matched_rows.append(rows[candidates[keep]])
+        # sort by (region, row) and list genes with several intervals,
+        # e.g. on X and Y, once
+        num_rows = numpy.int64(len(self._genes(identifier)))
+        key = numpy.unique(queries.index.values[numpy.concatenate(matched_queries)]
+                           * num_rows + numpy.concatenate(matched_rows))
+        positions, rows = key // num_rows, key % num_rows
+        genes = self._genes(identifier).take(rows)
+        found = genes != ''
+        return pandas.DataFrame({'region': regions[positions[found]], identifier: genes[found]},
+                                index=positions[found], columns=['region', identifier])
+
+    def _genes(self, identifier):
+        """
+        Get the ids of the genes in each row of the HGNC table.
+
+        Args:
+            identifier (str): the id type of the genes
+
+        Returns:
+            numpy array: the ids, with '' for missing ids
+
+        """
+        return resources.get(('location_genes', identifier),
+                lambda: convert.load_columns([identifier])[identifier])
+
+    def overlap(self, regions, identifier='symbol'):
+        """
+        Find the genes that overlap some regions.
+
+        Args:
+            regions (List[str]): HGNC style locations, e.g. '17p13' or '1q21-q23'
+            identifier (optional; str): the id type of the genes
+
+        Returns:
+            pandas.DataFrame: with one row per (region, gene) pair and columns
+                'region' and identifier. The index holds the position of
+                each region in regions.
+
+        """
+        return self._query(regions, identifier, contained=False)
+
+    def within(self, regions, identifier='symbol'):
+        """
+        Find the genes that lie entirely within some regions.
+
+        Args:
+            regions (List[str]): HGNC style locations, e.g. '17p13' or '1q21-q23'
+            identifier (optional; str): the id type of the genes
+
+        Returns:
+            pandas.DataFrame: with one row per (region, gene) pair and columns
+                'region' and identifier. The index holds the position of
+                each region in regions.
+
+        """
+        return self._query(regions, identifier, contained=True)
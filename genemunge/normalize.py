@@ -3,11 +3,35 @@ import pandas
 import numpy
 import pickle
 import warnings
+import tracemalloc
+from collections import namedtuple, OrderedDict
 from pathlib import Path
 from cytoolz import partial
+from scipy import sparse
 
 from . import convert
 from . import describe
+from . import resources
+from . import stream
+
+# the number of rows that are copied or masked at once
+ROW_BLOCK = 256
+# the number of column alignment plans kept by each Normalizer
+PLAN_CACHE_SIZE = 64
+# the number of labels sampled from an index to key the plan cache
+INDEX_KEY_SAMPLES = 64
+
+# how to align data with some columns to the common genes:
+#   genes: the common genes, with any reference genes last
+#   positions: the column of data for each gene, or -1 if it is missing
+#   missing: positions < 0
+#   lengths: the bp length of each gene
+#   num_kept: the number of genes that are not references
+#   references: the positions of the reference genes in genes
+AlignmentPlan = namedtuple('AlignmentPlan', ['genes', 'positions', 'missing', 'lengths',
+                                             'num_kept', 'references'])
+
+_index_keys = resources.IdentityCache(PLAN_CACHE_SIZE)
 
 def do_nothing(data):
     """
@@ -23,9 +47,83 @@ def do_nothing(data):
     return data
 
 
+def is_sparse(data):
+    """
+    Check if a DataFrame holds pandas sparse columns, e.g., from
+    pandas.DataFrame.sparse.from_spmatrix.
+
+    Args:
+        data (pandas.DataFrame)
+
+    Returns:
+        bool
+
+    """
+    return data.shape[1] > 0 and all(isinstance(dtype, pandas.SparseDtype)
+                                     for dtype in data.dtypes)
+
+
+def _to_csr(data):
+    """
+    Get the values of a sparse DataFrame as a CSR matrix, with any
+    missing values set to zero.
+
+    Args:
+        data (pandas.DataFrame ~ (num_samples, num_genes)): sparse data
+
+    Returns:
+        scipy.sparse.csr_matrix ~ (num_samples, num_genes)
+
+    """
+    matrix = data.sparse.to_coo().tocsr()
+    if matrix.dtype.kind == 'f':
+        matrix.data[numpy.isnan(matrix.data)] = 0
+        matrix.eliminate_zeros()
+    return matrix
+
+
+def _from_csr(matrix, index, columns):
+    """
+    Wrap a CSR matrix in a sparse DataFrame.
+
+    Args:
+        matrix (scipy.sparse.csr_matrix ~ (num_samples, num_genes))
+        index (pandas.Index ~ (num_samples,))
+        columns (pandas.Index ~ (num_genes,))
+
+    Returns:
+        pandas.DataFrame ~ (num_samples, num_genes): sparse data
+
+    """
+    return pandas.DataFrame.sparse.from_spmatrix(matrix, index=index, columns=columns)
+
+
+def _select_columns(matrix, sources, targets, num_columns):
+    """
+    Move columns of a sparse matrix to new positions with a sparse
+    product. Columns that are moved to the same place are added, and
+    columns that are not moved are dropped.
+
+    Args:
+        matrix (scipy.sparse.csr_matrix ~ (num_rows, num_columns_in))
+        sources (numpy array): the columns to move
+        targets (numpy array): the new position of each source column
+        num_columns (int): the number of columns of the result
+
+    Returns:
+        scipy.sparse.csr_matrix ~ (num_rows, num_columns)
+
+    """
+    selector = sparse.csr_matrix((numpy.ones(len(sources), dtype=matrix.dtype),
+                                  (sources, targets)),
+                                 shape=(matrix.shape[1], num_columns))
+    return (matrix @ selector).tocsr()
+
+
 def deduplicate(data):
     """
-    Adds the values from any duplicated genes.
+    Adds the values from any duplicated genes, and drops any genes with
+    missing ids. Sparse data stays sparse.
 
     Args:
         data (pandas.DataFrame ~ (num_samples, num_genes))
@@ -34,10 +132,19 @@ def deduplicate(data):
         pandas.DataFrame
 
     """
-    return data.groupby(data.columns, axis=1).sum()
-
-
-def impute(data, scale=0.5):
+    if is_sparse(data):
+        codes, labels = pandas.factorize(numpy.asarray(data.columns, dtype=object), sort=True)
+        # columns with missing labels are dropped
+        labeled = numpy.flatnonzero(codes >= 0)
+        matrix = _select_columns(_to_csr(data), labeled, codes[labeled], len(labels))
+        return _from_csr(matrix, data.index,
+                         pandas.Index(labels, dtype=object, name=data.columns.name))
+    values, labels = convert.aggregate_columns(data.values, data.columns, 'sum', sort=True)
+    return pandas.DataFrame(values, index=data.index,
+                            columns=labels.rename(data.columns.name))
+
+
+def impute(data, scale=0.5, inplace=False):
     """
     Replace any zeros in each row with a fraction of the smallest non-zero
     value in the corresponding row.
@@ -45,52 +152,244 @@ def impute(data, scale=0.5):
     Args:
         data (pandas.DataFrame ~ (num_samples, num_genes))
         scale (optional; float)
+        inplace (optional; bool): modify the values of data, which must
+            have a single float dtype, instead of allocating a copy.
+            E.g., pass partial(impute, inplace=True) as the imputer of
+            a Normalizer transform.
 
     Returns:
         imputed data (pandas.DataFrame ~ (num_samples, num_genes))
 
     """
+    if inplace:
+        values = data.values
+        assert values.dtype.kind == 'f' and numpy.shares_memory(values, data.iloc[:, 0].values), \
+        "inplace imputation needs data with a single float dtype"
+        _impute_values(values, scale)
+        return data
     v = scale * data[data > 0].min(axis=1)
     data_fill = data.fillna(0)
     return data_fill + (data_fill == 0).multiply(v, axis=0)
 
 
+def _impute_values(values, scale=0.5):
+    """
+    Replace any zeros or NaN in each row of an array, in place, with a
+    fraction of the smallest positive value in the corresponding row.
+
+    Args:
+        values (numpy array ~ (num_samples, num_genes))
+        scale (optional; float)
+
+    Returns:
+        None
+
+    """
+    # work in blocks of rows to keep the masks small
+    for start in range(0, len(values), ROW_BLOCK):
+        block = values[start:start+ROW_BLOCK]
+        v = numpy.min(block, axis=1, initial=numpy.inf, where=block > 0)
+        v[numpy.isinf(v)] = numpy.nan
+        v *= scale
+        missing = block == 0
+        missing |= numpy.isnan(block)
+        numpy.copyto(block, v[:, None], where=missing)
+
+
+def _scale_rows(values, total=10**6):
+    """
+    Scale each row of an array, in place, to add up to a total.
+
+    Args:
+        values (numpy array ~ (num_samples, num_genes))
+        total (optional; float)
+
+    Returns:
+        None
+
+    """
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        scale = values.sum(axis=1)
+        numpy.divide(values.dtype.type(total), scale, out=scale)
+        numpy.multiply(values, scale[:, None], out=values)
+
+
+def _index_key(index):
+    """
+    Get a cheap key for the values of an index: its length and a sample of
+    its labels. Different indexes can have the same key, so a match has to
+    be confirmed with _same_index.
+
+    Args:
+        index (pandas.Index)
+
+    Returns:
+        tuple
+
+    """
+    def compute():
+        step = max(1, len(index) // INDEX_KEY_SAMPLES)
+        return (len(index), tuple(index[::step].tolist()), tuple(index[-1:].tolist()))
+    return _index_keys.get(index, compute)
+
+
+def _same_index(first, second):
+    """
+    Check if two indexes have the same labels in the same order.
+
+    Args:
+        first (pandas.Index)
+        second (pandas.Index)
+
+    Returns:
+        bool
+
+    """
+    if first is second or first.values is second.values:
+        return True
+    # faster than Index.equals for object labels; NaN labels never match,
+    # which only costs a new plan
+    return first.dtype == second.dtype and \
+        numpy.array_equal(numpy.asarray(first), numpy.asarray(second))
+
+
+def allocated_bytes(func, *args, **kwargs):
+    """
+    Measure the peak memory allocated by a call to a function.
+
+    Numpy reports its buffers to tracemalloc, so this includes the
+    arrays behind any DataFrames created during the call.
+
+    Args:
+        func (callable)
+        args: passed to func
+        kwargs: passed to func
+
+    Returns:
+        result: the result of func(*args, **kwargs)
+        int: the peak number of bytes allocated during the call
+
+    """
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    elif hasattr(tracemalloc, 'reset_peak'):
+        tracemalloc.reset_peak()
+    baseline = tracemalloc.get_traced_memory()[0]
+    try:
+        result = func(*args, **kwargs)
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        if not tracing:
+            tracemalloc.stop()
+    return result, peak
+
+
+def _load_gene_lengths():
+    """
+    Read the lengths of the genes in GTEx.
+
+    Args:
+        None
+
+    Returns:
+        pandas.Series: bp lengths indexed by ensembl gene id, without versions
+
+    """
+    p = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'gtex')
+    gene_info = pandas.read_csv(os.path.join(p, 'gene_info.csv'), sep='\t',
+                                usecols=['gene_id', 'bp_length'])
+    gene_lengths = pandas.Series(gene_info['bp_length'].values, name='bp_length',
+                                 index=convert.clean_ensembl_ids(gene_info['gene_id'].values))
+    return gene_lengths[~gene_lengths.index.duplicated(keep='first')]
+
+
 class Normalizer(object):
     """
     Tools to change units of expression data, primarily to convert to TPM.
 
     Attributes:
         gene_lengths (DataFrame): bp lengths for genes.
+        identifier (str): the id type of the genes.
+        universe (convert.GeneUniverse): the genes in HGNC, for selecting
+            genes by category with masks. Loaded the first time it is used.
+        row_transforms (List[str]): a class attribute specifying the
+            transforms that act on each sample independently, which can
+            be applied to files with transform_file.
+        plan_cache_size (int): the number of column alignment plans to keep.
 
     """
-    def __init__(self, identifier='symbol'):
+    row_transforms = ['reindex', 'tpm_from_rpkm', 'tpm_from_counts',
+                      'tpm_from_subset', 'clr_from_tpm', 'tpm_from_clr',
+                      'alr_from_tpm', 'ordinalize']
+
+    def __init__(self, identifier='symbol', plan_cache_size=PLAN_CACHE_SIZE):
         """
         Tools to normalize expression data and transform into TPM.
 
+        The alignment of the columns of some data to the genes of a
+        transform is computed once for each set of columns and gene_list,
+        and kept in an LRU cache, so that repeated calls with frames
+        that have the same columns only copy the values.
+
         Args:
             identifier (str)
+            plan_cache_size (optional; int): the number of alignment plans
+                to keep, or 0 to compute them on every call
 
         Returns:
             Normalizer
 
         """
-        # read the gene lengths
-        p = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'gtex')
-        gene_info = pandas.read_csv(os.path.join(p, 'gene_info.csv'), sep='\t')
-        gene_info.set_index('gene_id', inplace=True)
-        self.gene_lengths = gene_info['bp_length']
-        # clean the ensemble gene ids
-        self.gene_lengths.index = convert.clean_ensembl_ids(self.gene_lengths.index)
-        self.gene_lengths = self.gene_lengths[~self.gene_lengths.index.duplicated(keep='first')]
+        # read the gene lengths by cleaned ensembl gene id
+        # they are shared, so they must not be modified in place
+        self.gene_lengths = resources.get('gene_lengths', _load_gene_lengths)
         # convert the gene ids
         self.converter = None
         if identifier is not 'ensembl_gene_id':
             self.converter = convert.IDConverter('ensembl_gene_id', identifier)
-            self.gene_lengths.index = self.converter.convert_list(list(self.gene_lengths.index))
+            self.gene_lengths = self.gene_lengths.set_axis(
+                    self.converter.convert_list(self.gene_lengths.index), axis=0)
         self.describer = describe.Describer(identifier)
         # drop any NaN and duplicate ids
         self.gene_lengths = self.gene_lengths[~self.gene_lengths.index.isnull()]
         self.gene_lengths = self.gene_lengths[~self.gene_lengths.index.duplicated(keep='first')]
+        self.identifier = identifier
+        self._universe = None
+        self._universe_alignment = None
+        self.plan_cache_size = plan_cache_size
+        self._plans = OrderedDict()
+
+    @property
+    def universe(self):
+        """
+        The genes in HGNC, loaded the first time they are used.
+
+        Returns:
+            convert.GeneUniverse
+
+        """
+        if self._universe is None:
+            self._universe = convert.GeneUniverse(self.identifier)
+        return self._universe
+
+    def _align_universe(self):
+        """
+        Get the genes with lengths that are in the universe, and their
+        positions in it, computing them the first time they are needed.
+
+        Returns:
+            in_universe (numpy array ~ (num_genes,)): boolean mask over
+                self.gene_lengths
+            positions (numpy array): the position in the universe of each
+                gene in the mask
+
+        """
+        if self._universe_alignment is None:
+            positions = self.universe.align(self.gene_lengths.index)
+            in_universe = positions >= 0
+            self._universe_alignment = (in_universe, positions[in_universe])
+        return self._universe_alignment
 
     def _get_common_genes(self, gene_list):
         """
@@ -98,7 +397,9 @@ class Normalizer(object):
         have gene lengths.
 
         Args:
-            gene_list (List[str])
+            gene_list (List[str] or numpy array): a list of gene ids, or a
+                boolean mask over the genes of self.universe. The genes
+                in a mask are returned in the order of the GTEx genes.
 
         Returns:
             common_genes (List[str])
@@ -107,33 +408,259 @@ class Normalizer(object):
         if gene_list is None:
             # reindex to all of the gtex genes
             return list(self.gene_lengths.index)
+        if isinstance(gene_list, numpy.ndarray) and gene_list.dtype == bool:
+            assert len(gene_list) == len(self.universe), \
+            "the mask must be over the genes of the universe"
+            in_universe, positions = self._align_universe()
+            genes = self.gene_lengths.index[in_universe]
+            return list(genes[gene_list.take(positions)])
         # select the genes in the gene_list that also occur in gtex
-        common_genes = [gene for gene in gene_list if gene in self.gene_lengths.index]
+        gene_list = pandas.Index(gene_list, dtype=object)
+        found = self.gene_lengths.index.get_indexer(gene_list) >= 0
         # warn the user about any genes that are not in gtex and are being dropped
-        missing_genes = list(set(gene_list) - set(common_genes))
+        missing_genes = list(gene_list[~found].unique())
         if len(missing_genes) > 0:
             warnings.warn("Could not find identifiers: {}".format(missing_genes))
-        return common_genes
+        return list(gene_list[found])
 
-    def reindex(self, data, gene_list=None):
+    def _plan(self, columns, gene_list=None, reference_genes=None):
         """
-        Reindexes the dataframe so that it has the same genes as the gtex
-        dataset from recount.
+        Get the plan to align data with some columns to the common genes,
+        computing it only if it is not in the cache.
+
+        Args:
+            columns (pandas.Index): the columns of the data
+            gene_list (List[str] or numpy array): a list of gene ids, or a
+                boolean mask over the genes of self.universe
+            reference_genes (optional; List[str]): genes to place last,
+                e.g., for the ALR transform
+
+        Returns:
+            AlignmentPlan
+
+        """
+        gene_index = gene_list if isinstance(gene_list, pandas.Index) else None
+        if isinstance(gene_list, numpy.ndarray) and gene_list.dtype == bool:
+            gene_key = ('mask', gene_list.tobytes())
+        elif gene_index is not None:
+            gene_key = ('index',) + _index_key(gene_index)
+        else:
+            gene_key = None if gene_list is None else tuple(gene_list)
+        key = (_index_key(columns), gene_key,
+               None if reference_genes is None else tuple(reference_genes))
+        entry = self._plans.get(key)
+        if entry is not None and _same_index(entry[0], columns) and \
+                (gene_index is None or _same_index(entry[1], gene_index)):
+            self._plans.move_to_end(key)
+            return entry[2]
+        plan = self._make_plan(columns, gene_list, reference_genes)
+        if self.plan_cache_size > 0:
+            self._plans[key] = (columns, gene_index, plan)
+            while len(self._plans) > self.plan_cache_size:
+                self._plans.popitem(last=False)
+        return plan
+
+    def _make_plan(self, columns, gene_list=None, reference_genes=None):
+        """
+        Compute the plan to align data with some columns to the common genes.
+
+        Args:
+            columns (pandas.Index): the columns of the data
+            gene_list (List[str] or numpy array): a list of gene ids, or a
+                boolean mask over the genes of self.universe
+            reference_genes (optional; List[str]): genes to place last
+
+        Returns:
+            AlignmentPlan
+
+        """
+        genes = pandas.Index(self._get_common_genes(gene_list), dtype=object)
+        num_kept = len(genes)
+        if reference_genes is not None:
+            # sets make the membership tests O(1)
+            common = set(genes)
+            references = [gene for gene in reference_genes if gene in common]
+            excluded = set(references)
+            kept = [gene for gene in genes if gene not in excluded]
+            genes = pandas.Index(kept + references, dtype=object)
+            num_kept = len(kept)
+        positions = columns.get_indexer(genes)
+        lengths = self.gene_lengths.values.take(
+                self.gene_lengths.index.get_indexer(genes)).astype(float)
+        return AlignmentPlan(genes, positions, positions < 0, lengths,
+                             num_kept, numpy.arange(num_kept, len(genes)))
+
+    def _reindex_into(self, data, plan, out=None, inplace=False):
+        """
+        Copy the data for the common genes into a single float buffer,
+        with zeros for genes that are missing from the data.
+
+        The buffer is float32 for float32 (or smaller) data and float64
+        otherwise. It is allocated unless given as out, or unless inplace,
+        in which case the buffer of data itself is used.
 
         Args:
             data (pandas.DataFrame ~ (num_samples, num_genes)): any expression data
-            gene_list (List[str]): a list of gene ids
+            plan (AlignmentPlan): from _plan
+            out (optional; numpy array ~ (num_samples, num_common_genes))
+            inplace (optional; bool): data must already have the common genes
+                as columns and a single float dtype
+
+        Returns:
+            values (numpy array ~ (num_samples, num_common_genes))
+
+        """
+        common_genes = plan.genes
+        if is_sparse(data):
+            assert not inplace, "sparse data cannot be transformed inplace"
+            matrix = self._reindex_sparse(data, plan)
+            if out is None:
+                out = numpy.empty(matrix.shape, dtype=matrix.dtype)
+            assert out.shape == matrix.shape, "out must have shape {}".format(matrix.shape)
+            # densify blocks of rows
+            for start in range(0, len(out), ROW_BLOCK):
+                out[start:start+ROW_BLOCK] = matrix[start:start+ROW_BLOCK].toarray()
+            return out
+        values = data.values
+        if inplace:
+            assert out is None, "cannot use both out and inplace"
+            assert data.columns.equals(common_genes), \
+            "inplace transforms need data with the common genes as columns"
+            assert values.dtype.kind == 'f' and numpy.shares_memory(values, data.iloc[:, 0].values), \
+            "inplace transforms need data with a single float dtype"
+            out = values
+        elif out is None:
+            out = numpy.empty((len(data), len(common_genes)),
+                              dtype=numpy.result_type(values.dtype, numpy.float32))
+        else:
+            assert out.shape == (len(data), len(common_genes)), \
+            "out must have shape {}".format((len(data), len(common_genes)))
+            assert out.dtype.kind == 'f', "out must have a float dtype"
+        if out is not values:
+            # copy blocks of rows, so that only a block is ever cast or
+            # made contiguous (the values of a DataFrame are often in
+            # column major order)
+            for start in range(0, len(out), ROW_BLOCK):
+                out[start:start+ROW_BLOCK] = values[start:start+ROW_BLOCK].take(
+                        plan.positions, axis=1, mode='clip')
+            if plan.missing.any():
+                out[:, plan.missing] = 0
+        for start in range(0, len(out), ROW_BLOCK):
+            block = out[start:start+ROW_BLOCK]
+            numpy.copyto(block, 0, where=numpy.isnan(block))
+        return out
+
+    def _reindex_sparse(self, data, plan):
+        """
+        Reindex sparse data to the common genes, keeping it sparse.
+
+        Args:
+            data (pandas.DataFrame ~ (num_samples, num_genes)): sparse data
+            plan (AlignmentPlan): from _plan
+
+        Returns:
+            scipy.sparse.csr_matrix ~ (num_samples, num_common_genes): a
+                float32 matrix for float32 (or smaller) data, and float64
+                otherwise
+
+        """
+        matrix = _to_csr(data)
+        matrix = matrix.astype(numpy.result_type(matrix.dtype, numpy.float32), copy=False)
+        found = numpy.flatnonzero(~plan.missing)
+        return _select_columns(matrix, plan.positions[found], found, len(plan.genes))
+
+    def _tpm_sparse(self, data, plan, lengths):
+        """
+        Compute TPM from sparse data without densifying it.
+
+        Args:
+            data (pandas.DataFrame ~ (num_samples, num_genes)): sparse data
+            plan (AlignmentPlan): from _plan
+            lengths (bool): whether to divide by the gene lengths
+
+        Returns:
+            pandas.DataFrame ~ (num_samples, num_common_genes): sparse data
+
+        """
+        matrix = self._reindex_sparse(data, plan)
+        if lengths:
+            matrix.data /= plan.lengths.astype(matrix.dtype).take(matrix.indices)
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            scale = numpy.asarray(matrix.sum(axis=1)).ravel()
+            numpy.divide(matrix.dtype.type(10**6), scale, out=scale)
+        matrix.data *= numpy.repeat(scale, numpy.diff(matrix.indptr))
+        return _from_csr(matrix, data.index, plan.genes)
+
+    def _frame(self, data, genes, values, inplace):
+        """
+        Wrap transformed values in a DataFrame without copying them.
+
+        Args:
+            data (pandas.DataFrame ~ (num_samples, num_genes)): the input data
+            genes (pandas.Index ~ (num_common_genes,))
+            values (numpy array ~ (num_samples, num_common_genes))
+            inplace (bool): return data itself, which holds the values
 
         Returns:
             pandas.DataFrame ~ (num_samples, num_common_genes)
 
         """
-        common_genes = self._get_common_genes(gene_list)
-        common = data.reindex(columns=common_genes)
-        common.fillna(0, inplace=True)
-        return common
+        if inplace:
+            return data
+        return pandas.DataFrame(values, index=data.index, columns=genes, copy=False)
 
-    def tpm_from_rpkm(self, data, gene_list=None, imputer=do_nothing):
+    def _tpm_into(self, data, plan, imputer, out, inplace, lengths):
+        """
+        Compute TPM in a single buffer. See tpm_from_counts.
+
+        Args:
+            data (pandas.DataFrame ~ (num_samples, num_genes))
+            plan (AlignmentPlan): from _plan
+            imputer (callable)
+            out (numpy array ~ (num_samples, num_common_genes) or None)
+            inplace (bool)
+            lengths (bool): whether to divide by the gene lengths
+
+        Returns:
+            values (numpy array ~ (num_samples, num_common_genes))
+
+        """
+        values = self._reindex_into(data, plan, out, inplace)
+        if imputer is not do_nothing:
+            frame = pandas.DataFrame(values, index=data.index, columns=plan.genes, copy=False)
+            imputed = imputer(frame)
+            if imputed is not frame:
+                numpy.copyto(values, imputed.values)
+        if lengths:
+            numpy.divide(values, plan.lengths.astype(values.dtype, copy=False), out=values)
+        _scale_rows(values)
+        return values
+
+    def reindex(self, data, gene_list=None, out=None):
+        """
+        Reindexes the dataframe so that it has the same genes as the gtex
+        dataset from recount. Sparse data (see is_sparse) stays sparse.
+
+        Args:
+            data (pandas.DataFrame ~ (num_samples, num_genes)): any expression data
+            gene_list (List[str] or numpy array): a list of gene ids, or a
+                boolean mask over the genes of self.universe
+            out (optional; numpy array ~ (num_samples, num_common_genes)):
+                a float buffer to hold the result
+
+        Returns:
+            pandas.DataFrame ~ (num_samples, num_common_genes)
+
+        """
+        plan = self._plan(data.columns, gene_list)
+        if is_sparse(data):
+            assert out is None, "sparse data is reindexed into a sparse result"
+            return _from_csr(self._reindex_sparse(data, plan), data.index, plan.genes)
+        values = self._reindex_into(data, plan, out)
+        return self._frame(data, plan.genes, values, False)
+
+    def tpm_from_rpkm(self, data, gene_list=None, imputer=do_nothing,
+                       out=None, inplace=False):
         """
         Transform data from RPKM to TPM.
         Unless a gene list is specified, genes are reindex to GTEx:
@@ -141,19 +668,33 @@ class Normalizer(object):
             - Any genes not present in GTEx are dropped.
         Takes an optional imputation method applied after reindexing.
 
+        The result is computed in a single buffer, in float32 for float32
+        data. The buffer can be given as out, or with inplace=True the data
+        itself is overwritten, in which case data must already have the
+        genes as columns and a single float dtype.
+        Sparse data (see is_sparse) gives a sparse result, unless there is an
+        imputer or an out buffer.
+
         Args:
             data (pandas.DataFrame ~ (num_samples, num_genes)): RPKM data
             gene_list (optional; List[str]): a list of gene ids
             imputer (optional; callable)
+            out (optional; numpy array ~ (num_samples, num_common_genes))
+            inplace (optional; bool)
 
         Returns:
             pandas.DataFrame
 
         """
-        subset = imputer(self.reindex(data, gene_list))
-        return 10**6 * subset.divide(subset.sum(axis=1), axis='index')
-
-    def tpm_from_counts(self, data, gene_list=None, imputer=do_nothing):
+        plan = self._plan(data.columns, gene_list)
+        if is_sparse(data) and imputer is do_nothing and out is None:
+            assert not inplace, "sparse data cannot be transformed inplace"
+            return self._tpm_sparse(data, plan, lengths=False)
+        values = self._tpm_into(data, plan, imputer, out, inplace, lengths=False)
+        return self._frame(data, plan.genes, values, inplace)
+
+    def tpm_from_counts(self, data, gene_list=None, imputer=do_nothing,
+                         out=None, inplace=False):
         """
         Transform data from counts to TPM.
         Unless a gene list is specified, genes are reindex to GTEx:
@@ -161,20 +702,33 @@ class Normalizer(object):
             - Any genes not present in GTEx are dropped.
         Takes an optional imputation method applied after reindexing.
 
+        The result is computed in a single buffer, in float32 for float32
+        data. The buffer can be given as out, or with inplace=True the data
+        itself is overwritten, in which case data must already have the
+        genes as columns and a single float dtype.
+        Sparse data (see is_sparse) gives a sparse result, unless there is an
+        imputer or an out buffer.
+
         Args:
             data (pandas.DataFrame ~ (num_samples, num_genes)): count data
             gene_list (optional; List[str]): a list of gene ids
             imputer (optional; callable)
+            out (optional; numpy array ~ (num_samples, num_common_genes))
+            inplace (optional; bool)
 
         Returns:
             pandas.DataFrame
 
         """
-        subset = imputer(self.reindex(data, gene_list))
-        normed = subset.divide(self.gene_lengths[subset.columns], axis='columns')
-        return 10**6 * normed.divide(normed.sum(axis=1), axis='rows')
-
-    def tpm_from_subset(self, data, gene_list=None, imputer=do_nothing):
+        plan = self._plan(data.columns, gene_list)
+        if is_sparse(data) and imputer is do_nothing and out is None:
+            assert not inplace, "sparse data cannot be transformed inplace"
+            return self._tpm_sparse(data, plan, lengths=True)
+        values = self._tpm_into(data, plan, imputer, out, inplace, lengths=True)
+        return self._frame(data, plan.genes, values, inplace)
+
+    def tpm_from_subset(self, data, gene_list=None, imputer=do_nothing,
+                         out=None, inplace=False):
         """
         Renormalize a subset of genes already in TPM.
         Unless a gene list is specified, genes are reindex to GTEx:
@@ -182,18 +736,28 @@ class Normalizer(object):
             - Any genes not present in GTEx are dropped.
         Takes an optional imputation method applied after reindexing.
 
+        The result is computed in a single buffer, in float32 for float32
+        data. The buffer can be given as out, or with inplace=True the data
+        itself is overwritten, in which case data must already have the
+        genes as columns and a single float dtype.
+        Sparse data (see is_sparse) gives a sparse result, unless there is an
+        imputer or an out buffer.
+
         Args:
             data (pandas.DataFrame ~ (num_samples, num_genes)): TPM data
             gene_list (optional; List[str]): a list of gene ids
             imputer (optional; callable)
+            out (optional; numpy array ~ (num_samples, num_common_genes))
+            inplace (optional; bool)
 
         Returns:
             pandas.DataFrame
 
         """
-        return self.tpm_from_rpkm(data, gene_list, imputer)
+        return self.tpm_from_rpkm(data, gene_list, imputer, out, inplace)
 
-    def clr_from_tpm(self, data, gene_list=None, imputer=do_nothing):
+    def clr_from_tpm(self, data, gene_list=None, imputer=do_nothing,
+                      out=None, inplace=False):
         """
         Compute the centered log ratio transform of data in TPM format.
         Unless a gene list is specified, genes are reindex to GTEx:
@@ -201,18 +765,28 @@ class Normalizer(object):
             - Any genes not present in GTEx are dropped.
         Takes an optional imputation method applied after reindexing.
 
+        The result is computed in a single buffer, in float32 for float32
+        data. The buffer can be given as out, or with inplace=True the data
+        itself is overwritten, in which case data must already have the
+        genes as columns and a single float dtype.
+        Sparse data is densified into the result one block of rows at a time.
+
         Args:
             data (pandas.DataFrame ~ (num_samples, num_genes)): TPM data
             gene_list (optional; List[str]): a list of gene ids
             imputer (optional; callable)
+            out (optional; numpy array ~ (num_samples, num_common_genes))
+            inplace (optional; bool)
 
         Returns:
             pandas.DataFrame ~ (num_samples, num_genes)
 
         """
-        imputed = self.tpm_from_subset(data, gene_list, imputer)
-        log_transformed = numpy.log(imputed)
-        return log_transformed.subtract(log_transformed.mean(axis=1), axis=0)
+        plan = self._plan(data.columns, gene_list)
+        values = self._tpm_into(data, plan, imputer, out, inplace, lengths=False)
+        numpy.log(values, out=values)
+        values -= values.mean(axis=1, keepdims=True)
+        return self._frame(data, plan.genes, values, inplace)
 
     def tpm_from_clr(self, data, gene_list=None):
         """
@@ -249,13 +823,14 @@ class Normalizer(object):
             pandas.DataFrame ~ (num_samples, num_genes - num_reference_genes)
 
         """
-        common_genes = self._get_common_genes(gene_list)
-        common_references = [gene for gene in reference_genes if gene in common_genes]
-        genes_to_keep = [gene for gene in common_genes if gene not in common_references]
-        imputed = self.tpm_from_subset(data, genes_to_keep + common_references, imputer)
-        log_transformed = numpy.log(imputed)
-        refs = log_transformed[common_references].mean(axis=1)
-        return log_transformed[genes_to_keep].subtract(refs, axis=0)
+        plan = self._plan(data.columns, gene_list, reference_genes)
+        values = self._tpm_into(data, plan, imputer, None, False, lengths=False)
+        numpy.log(values, out=values)
+        refs = values[:, plan.references].mean(axis=1, keepdims=True)
+        kept = values[:, :plan.num_kept]
+        kept -= refs
+        return pandas.DataFrame(kept, index=data.index, columns=plan.genes[:plan.num_kept],
+                                copy=False)
 
     def z_score_from_clr(self, data, tissues, gene_list=None):
         """
@@ -270,6 +845,28 @@ class Normalizer(object):
         Returns:
             pandas.DataFrame ~ (num_samples, num_genes - num_reference_genes)
 
+        """
+        if gene_list is None:
+            gene_list = data.columns
+        mean_clr, std_clr = self._clr_stats(gene_list)
+
+        mean_expression = mean_clr[tissues].transpose().set_index(tissues.index)
+        std_expression = std_clr[tissues].transpose().set_index(tissues.index)
+        data_subset = self.reindex(data, gene_list)
+        return (data_subset - mean_expression)/std_expression
+
+    def _clr_stats(self, gene_list):
+        """
+        Get the mean and standard deviation of the clr'd tpm data of some
+        genes in each tissue in GTEx.
+
+        Args:
+            gene_list (List[str]): a list of gene ids
+
+        Returns:
+            mean_clr (pandas.DataFrame ~ (num_genes, num_tissues))
+            std_clr (pandas.DataFrame ~ (num_genes, num_tissues))
+
         """
         # get the clr tissue stats from GTEx
         mean_clr = self.describer.tissue_stats['mean_clr']
@@ -277,24 +874,54 @@ class Normalizer(object):
 
         # convert gene IDs from Ensembl to the identifier, if needed
         # duplicates are dropped!
+        # the tissue stats are shared, so they must not be modified in place
         if self.converter is not None:
-            mean_clr.index = self.converter.convert_list(mean_clr.index)
+            mean_clr = mean_clr.set_axis(self.converter.convert_list(mean_clr.index), axis=0)
             mean_clr = mean_clr[mean_clr.index.notnull()]
             mean_clr = mean_clr[~mean_clr.index.duplicated(keep='first')]
-            std_clr.index = self.converter.convert_list(std_clr.index)
+            std_clr = std_clr.set_axis(self.converter.convert_list(std_clr.index), axis=0)
             std_clr = std_clr[std_clr.index.notnull()]
             std_clr = std_clr[~std_clr.index.duplicated(keep='first')]
 
-        if gene_list is None:
-            gene_list = data.columns
+        return mean_clr.reindex(gene_list), std_clr.reindex(gene_list)
 
-        mean_clr = mean_clr.reindex(gene_list)
-        std_clr = std_clr.reindex(gene_list)
+    def transform_file(self, transform, infile, outfile, chunksize=1000,
+                       key='data', progress=None, **kwargs):
+        """
+        Apply a transform to a file of expression data that may not fit in
+        memory, and write the result to another file.
 
-        mean_expression = mean_clr[tissues].transpose().set_index(tissues.index)
-        std_expression = std_clr[tissues].transpose().set_index(tissues.index)
-        data_subset = self.reindex(data, gene_list)
-        return (data_subset - mean_expression)/std_expression
+        The transforms in row_transforms act on each sample independently,
+        so the samples are read, transformed, and written in blocks of rows.
+        Only one block is in memory at a time.
+
+        Args:
+            transform (str): the name of a method in row_transforms,
+                e.g. 'tpm_from_counts'
+            infile (str): a .csv, .tsv, .h5, or .parquet file
+                ~ (num_samples, num_genes) with the sample ids as the index
+            outfile (str): a .csv, .tsv, .h5, or .parquet file
+            chunksize (optional; int): the number of samples in each block
+            key (optional; str): the node of the data in HDF5 files
+            progress (optional; callable): called after each block as
+                progress(num_samples_done, num_samples), where num_samples
+                is None if it is not known in advance (e.g., for CSV)
+            kwargs: passed to the transform, e.g., gene_list or imputer
+
+        Returns:
+            int: the number of samples written
+
+        """
+        assert transform in self.row_transforms, \
+        "transform must be one of {}".format(self.row_transforms)
+        method = getattr(self, transform)
+        total = stream.num_rows(infile, key)
+        with stream.BlockWriter(outfile, key) as writer:
+            for block in stream.read_blocks(infile, chunksize, key):
+                writer.write(method(block, **kwargs))
+                if progress is not None:
+                    progress(writer.num_rows, total)
+        return writer.num_rows
 
     def ordinalize(self, data, cutoffs, min_value=0):
         """
@@ -322,6 +949,271 @@ class Normalizer(object):
         return data.apply(ordinalizer).astype(data.dtypes) + min_value
 
 
+class NormalizationPipeline(object):
+    """
+    A chain of Normalizer transforms, compiled into in-place numpy operations
+    on a single buffer.
+
+    Each block of rows of the data is aligned to the genes of the pipeline
+    and passed through all of the steps before the next block is read. Only
+    the final result is wrapped in a DataFrame. Once fit, a pipeline does
+    not need the HGNC table or the GTEx stats, and can be saved and loaded
+    for use in other jobs.
+
+    Example:
+        pipeline = NormalizationPipeline(['impute', 'tpm_from_counts',
+                                          'clr_from_tpm', 'z_score_from_clr',
+                                          ('ordinalize', {'cutoffs': [-2, 2]})])
+        ordinals = pipeline.fit_transform(counts, tissues)
+
+    Attributes:
+        steps (List[tuple]): the (name, kwargs) of each step
+        identifier (str): the type of gene ids
+        gene_list (List[str]): the genes to keep, or None for all of the
+            genes in GTEx
+        genes (pandas.Index): the genes of the result
+        lengths (numpy array ~ (num_genes,)): bp lengths of the genes
+        tissues (pandas.Index): the tissues in the GTEx stats
+        mean_clr (numpy array ~ (num_tissues, num_genes))
+        std_clr (numpy array ~ (num_tissues, num_genes))
+        step_names (List[str]): a class attribute specifying the steps
+            that can be used in a pipeline.
+
+    """
+    step_names = ['reindex', 'impute', 'tpm_from_counts', 'tpm_from_rpkm',
+                  'tpm_from_subset', 'clr_from_tpm', 'z_score_from_clr',
+                  'ordinalize']
+
+    def __init__(self, steps, identifier='symbol', gene_list=None):
+        """
+        Create a NormalizationPipeline.
+
+        The data are always reindexed to the genes first, so 'reindex' is
+        optional. The steps act as the Normalizer methods of the same name,
+        except that imputation is a separate step ('impute', with an
+        optional 'scale'), and z_score_from_clr gets the tissues of the
+        samples from transform.
+
+        Args:
+            steps (List[str or tuple]): the name, or (name, kwargs), of each step
+            identifier (optional; str): the type of gene ids
+            gene_list (optional; List[str]): a list of gene ids
+
+        Returns:
+            NormalizationPipeline
+
+        """
+        self.steps = [(step, {}) if isinstance(step, str) else (step[0], dict(step[1]))
+                      for step in steps]
+        for name, _ in self.steps:
+            assert name in self.step_names, \
+            "unknown step {}. known steps {}".format(name, self.step_names)
+        self.identifier = identifier
+        self.gene_list = None if gene_list is None else list(gene_list)
+        self.genes = None
+        self.lengths = None
+        self.tissues = None
+        self.mean_clr = None
+        self.std_clr = None
+        self._columns = None
+        self._positions = None
+
+    def _is_fit(self):
+        """
+        Check if the pipeline has been fit.
+
+        Args:
+            None
+
+        Returns:
+            bool
+
+        """
+        return self.genes is not None
+
+    def _uses(self, name):
+        """
+        Check if the pipeline has a step.
+
+        Args:
+            name (str)
+
+        Returns:
+            bool
+
+        """
+        return any(step == name for step, _ in self.steps)
+
+    def fit(self, data=None, normalizer=None):
+        """
+        Compile the pipeline: find the genes of the result, their lengths,
+        and the GTEx stats needed by the steps.
+
+        Args:
+            data (optional; pandas.DataFrame ~ (num_samples, num_genes)):
+                example data, whose columns are aligned to the genes
+            normalizer (optional; Normalizer): for the same identifier,
+                if one has already been created
+
+        Returns:
+            None
+
+        """
+        if normalizer is None:
+            normalizer = Normalizer(self.identifier)
+        columns = data.columns if data is not None else pandas.Index([])
+        plan = normalizer._plan(columns, self.gene_list)
+        self.genes = plan.genes
+        self.lengths = plan.lengths
+        if data is not None:
+            self._columns, self._positions = data.columns, plan.positions
+        if self._uses('z_score_from_clr'):
+            mean_clr, std_clr = normalizer._clr_stats(self.genes)
+            self.tissues = mean_clr.columns
+            self.mean_clr = numpy.ascontiguousarray(mean_clr.values.T)
+            self.std_clr = numpy.ascontiguousarray(std_clr.values.T)
+
+    def _positions_of(self, columns):
+        """
+        Get the column of the data for each gene of the pipeline,
+        remembering the columns of the last call.
+
+        Args:
+            columns (pandas.Index): the columns of the data
+
+        Returns:
+            numpy array ~ (num_genes,): with -1 for missing genes
+
+        """
+        if self._columns is None or not columns.equals(self._columns):
+            self._columns, self._positions = columns, columns.get_indexer(self.genes)
+        return self._positions
+
+    def _apply(self, name, kwargs, values, tissue_codes):
+        """
+        Apply a step in place to a block of rows.
+
+        Args:
+            name (str): the step
+            kwargs (dict): the arguments of the step
+            values (numpy array ~ (num_rows, num_genes))
+            tissue_codes (numpy array ~ (num_rows,)): the position of the
+                tissue of each row in self.tissues, or None
+
+        Returns:
+            None
+
+        """
+        if name == 'impute':
+            _impute_values(values, **kwargs)
+        elif name == 'tpm_from_counts':
+            numpy.divide(values, self.lengths.astype(values.dtype, copy=False), out=values)
+            _scale_rows(values)
+        elif name in ['tpm_from_rpkm', 'tpm_from_subset']:
+            _scale_rows(values)
+        elif name == 'clr_from_tpm':
+            # the clr is the same for any scale of the rows
+            numpy.log(values, out=values)
+            values -= values.mean(axis=1, keepdims=True)
+        elif name == 'z_score_from_clr':
+            values -= self.mean_clr.take(tissue_codes, axis=0)
+            values /= self.std_clr.take(tissue_codes, axis=0)
+        elif name == 'ordinalize':
+            values[:] = numpy.searchsorted(kwargs['cutoffs'], values)
+            values += kwargs.get('min_value', 0)
+
+    def transform(self, data, tissues=None):
+        """
+        Run the pipeline on some data.
+
+        Args:
+            data (pandas.DataFrame ~ (num_samples, num_genes)): any
+                expression data, which may be sparse (see is_sparse)
+            tissues (optional; pandas.Series ~ (num_samples,)): the tissues
+                of the samples, needed by z_score_from_clr
+
+        Returns:
+            pandas.DataFrame ~ (num_samples, num_genes): float32 for float32
+                data and float64 otherwise
+
+        """
+        assert self._is_fit(), "the pipeline has not been fit!"
+        tissue_codes = None
+        if self._uses('z_score_from_clr'):
+            assert tissues is not None, "z_score_from_clr needs the tissues of the samples"
+            tissue_codes = self.tissues.get_indexer(numpy.asarray(tissues))
+            assert (tissue_codes >= 0).all(), \
+            "unknown tissues {}".format(set(numpy.asarray(tissues)[tissue_codes < 0]))
+        positions = self._positions_of(data.columns)
+        missing = positions < 0
+        source = _to_csr(data) if is_sparse(data) else data.values
+        out = numpy.empty((len(data), len(self.genes)),
+                          dtype=numpy.result_type(source.dtype, numpy.float32))
+        # run every step on a block of rows while it is in memory
+        for start in range(0, len(out), ROW_BLOCK):
+            rows = source[start:start+ROW_BLOCK]
+            if sparse.issparse(rows):
+                rows = rows.toarray()
+            block = out[start:start+ROW_BLOCK]
+            block[:] = rows.take(positions, axis=1, mode='clip')
+            block[:, missing] = 0
+            numpy.copyto(block, 0, where=numpy.isnan(block))
+            codes = None if tissue_codes is None else tissue_codes[start:start+ROW_BLOCK]
+            for name, kwargs in self.steps:
+                self._apply(name, kwargs, block, codes)
+        return pandas.DataFrame(out, index=data.index, columns=self.genes, copy=False)
+
+    def fit_transform(self, data, tissues=None, normalizer=None):
+        """
+        Compile the pipeline for some data and run it.
+
+        Args:
+            data (pandas.DataFrame ~ (num_samples, num_genes)): any expression data
+            tissues (optional; pandas.Series ~ (num_samples,)): the tissues
+                of the samples, needed by z_score_from_clr
+            normalizer (optional; Normalizer): for the same identifier
+
+        Returns:
+            pandas.DataFrame ~ (num_samples, num_genes)
+
+        """
+        self.fit(data, normalizer)
+        return self.transform(data, tissues)
+
+    def save(self, filename, overwrite_existing=False):
+        """
+        Save the pipeline to filename.
+
+        Args:
+            filename (string): absolute path to save file
+            overwrite_existing (bool): whether or not to overwrite existing file
+
+        Returns:
+            None
+
+        """
+        path = Path(filename)
+        assert overwrite_existing or not path.exists(), \
+            "Must allow overwriting existing files"
+        with open(filename, 'wb') as f:
+            pickle.dump(self, f)
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Create a NormalizationPipeline from a saved object.
+
+        Args:
+            filename (str)
+
+        Returns:
+            NormalizationPipeline
+
+        """
+        with open(filename, 'rb') as f:
+            return pickle.load(f)
+
+
 class RemoveUnwantedVariation(object):
     """
     The RUV-2 algorithm.
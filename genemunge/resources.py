@@ -0,0 +1,264 @@
+import os
+import numpy
+import hashlib
+import threading
+import weakref
+from collections import OrderedDict
+
+
+_resources = {}
+_lock = threading.RLock()
+
+
+def get(key, load):
+    """
+    Get a shared resource, loading it the first time it is requested.
+
+    Resources are shared by every object in the process that asks for the
+    same key, so they must be treated as read-only.
+
+    Args:
+        key (hashable): identifies the resource
+        load (callable): a function with no arguments that loads the resource
+
+    Returns:
+        the resource
+
+    """
+    with _lock:
+        if key not in _resources:
+            _resources[key] = load()
+        return _resources[key]
+
+
+def file_hash(filename):
+    """
+    Compute the SHA-1 hash of the contents of a file.
+    Cached data that is compiled from a file is signed with this hash,
+    so that it is rebuilt whenever the contents of the file change.
+
+    Args:
+        filename (str)
+
+    Returns:
+        str
+
+    """
+    sha = hashlib.sha1()
+    with open(filename, 'rb') as infile:
+        for block in iter(lambda: infile.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def encode_strings(values):
+    """
+    Store some strings as one block of UTF-8 bytes with offsets, so that
+    they can be saved as plain numeric arrays without padding.
+
+    Args:
+        values (List[str])
+
+    Returns:
+        text (numpy array ~ (num_bytes,)): uint8
+        offsets (numpy array ~ (len(values) + 1,)): the byte offset
+            of each string, int32 unless there are too many bytes
+
+    """
+    encoded = [v.encode('utf-8') for v in values]
+    offsets = numpy.zeros(len(encoded) + 1, dtype=numpy.int64)
+    numpy.cumsum([len(e) for e in encoded], out=offsets[1:])
+    if offsets[-1] < numpy.iinfo(numpy.int32).max:
+        offsets = offsets.astype(numpy.int32)
+    return numpy.frombuffer(b''.join(encoded), dtype=numpy.uint8), offsets
+
+
+def decode_strings(text, offsets):
+    """
+    Read some strings stored by encode_strings.
+
+    Args:
+        text (numpy array ~ (num_bytes,)): uint8
+        offsets (numpy array ~ (num_strings + 1,))
+
+    Returns:
+        numpy array ~ (num_strings,): object array of str
+
+    """
+    blob = text.tobytes()
+    starts = offsets.tolist()
+    values = numpy.empty(len(starts) - 1, dtype=object)
+    values[:] = [blob[a:b].decode('utf-8') for a, b in zip(starts[:-1], starts[1:])]
+    return values
+
+
+def save_arrays(dirname, arrays, signature):
+    """
+    Save some arrays to a directory, one .npy file per array, along with
+    the signature of the data that they were built from.
+
+    The signature is written last, so an interrupted save is detected as
+    stale by saved_signature.
+
+    Args:
+        dirname (str)
+        arrays (dict {str: numpy array}): the arrays, by file name
+        signature (str)
+
+    Returns:
+        None
+
+    """
+    os.makedirs(dirname, exist_ok=True)
+    source = os.path.join(dirname, 'source.npy')
+    if os.path.exists(source):
+        os.remove(source)
+    for name, array in arrays.items():
+        numpy.save(os.path.join(dirname, name + '.npy'), array)
+    numpy.save(source, numpy.array(signature))
+
+
+def saved_signature(dirname):
+    """
+    Get the signature of the arrays saved to a directory by save_arrays.
+
+    Args:
+        dirname (str)
+
+    Returns:
+        str or None: None if the save is missing or was interrupted
+
+    """
+    source = os.path.join(dirname, 'source.npy')
+    if not os.path.exists(source):
+        return None
+    return str(numpy.load(source))
+
+
+class IdentityCache(object):
+    """
+    A cache of values computed from objects, keyed on the identity of each
+    object, e.g., the cleaned labels of a pandas.Index.
+
+    Only use it for immutable objects, such as indexes. An entry is dropped
+    when its object is garbage collected, or when it is the least recently
+    used of more than max_size entries.
+
+    Attributes:
+        max_size (int): the number of entries to keep.
+
+    """
+    def __init__(self, max_size):
+        """
+        Create an empty cache.
+
+        Args:
+            max_size (int): the number of entries to keep.
+
+        Returns:
+            IdentityCache
+
+        """
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, obj, compute):
+        """
+        Get the value for an object, computing it if it is not in the cache.
+
+        Args:
+            obj (object): an immutable object that supports weak references
+            compute (callable): a function with no arguments that computes
+                the value for obj
+
+        Returns:
+            the value
+
+        """
+        key = id(obj)
+        with self._lock:
+            if key in self._entries:
+                reference, value = self._entries[key]
+                if reference() is obj:
+                    self._entries.move_to_end(key)
+                    return value
+        value = compute()
+        with self._lock:
+            self._entries[key] = (weakref.ref(obj, lambda _: self._drop(key)), value)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return value
+
+    def _drop(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """
+        Remove every entry.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        """
+        with self._lock:
+            self._entries.clear()
+
+
+def loaded():
+    """
+    Get the keys of the resources that are currently loaded.
+
+    Args:
+        None
+
+    Returns:
+        List
+
+    """
+    with _lock:
+        return list(_resources)
+
+
+def preload(identifiers=['symbol']):
+    """
+    Load the data used by Searcher, Describer, and Normalizer objects
+    so that constructing them later is fast.
+
+    Args:
+        identifiers (optional; List[str]): the gene identifier types that
+            will be used, e.g., 'symbol', 'ensembl_gene_id'
+
+    Returns:
+        None
+
+    """
+    from . import convert, describe
+    for identifier in identifiers:
+        describe.Describer(identifier)
+        if identifier != 'ensembl_gene_id':
+            convert.IDConverter('ensembl_gene_id', identifier)
+
+
+def clear():
+    """
+    Release all of the shared resources.
+    Objects that were already constructed keep their references;
+    new objects will load the data again.
+
+    Args:
+        None
+
+    Returns:
+        None
+
+    """
+    with _lock:
+        _resources.clear()
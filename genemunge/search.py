@@ -1,37 +1,1776 @@
-import os, json, pandas
-from itertools import chain
+import os, re, json, pandas, numpy, hashlib, warnings
+from collections import OrderedDict
+from collections.abc import Mapping
+from scipy import sparse, special
+
+from . import convert
+from . import resources
 
 
 FILEPATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
 GONAME = os.path.join(FILEPATH, 'go.json')
+CLOSURENAME = os.path.join(FILEPATH, 'go_closure.npz')
+GODATANAME = os.path.join(FILEPATH, 'go_data')
+MEMBERSHIPNAME = os.path.join(FILEPATH, 'go_membership')
 ATTRIBUTENAME = os.path.join(FILEPATH, 'gene_attributes.json')
 GTEXPATH = os.path.join(FILEPATH, 'gtex')
+TOKEN = re.compile('[a-z0-9]+')
+QUERY = re.compile(r'"([^"]*)"|(\S+)')
+
+
+def _npz_nbytes(archive, names):
+    """
+    Get the memory needed to load some arrays from an npz archive,
+    from the headers of the arrays, without loading them.
+
+    Args:
+        archive (numpy NpzFile)
+        names (List[str]): the names of the arrays
+
+    Returns:
+        int
+
+    """
+    readers = {(1, 0): numpy.lib.format.read_array_header_1_0,
+               (2, 0): numpy.lib.format.read_array_header_2_0}
+    nbytes = 0
+    for name in names:
+        with archive.zip.open(name + '.npy') as member:
+            version = numpy.lib.format.read_magic(member)
+            if version in readers:
+                shape, _, dtype = readers[version](member)
+                nbytes += int(numpy.prod(shape)) * dtype.itemsize
+            else:
+                nbytes += archive[name].nbytes
+    return nbytes
+
+
+def _ranges(starts, counts):
+    """
+    Concatenate the ranges [start, start + count) of integers.
+
+    Args:
+        starts (numpy array)
+        counts (numpy array)
+
+    Returns:
+        numpy array
+
+    """
+    total = counts.sum()
+    # each entry = the start of its range + its position within the range
+    shifts = numpy.repeat(starts - numpy.cumsum(counts) + counts, counts)
+    return shifts + numpy.arange(total, dtype=numpy.int64)
+
+
+def _csr_positions(indptr, rows):
+    """
+    Get the positions of the entries of some rows of a CSR array.
+
+    Args:
+        indptr (numpy array ~ (num_rows + 1,)): row pointers
+        rows (numpy array): the rows to gather
+
+    Returns:
+        numpy array: the positions of the entries of the rows, concatenated
+
+    """
+    rows = numpy.asarray(rows, dtype=numpy.int64)
+    return _ranges(indptr[rows], indptr[rows + 1] - indptr[rows])
+
+
+def _csr_gather(indptr, indices, rows):
+    """
+    Get the concatenated column indices for some rows of a CSR adjacency.
+
+    Args:
+        indptr (numpy array ~ (num_nodes + 1,)): row pointers
+        indices (numpy array ~ (num_edges,)): column indices
+        rows (numpy array ~ (num_rows,)): the rows to gather
+
+    Returns:
+        numpy array: the column indices of the rows, concatenated
+
+    """
+    return indices[_csr_positions(indptr, rows)]
+
+
+def _transpose_csr(indptr, indices, num_nodes):
+    """
+    Transpose a CSR adjacency between num_nodes nodes.
+
+    Args:
+        indptr (numpy array ~ (num_nodes + 1,)): row pointers
+        indices (numpy array ~ (num_edges,)): column indices
+        num_nodes (int)
+
+    Returns:
+        indptr, indices of the transposed adjacency
+
+    """
+    rows = numpy.repeat(numpy.arange(num_nodes, dtype=indices.dtype),
+                        numpy.diff(indptr))
+    order = numpy.argsort(indices, kind='stable')
+    counts = numpy.bincount(indices, minlength=num_nodes)
+    t_indptr = numpy.concatenate([[0], numpy.cumsum(counts)]).astype(numpy.int64)
+    return t_indptr, rows[order]
+
+
+def _hypergeom_logpmf(x, N, K, n):
+    """
+    Compute log P(X = x) for hypergeometric random variables X: the number
+    of marked items in n draws without replacement from N items, K of which
+    are marked.
+
+    Args:
+        x, N, K, n (numpy arrays)
+
+    Returns:
+        numpy array
+
+    """
+    return (special.gammaln(K + 1) - special.gammaln(x + 1)
+            - special.gammaln(K - x + 1) + special.gammaln(N - K + 1)
+            - special.gammaln(n - x + 1) - special.gammaln(N - K - n + x + 1)
+            - special.gammaln(N + 1) + special.gammaln(n + 1)
+            + special.gammaln(N - n + 1))
+
+
+def _hypergeom_tail(x, N, K, n, stop, step, tol):
+    """
+    Sum P(X = y) for y from x to stop (inclusive), moving away from the mode,
+    using the ratio of consecutive probabilities. The sum stops as soon as
+    the terms are negligible.
+
+    Args:
+        x, N, K, n (numpy arrays)
+        stop (numpy array): the last value of y
+        step (int): 1 to sum upwards or -1 to sum downwards
+        tol (float): relative size of the last term of a sum
+
+    Returns:
+        numpy array
+
+    """
+    x = x.copy()
+    active = step * (stop - x) >= 0
+    term = numpy.where(active, numpy.exp(_hypergeom_logpmf(
+            numpy.where(active, x, stop), N, K, n)), 0)
+    total = term.copy()
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        while active.any():
+            if step > 0:
+                ratio = (K - x) * (n - x) / ((x + 1) * (N - K - n + x + 1))
+            else:
+                ratio = x * (N - K - n + x) / ((K - x + 1) * (n - x + 1))
+            x += step
+            active &= step * (stop - x) >= 0
+            term = numpy.where(active, term * ratio, 0)
+            total += term
+            active &= term > tol * total
+    return total
+
+
+def _hypergeom_sf(k, N, K, n, tol=1e-17):
+    """
+    Compute P(X >= k) for hypergeometric random variables X: the number of
+    marked items in n draws without replacement from N items, K of which
+    are marked.
+
+    Only the tail on the far side of k from the mode is summed, so this is
+    accurate for small p-values and much faster than
+    scipy.stats.hypergeom.sf for many arguments.
+
+    Args:
+        k (numpy array): observed number of marked items
+        N (int or numpy array): number of items
+        K (numpy array): number of marked items
+        n (numpy array): number of draws
+        tol (optional; float): relative size of the last term of a sum
+
+    Returns:
+        numpy array
+
+    """
+    k, N, K, n = [numpy.asarray(a, dtype=numpy.float64)
+                  for a in numpy.broadcast_arrays(k, N, K, n)]
+    lo = numpy.maximum(0, n + K - N)
+    hi = numpy.minimum(n, K)
+    mode = numpy.floor((n + 1) * (K + 1) / (N + 2))
+    sf = numpy.empty_like(k)
+    u = k > mode
+    sf[u] = _hypergeom_tail(k[u], N[u], K[u], n[u], hi[u], 1, tol)
+    l = ~u
+    sf[l] = 1 - _hypergeom_tail(k[l] - 1, N[l], K[l], n[l], lo[l], -1, tol)
+    return numpy.clip(sf, 0, 1)
+
+
+def _benjamini_hochberg(pvalues, num_hypotheses):
+    """
+    Compute Benjamini-Hochberg adjusted p-values for some of the hypotheses
+    of a test. The p-values of the other hypotheses are taken to be 1.
+
+    Args:
+        pvalues (numpy array ~ (num_tested,))
+        num_hypotheses (int): the total number of hypotheses
+
+    Returns:
+        numpy array ~ (num_tested,)
+
+    """
+    order = numpy.argsort(pvalues, kind='mergesort')
+    ranked = pvalues[order] * (num_hypotheses / numpy.arange(1, len(pvalues) + 1))
+    # enforce monotonicity from the largest p-value down; the untested
+    # hypotheses all have an adjusted p-value of 1
+    ranked = numpy.minimum.accumulate(ranked[::-1])[::-1]
+    adjusted = numpy.empty_like(ranked)
+    adjusted[order] = numpy.minimum(ranked, 1)
+    return adjusted
+
+
+class GOGraph(object):
+    """
+    A compiled representation of the Gene Ontology graph.
+
+    GO ids are stored in sorted order and each term is referred to by its
+    position in that order. The parent -> child edges are stored as
+    compressed sparse row (CSR) arrays so that traversals can be run as
+    a breadth first search over integer arrays.
+
+    Attributes:
+        terms (numpy array ~ (num_terms,)): the GO ids, sorted.
+        index (dict): a map from GO id to integer position.
+        children_indptr (numpy array ~ (num_terms + 1,))
+        children_indices (numpy array ~ (num_edges,))
+        parents_indptr (numpy array ~ (num_terms + 1,))
+        parents_indices (numpy array ~ (num_edges,))
+        levels (numpy array ~ (num_terms,)): the length of the longest path
+            from a root term to each term.
+
+    """
+    def __init__(self, terms, children_indptr, children_indices):
+        """
+        Create a GOGraph from CSR arrays of the children of each term.
+
+        Args:
+            terms (numpy array ~ (num_terms,)): the GO ids, sorted.
+            children_indptr (numpy array ~ (num_terms + 1,))
+            children_indices (numpy array ~ (num_edges,))
+
+        Returns:
+            GOGraph
+
+        """
+        self.terms = numpy.asarray(terms)
+        self.index = {t: i for i, t in enumerate(self.terms.tolist())}
+        self.children_indptr = numpy.asarray(children_indptr, dtype=numpy.int64)
+        self.children_indices = numpy.asarray(children_indices, dtype=numpy.int32)
+        self.parents_indptr, self.parents_indices = _transpose_csr(
+                self.children_indptr, self.children_indices, len(self.terms))
+        self.levels = self._compute_levels()
+
+    @classmethod
+    def from_dict(cls, go):
+        """
+        Compile a GOGraph from the GO dictionary created by parse_go.
+
+        Args:
+            go (dict): the GO data.
+
+        Returns:
+            GOGraph
+
+        """
+        terms = sorted(go)
+        index = {t: i for i, t in enumerate(terms)}
+        counts = [len(go[t]['children']) for t in terms]
+        indptr = numpy.concatenate([[0], numpy.cumsum(counts)]).astype(numpy.int64)
+        indices = numpy.fromiter((index[c] for t in terms for c in go[t]['children']),
+                                 dtype=numpy.int32, count=int(indptr[-1]))
+        return cls(numpy.array(terms), indptr, indices)
+
+    def __len__(self):
+        return len(self.terms)
+
+    def signature(self):
+        """
+        Get a hash of the terms and edges that identifies the graph.
+
+        Args:
+            None
+
+        Returns:
+            str
+
+        """
+        h = hashlib.sha1()
+        h.update('\n'.join(self.terms.tolist()).encode('utf-8'))
+        h.update(self.children_indptr.tobytes())
+        h.update(self.children_indices.tobytes())
+        return h.hexdigest()
+
+    def _compute_levels(self):
+        """
+        Compute the longest path from a root term to each term by peeling
+        off the terms whose parents have all been visited.
+
+        Args:
+            None
+
+        Returns:
+            levels (numpy array ~ (num_terms,))
+
+        """
+        num_terms = len(self.terms)
+        levels = numpy.zeros(num_terms, dtype=numpy.int32)
+        remaining = numpy.diff(self.parents_indptr)
+        frontier = numpy.flatnonzero(remaining == 0)
+        level = 0
+        while frontier.size:
+            levels[frontier] = level
+            children = _csr_gather(self.children_indptr, self.children_indices,
+                                   frontier)
+            remaining = remaining - numpy.bincount(children, minlength=num_terms)
+            frontier = numpy.unique(children[remaining[children] == 0])
+            level += 1
+        return levels
+
+    def get_indices(self, terms):
+        """
+        Get the integer positions of some GO ids.
+
+        Args:
+            terms (List[str]): GO ids
+
+        Returns:
+            numpy array ~ (len(terms),)
+
+        """
+        return numpy.array([self.index[t] for t in terms], dtype=numpy.int64)
+
+    def get_terms(self, indices):
+        """
+        Get the GO ids at some integer positions.
+
+        Args:
+            indices (numpy array): integer positions
+
+        Returns:
+            List[str]
+
+        """
+        return self.terms[indices].tolist()
+
+    def _reach(self, indptr, indices, sources, blocked=None, stop=None,
+               visited=None):
+        """
+        Breadth first search from some source terms.
+
+        Args:
+            indptr (numpy array): CSR row pointers of the edges to follow
+            indices (numpy array): CSR column indices of the edges to follow
+            sources (numpy array): integer positions to start from
+            blocked (optional; numpy array ~ (num_terms,)): boolean mask of
+                terms that are not entered
+            stop (optional; numpy array ~ (num_terms,)): boolean mask of
+                terms that are entered, but not expanded
+            visited (optional; numpy array ~ (num_terms,)): an all False
+                boolean scratch array, which is restored before returning
+
+        Returns:
+            numpy array: unsorted integer positions of the terms reached by
+                following at least one edge
+
+        """
+        if visited is None:
+            visited = numpy.zeros(len(self.terms), dtype=bool)
+        reached = []
+        frontier = numpy.unique(sources)
+        while frontier.size:
+            neighbors = _csr_gather(indptr, indices, frontier)
+            neighbors = neighbors[~visited[neighbors]]
+            if blocked is not None:
+                neighbors = neighbors[~blocked[neighbors]]
+            neighbors = numpy.unique(neighbors)
+            visited[neighbors] = True
+            reached.append(neighbors)
+            frontier = neighbors if stop is None else neighbors[~stop[neighbors]]
+        reached = numpy.concatenate(reached) if reached else indices[:0]
+        visited[reached] = False
+        return reached
+
+    def _closure(self, indptr, indices, sources, inclusive, blocked):
+        """
+        Get the terms reachable from some source terms.
+
+        Args:
+            indptr (numpy array): CSR row pointers of the edges to follow
+            indices (numpy array): CSR column indices of the edges to follow
+            sources (numpy array): integer positions to start from
+            inclusive (bool): include the sources in the result
+            blocked (numpy array ~ (num_terms,) or None): boolean mask of
+                terms that are not entered
+
+        Returns:
+            numpy array: sorted integer positions
+
+        """
+        sources = numpy.asarray(sources, dtype=numpy.int64)
+        reached = self._reach(indptr, indices, sources, blocked=blocked)
+        if inclusive:
+            reached = numpy.concatenate([reached, sources])
+        return numpy.unique(reached)
+
+    def descendants(self, sources, inclusive=True, blocked=None):
+        """
+        Get the descendants of some terms.
+
+        Args:
+            sources (numpy array): integer positions of the terms
+            inclusive (optional; bool): include the sources in the result
+            blocked (optional; numpy array ~ (num_terms,)): boolean mask of
+                terms to exclude, along with anything only reachable through them
+
+        Returns:
+            numpy array: sorted integer positions of the descendants
+
+        """
+        return self._closure(self.children_indptr, self.children_indices,
+                             sources, inclusive, blocked)
+
+    def ancestors(self, sources, inclusive=True, blocked=None):
+        """
+        Get the ancestors of some terms.
+
+        Args:
+            sources (numpy array): integer positions of the terms
+            inclusive (optional; bool): include the sources in the result
+            blocked (optional; numpy array ~ (num_terms,)): boolean mask of
+                terms to exclude, along with anything only reachable through them
+
+        Returns:
+            numpy array: sorted integer positions of the ancestors
+
+        """
+        return self._closure(self.parents_indptr, self.parents_indices,
+                             sources, inclusive, blocked)
+
+    def propagate(self, matrix):
+        """
+        Propagate annotations up the graph (the true path rule): each term
+        is associated with everything associated with its descendants.
+
+        Terms are processed one level at a time, from the deepest level up,
+        so that the row of each child is folded into each of its parents once.
+
+        Args:
+            matrix (scipy.sparse.csr_matrix ~ (num_terms, num_columns)):
+                binary matrix of direct annotations
+
+        Returns:
+            scipy.sparse.csr_matrix ~ (num_terms, num_columns): binary matrix
+                of propagated annotations
+
+        """
+        num_terms, num_columns = matrix.shape
+        matrix = matrix.tocsr()
+        # the propagated row of term t is buffer[starts[t]:starts[t]+counts[t]]
+        starts = numpy.zeros(num_terms, dtype=numpy.int64)
+        counts = numpy.zeros(num_terms, dtype=numpy.int64)
+        chunks, buffer = [], numpy.zeros(0, dtype=numpy.int32)
+        for level in range(self.levels.max(initial=0), -1, -1):
+            terms = numpy.flatnonzero(self.levels == level)
+            # the direct annotations of the terms at this level
+            parents = [numpy.repeat(terms, numpy.diff(matrix.indptr)[terms])]
+            columns = [_csr_gather(matrix.indptr, matrix.indices, terms)]
+            # the propagated annotations of their children
+            children = _csr_gather(self.children_indptr, self.children_indices, terms)
+            owners = numpy.repeat(terms, numpy.diff(self.children_indptr)[terms])
+            parents.append(numpy.repeat(owners, counts[children]))
+            columns.append(buffer[_ranges(starts[children], counts[children])])
+            key = numpy.unique(numpy.concatenate(parents).astype(numpy.int64)
+                               * num_columns + numpy.concatenate(columns))
+            rows, chunk = numpy.divmod(key, num_columns)
+            level_counts = numpy.bincount(rows, minlength=num_terms)[terms]
+            starts[terms] = len(buffer) + numpy.cumsum(level_counts) - level_counts
+            counts[terms] = level_counts
+            chunks.append(chunk.astype(numpy.int32))
+            buffer = numpy.concatenate(chunks)
+        indptr = numpy.concatenate([[0], numpy.cumsum(counts)])
+        indices = buffer[_ranges(starts, counts)]
+        return sparse.csr_matrix(
+                (numpy.ones(len(indices), dtype=matrix.dtype), indices, indptr),
+                shape=(num_terms, num_columns))
+
+    def descendants_many(self, sources):
+        """
+        Get the descendants of each of a batch of terms, inclusive.
+
+        The terms are processed from the deepest to the shallowest so that
+        a search that runs into a term that has already been processed can
+        reuse its descendants instead of walking its subtree again.
+
+        Args:
+            sources (numpy array): integer positions of the terms
+
+        Returns:
+            dict {int: numpy array}: sorted integer positions of the
+                descendants of each source
+
+        """
+        sources = numpy.unique(numpy.asarray(sources, dtype=numpy.int64))
+        done = numpy.zeros(len(self.terms), dtype=bool)
+        visited = numpy.zeros(len(self.terms), dtype=bool)
+        result = {}
+        for s in sources[numpy.argsort(-self.levels[sources], kind='stable')]:
+            reached = self._reach(self.children_indptr, self.children_indices,
+                                  [s], stop=done, visited=visited)
+            shared = reached[done[reached]]
+            result[s] = numpy.unique(numpy.concatenate(
+                    [[s], reached] + [result[t] for t in shared]))
+            done[s] = True
+        return result
+
+
+class ClosureCache(object):
+    """
+    A cache of the transitive closure of the GO graph.
+
+    The descendants and ancestors of each term (inclusive) are stored as
+    sorted arrays of integer positions, so that repeated queries are lookups.
+    If there is no memory budget, the full closure is computed the first
+    time it is needed and saved next to go.json. If there is a memory budget,
+    the saved closure is used only if it fits within the budget. Otherwise,
+    the closures of individual terms are computed on demand and kept in an
+    LRU cache that is trimmed to the budget.
+
+    Attributes:
+        graph (GOGraph): the compiled GO graph.
+        max_bytes (int or None): the memory budget.
+        filename (str or None): where the full closure is saved.
+        nbytes (int): the memory currently used by the cache.
+
+    """
+    def __init__(self, graph, max_bytes=None, filename=CLOSURENAME):
+        """
+        Create a cache of the transitive closure of the GO graph.
+        Nothing is computed until the first query.
+
+        Args:
+            graph (GOGraph): the compiled GO graph.
+            max_bytes (optional; int): the memory budget, in bytes.
+            filename (optional; str): where to save the full closure.
+                If None, the closure is not saved.
+
+        Returns:
+            ClosureCache
+
+        """
+        self.graph = graph
+        self.max_bytes = max_bytes
+        self.filename = filename
+        self.nbytes = 0
+        self._full = None
+        self._lru = OrderedDict()
+        self._initialized = False
+
+    def _initialize(self):
+        """
+        Load or build the full closure if it is allowed by the memory budget.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        """
+        self._initialized = True
+        self._full = self._load()
+        if self._full is None and self.max_bytes is None:
+            self._full = self._build()
+            self._save()
+        if self._full is not None:
+            self.nbytes = sum(a.nbytes for a in self._full.values())
+
+    def _load(self):
+        """
+        Load a saved closure if it matches the graph and fits in the budget.
+        The size of the closure is read from the array headers, so a closure
+        that is over the budget is never loaded.
+
+        Args:
+            None
+
+        Returns:
+            dict or None
+
+        """
+        if self.filename is None or not os.path.exists(self.filename):
+            return None
+        with numpy.load(self.filename) as saved:
+            if str(saved['signature']) != self.graph.signature():
+                return None
+            arrays = ['desc_indptr', 'desc_indices', 'anc_indptr', 'anc_indices']
+            nbytes = _npz_nbytes(saved, arrays)
+            if self.max_bytes is not None and nbytes > self.max_bytes:
+                return None
+            return {k: saved[k] for k in arrays}
+
+    def _build(self):
+        """
+        Compute the full closure of the graph.
+        The ancestors are the transpose of the descendants.
+
+        Args:
+            None
+
+        Returns:
+            dict
+
+        """
+        num_terms = len(self.graph)
+        descendants = self.graph.descendants_many(numpy.arange(num_terms))
+        counts = [len(descendants[i]) for i in range(num_terms)]
+        desc_indptr = numpy.concatenate([[0], numpy.cumsum(counts)]).astype(numpy.int64)
+        desc_indices = numpy.concatenate(
+                [descendants[i] for i in range(num_terms)]).astype(numpy.int32)
+        anc_indptr, anc_indices = _transpose_csr(desc_indptr, desc_indices, num_terms)
+        return {'desc_indptr': desc_indptr, 'desc_indices': desc_indices,
+                'anc_indptr': anc_indptr, 'anc_indices': anc_indices}
+
+    def _save(self):
+        """
+        Save the full closure, if there is a filename.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        """
+        if self.filename is None:
+            return
+        try:
+            numpy.savez(self.filename, signature=self.graph.signature(),
+                        **self._full)
+        except OSError as err:
+            warnings.warn("Could not save the GO closure: {}".format(err))
+
+    def _get(self, direction, term):
+        """
+        Get the closure of a single term in one direction.
+
+        Args:
+            direction (str): 'descendants' or 'ancestors'
+            term (int): integer position of the term
+
+        Returns:
+            numpy array: sorted integer positions, inclusive
+
+        """
+        if not self._initialized:
+            self._initialize()
+        if self._full is not None:
+            prefix = 'desc' if direction == 'descendants' else 'anc'
+            indptr = self._full[prefix + '_indptr']
+            return self._full[prefix + '_indices'][indptr[term]:indptr[term + 1]]
+        key = (direction, term)
+        if key in self._lru:
+            self._lru.move_to_end(key)
+            return self._lru[key]
+        result = getattr(self.graph, direction)([term]).astype(numpy.int32)
+        if result.nbytes <= self.max_bytes:
+            self._lru[key] = result
+            self.nbytes += result.nbytes
+            self._trim()
+        return result
+
+    def _trim(self):
+        """
+        Evict the least recently used closures until the cache fits in the budget.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        """
+        while self.nbytes > self.max_bytes:
+            _, evicted = self._lru.popitem(last=False)
+            self.nbytes -= evicted.nbytes
+
+    def descendants(self, term):
+        """
+        Get the descendants of a term, inclusive.
+
+        Args:
+            term (int): integer position of the term
+
+        Returns:
+            numpy array: sorted integer positions
+
+        """
+        return self._get('descendants', term)
+
+    def ancestors(self, term):
+        """
+        Get the ancestors of a term, inclusive.
+
+        Args:
+            term (int): integer position of the term
+
+        Returns:
+            numpy array: sorted integer positions
+
+        """
+        return self._get('ancestors', term)
+
+    def clear(self):
+        """
+        Drop everything held in memory.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        """
+        self.nbytes = 0
+        self._full = None
+        self._lru = OrderedDict()
+        self._initialized = False
+
+
+class Annotations(object):
+    """
+    The gene annotations of the Gene Ontology stored as parallel arrays
+    of integer codes, sorted by gene.
+
+    Attributes:
+        genes (pandas.Index): the annotated genes by ensembl_gene_id, sorted.
+        evidence_codes (pandas.Index): the GO evidence codes, sorted.
+        num_terms (int): the number of terms in the GOGraph.
+        term (numpy array ~ (num_annotations,)): position of the GO term in
+            the GOGraph.
+        gene (numpy array ~ (num_annotations,)): position of the gene.
+        code (numpy array ~ (num_annotations,)): position of the evidence code.
+        gene_indptr (numpy array ~ (num_genes + 1,)): the annotations of
+            gene g are in rows gene_indptr[g]:gene_indptr[g+1].
+
+    """
+    def __init__(self, genes, evidence_codes, num_terms, term, gene, code):
+        """
+        Create Annotations from arrays of integer codes that are already
+        sorted by (gene, term, code) without duplicates.
+        Use Annotations.from_arrays for arbitrary arrays.
+
+        Args:
+            genes (List[str]): ensembl gene ids, sorted
+            evidence_codes (List[str]): GO evidence codes, sorted
+            num_terms (int): the number of terms in the GOGraph
+            term (numpy array ~ (num_annotations,))
+            gene (numpy array ~ (num_annotations,))
+            code (numpy array ~ (num_annotations,))
+
+        Returns:
+            Annotations
+
+        """
+        self.genes = pandas.Index(genes, dtype=object)
+        self.evidence_codes = pandas.Index(evidence_codes, dtype=object)
+        self.num_terms = int(num_terms)
+        self.term = term
+        self.gene = gene
+        self.code = code
+        counts = numpy.bincount(self.gene, minlength=len(self.genes))
+        self.gene_indptr = numpy.concatenate([[0], numpy.cumsum(counts)]).astype(numpy.int64)
+        self._term_rows = None
+
+    @classmethod
+    def from_arrays(cls, genes, evidence_codes, num_terms, term, gene, code):
+        """
+        Create Annotations from arrays of integer codes.
+        Duplicate annotations are dropped.
+
+        Args:
+            genes (List[str]): ensembl gene ids, sorted
+            evidence_codes (List[str]): GO evidence codes, sorted
+            num_terms (int): the number of terms in the GOGraph
+            term (numpy array ~ (num_annotations,))
+            gene (numpy array ~ (num_annotations,))
+            code (numpy array ~ (num_annotations,))
+
+        Returns:
+            Annotations
+
+        """
+        num_codes = numpy.int64(len(evidence_codes))
+        # sort by (gene, term, code) and drop duplicates in one pass
+        key = (numpy.asarray(gene, dtype=numpy.int64) * numpy.int64(num_terms)
+               + numpy.asarray(term, dtype=numpy.int64)) * num_codes \
+               + numpy.asarray(code, dtype=numpy.int64)
+        key = numpy.unique(key)
+        code = (key % num_codes).astype(numpy.int8)
+        key //= num_codes
+        term = (key % num_terms).astype(numpy.int32)
+        gene = (key // num_terms).astype(numpy.int32)
+        return cls(genes, evidence_codes, num_terms, term, gene, code)
+
+    @classmethod
+    def from_dict(cls, go, graph):
+        """
+        Collect the annotations from the GO dictionary created by parse_go.
+
+        Args:
+            go (dict): the GO data.
+            graph (GOGraph): the compiled GO graph.
+
+        Returns:
+            Annotations
+
+        """
+        terms, codes, genes = [], [], []
+        for t in go:
+            i = graph.index[t]
+            for c, annotated in go[t]['genes'].items():
+                terms += [i] * len(annotated)
+                codes += [c] * len(annotated)
+                genes += annotated
+        gene_codes, gene_index = pandas.factorize(genes, sort=True)
+        code_index = pandas.Index(sorted({c for t in go for c in go[t]['genes']}))
+        return cls.from_arrays(gene_index, code_index, len(graph),
+                               numpy.array(terms, dtype=numpy.int32),
+                               gene_codes, code_index.get_indexer(codes))
+
+    def __len__(self):
+        return len(self.term)
+
+    def matrix(self, evidence_codes=None):
+        """
+        Get the direct annotations as a sparse binary matrix.
+
+        Args:
+            evidence_codes (None or List[str])
+
+        Returns:
+            scipy.sparse.csr_matrix ~ (num_terms, num_genes)
+
+        """
+        code_mask = self.code_mask(evidence_codes)
+        keep = slice(None) if code_mask is None else code_mask[self.code]
+        rows, cols = self.term[keep], self.gene[keep]
+        matrix = sparse.csr_matrix(
+                (numpy.ones(len(rows), dtype=numpy.int32), (rows, cols)),
+                shape=(self.num_terms, len(self.genes)))
+        # annotations with several evidence codes count once
+        matrix.data[:] = 1
+        return matrix
+
+    def code_mask(self, evidence_codes):
+        """
+        Get a boolean mask over the evidence codes.
+
+        Args:
+            evidence_codes (None or List[str])
+
+        Returns:
+            numpy array ~ (num_codes,) or None if evidence_codes is None
+
+        """
+        if evidence_codes is None:
+            return None
+        return self.evidence_codes.isin(evidence_codes)
+
+    def rows_for_genes(self, genes):
+        """
+        Get the annotations of some genes.
+
+        Args:
+            genes (numpy array): positions of the genes
+
+        Returns:
+            numpy array: the rows of the annotations, grouped by gene
+
+        """
+        return _csr_positions(self.gene_indptr, genes)
+
+    def rows_for_terms(self, terms):
+        """
+        Get the annotations of some terms.
+
+        Args:
+            terms (numpy array): positions of the terms
+
+        Returns:
+            numpy array: the rows of the annotations, grouped by term
+
+        """
+        if self._term_rows is None:
+            counts = numpy.bincount(self.term, minlength=self.num_terms)
+            self._term_rows = (
+                    numpy.concatenate([[0], numpy.cumsum(counts)]).astype(numpy.int64),
+                    numpy.argsort(self.term, kind='stable'))
+        indptr, order = self._term_rows
+        return order[_csr_positions(indptr, terms)]
+
+
+class GOData(object):
+    """
+    The Gene Ontology in a compact binary format.
+
+    The data are stored as a directory of .npy files so that they can be
+    memory mapped: loading is nearly free, several processes share the
+    same pages, and the text of a term is only decoded when it is used.
+    Each string column is stored by resources.encode_strings as a pair of
+    arrays, <column>_text and <column>_offsets.
+
+        terms: the GO ids, sorted
+        children_indptr, children_indices: CSR arrays of the children
+        namespace_table, namespace_codes: interned namespaces (int8 codes)
+        name, def: the names and definitions
+        genes, evidence_codes: interned ensembl gene ids and evidence codes
+        annotation_term, annotation_gene, annotation_code: the annotations
+            as int32/int8 codes, sorted by (gene, term, code)
+        source: the signature of the go.json file the data came from
+
+    Attributes:
+        arrays (dict): the arrays, by name.
+
+    """
+    string_columns = ['terms', 'namespace_table', 'name', 'def', 'genes',
+                      'evidence_codes']
+    names = [c + suffix for c in string_columns for suffix in ['_text', '_offsets']] + \
+            ['children_indptr', 'children_indices', 'namespace_codes',
+             'annotation_term', 'annotation_gene', 'annotation_code']
+    text_fields = ['name', 'def']
+
+    def __init__(self, arrays):
+        """
+        Create a GOData object from a dictionary of arrays.
+
+        Args:
+            arrays (dict): the arrays, by name.
+
+        Returns:
+            GOData
+
+        """
+        self.arrays = arrays
+
+    def __getitem__(self, name):
+        return self.arrays[name]
+
+    def __len__(self):
+        return len(self.arrays['terms_offsets']) - 1
+
+    @classmethod
+    def from_dict(cls, go, source=''):
+        """
+        Compile the GO dictionary created by parse_go.
+
+        Args:
+            go (dict): the GO data.
+            source (optional; str): the signature of the file go came from.
+
+        Returns:
+            GOData
+
+        """
+        graph = GOGraph.from_dict(go)
+        annotations = Annotations.from_dict(go, graph)
+        terms = graph.terms.tolist()
+        namespace_codes, namespace_table = pandas.factorize(
+                [go[t]['namespace'] for t in terms], sort=True)
+        columns = {
+            'terms': terms,
+            'namespace_table': list(namespace_table),
+            'name': [go[t]['name'] for t in terms],
+            'def': [go[t]['def'] for t in terms],
+            'genes': list(annotations.genes),
+            'evidence_codes': list(annotations.evidence_codes)
+            }
+        arrays = {
+            'children_indptr': graph.children_indptr,
+            'children_indices': graph.children_indices,
+            'namespace_codes': namespace_codes.astype(numpy.int8),
+            'annotation_term': annotations.term,
+            'annotation_gene': annotations.gene,
+            'annotation_code': annotations.code,
+            'source': numpy.array(source)
+            }
+        for c, values in columns.items():
+            arrays[c + '_text'], arrays[c + '_offsets'] = resources.encode_strings(values)
+        return cls(arrays)
+
+    def save(self, dirname):
+        """
+        Save the arrays to a directory with resources.save_arrays.
+
+        Args:
+            dirname (str)
+
+        Returns:
+            None
+
+        """
+        resources.save_arrays(dirname, {name: self.arrays[name] for name in self.names},
+                              str(self.arrays['source']))
+
+    @classmethod
+    def load(cls, dirname, source=None, mmap=True):
+        """
+        Load the arrays from a directory.
+
+        Args:
+            dirname (str)
+            source (optional; str): if given, only load the data if it came
+                from a file with this signature.
+            mmap (optional; bool): memory map the arrays instead of reading them.
+
+        Returns:
+            GOData or None
+
+        """
+        filenames = {name: os.path.join(dirname, name + '.npy') for name in cls.names}
+        if not all(os.path.exists(f) for f in filenames.values()):
+            return None
+        signature = resources.saved_signature(dirname)
+        if signature is None or (source is not None and signature != source):
+            return None
+        mmap_mode = 'r' if mmap else None
+        arrays = {name: numpy.load(f, mmap_mode=mmap_mode)
+                  for name, f in filenames.items()}
+        arrays['source'] = numpy.array(signature)
+        return cls(arrays)
+
+    def strings(self, column):
+        """
+        Decode one of the string columns.
+
+        Args:
+            column (str): e.g., 'terms' or 'genes'
+
+        Returns:
+            numpy array: object array of str
+
+        """
+        return resources.decode_strings(self.arrays[column + '_text'],
+                                        self.arrays[column + '_offsets'])
+
+    def graph(self):
+        """
+        Build the GO graph.
+
+        Returns:
+            GOGraph
+
+        """
+        return GOGraph(self.strings('terms'), self.arrays['children_indptr'],
+                       self.arrays['children_indices'])
+
+    def annotations(self):
+        """
+        Build the gene annotations.
+
+        Returns:
+            Annotations
+
+        """
+        return Annotations(self.strings('genes'), self.strings('evidence_codes'),
+                           len(self), self.arrays['annotation_term'],
+                           self.arrays['annotation_gene'],
+                           self.arrays['annotation_code'])
+
+    def namespaces(self):
+        """
+        Get the namespace of each term.
+
+        Returns:
+            numpy array ~ (num_terms,)
+
+        """
+        return self.strings('namespace_table')[self.arrays['namespace_codes']]
+
+    def text(self, field, index):
+        """
+        Decode the name or definition of one term.
+
+        Args:
+            field (str): 'name' or 'def'
+            index (int): the position of the term
+
+        Returns:
+            str
+
+        """
+        offsets = self.arrays[field + '_offsets']
+        text = self.arrays[field + '_text']
+        return text[offsets[index]:offsets[index+1]].tobytes().decode('utf-8')
+
+    def texts(self, field):
+        """
+        Decode the names or definitions of all of the terms.
+
+        Args:
+            field (str): 'name', 'def', or 'namespace'
+
+        Returns:
+            List[str]
+
+        """
+        if field == 'namespace':
+            return self.namespaces().tolist()
+        return self.strings(field).tolist()
+
+
+class GOTerm(Mapping):
+    """
+    A read-only view of a GO term that looks like an entry of go.json.
+    The fields are read from the compiled data when they are accessed.
+
+    """
+    fields = ['name', 'namespace', 'def', 'parents', 'children', 'genes']
+
+    def __init__(self, searcher, index):
+        self.searcher = searcher
+        self.index = index
+
+    def __getitem__(self, field):
+        graph = self.searcher.graph
+        if field in GOData.text_fields:
+            return self.searcher.data.text(field, self.index)
+        if field == 'namespace':
+            return str(self.searcher.namespaces[self.index])
+        if field == 'children':
+            return graph.get_terms(
+                    _csr_gather(graph.children_indptr, graph.children_indices, [self.index]))
+        if field == 'parents':
+            return graph.get_terms(
+                    _csr_gather(graph.parents_indptr, graph.parents_indices, [self.index]))
+        if field == 'genes':
+            annotations = self.searcher.annotations
+            rows = annotations.rows_for_terms([self.index])
+            genes = annotations.genes.values[annotations.gene[rows]]
+            codes = annotations.code[rows]
+            return {c: genes[codes == i].tolist()
+                    for i, c in enumerate(annotations.evidence_codes)}
+        raise KeyError(field)
+
+    def __iter__(self):
+        return iter(self.fields)
+
+    def __len__(self):
+        return len(self.fields)
+
+
+class GOTerms(Mapping):
+    """
+    A read-only, dict-like view of the GO data keyed by GO id.
+
+    """
+    def __init__(self, searcher):
+        self.searcher = searcher
+
+    def __getitem__(self, term):
+        return GOTerm(self.searcher, self.searcher.graph.index[term])
+
+    def __contains__(self, term):
+        return term in self.searcher.graph.index
+
+    def __iter__(self):
+        return iter(self.searcher.graph.index)
+
+    def __len__(self):
+        return len(self.searcher.graph)
+
+
+class TextIndex(object):
+    """
+    An inverted index over the text fields of the Gene Ontology.
+
+    Each field (e.g., 'name' or 'def') is lowercased and split into
+    alphanumeric tokens the first time it is searched. The index holds
+    the terms that contain each token, the number of times the token occurs,
+    and the token sequence of each term for phrase matching.
+
+    Attributes:
+        k1 (float): BM25 term frequency saturation.
+        b (float): BM25 length normalization.
+
+    """
+    fields = GOData.text_fields + ['namespace']
+
+    def __init__(self, data, graph, k1=1.2, b=0.75):
+        """
+        Create an index over the text of the GO terms.
+        Fields are indexed the first time they are used.
+
+        Args:
+            data (GOData): the compiled GO data.
+            graph (GOGraph): the compiled GO graph.
+            k1 (optional; float): BM25 term frequency saturation.
+            b (optional; float): BM25 length normalization.
+
+        Returns:
+            TextIndex
+
+        """
+        self.data = data
+        self.graph = graph
+        self.k1 = k1
+        self.b = b
+        self._fields = {}
+
+    def _field(self, field):
+        """
+        Get the index of a field, building it if necessary.
+
+        Args:
+            field (str)
+
+        Returns:
+            dict
+
+        """
+        if field not in self.fields:
+            raise ValueError("Cannot index the field '{}'; the text fields are {}"
+                             .format(field, ', '.join(self.fields)))
+        if field not in self._fields:
+            texts = self.data.texts(field)
+            tokens = [TOKEN.findall(text.lower()) for text in texts]
+            lengths = numpy.array([len(t) for t in tokens], dtype=numpy.int64)
+            codes, vocab = pandas.factorize([w for t in tokens for w in t])
+            vocab = pandas.Index(vocab, dtype=object)
+            num_terms, num_tokens = len(texts), len(vocab)
+            docs = numpy.repeat(numpy.arange(num_terms, dtype=numpy.int64), lengths)
+            # sort by (token, term) and count the occurrences
+            key, tf = numpy.unique(codes * num_terms + docs, return_counts=True)
+            counts = numpy.bincount(key // num_terms, minlength=num_tokens)
+            order = numpy.argsort(vocab.values.astype(str))
+            self._fields[field] = {
+                'texts': texts,
+                'vocab': vocab,
+                'sorted_vocab': vocab.values.astype(str)[order],
+                'sorted_ids': order,
+                'indptr': numpy.concatenate([[0], numpy.cumsum(counts)]),
+                'terms': (key % num_terms).astype(numpy.int32),
+                'tf': tf.astype(numpy.int32),
+                'stream': codes,
+                'stream_indptr': numpy.concatenate([[0], numpy.cumsum(lengths)]),
+                'lengths': lengths,
+                'mean_length': max(lengths.mean(), 1) if num_terms else 1
+                }
+        return self._fields[field]
+
+    def _token_ids(self, index, token, prefix=False):
+        """
+        Get the ids of the tokens in the vocabulary that match a token.
+
+        Args:
+            index (dict): the index of a field
+            token (str)
+            prefix (optional; bool): match all tokens that begin with token
+
+        Returns:
+            numpy array
+
+        """
+        if not prefix:
+            i = index['vocab'].get_indexer([token])
+            return i[i >= 0]
+        lo = numpy.searchsorted(index['sorted_vocab'], token, side='left')
+        hi = numpy.searchsorted(index['sorted_vocab'], token + '\uffff', side='left')
+        return index['sorted_ids'][lo:hi]
+
+    @staticmethod
+    def _substring_ids(index, part):
+        """
+        Get the ids of the tokens in the vocabulary that contain a string.
+
+        Tokens are looked up by the trigrams of the string, from a map of
+        each trigram to the tokens that contain it. Strings shorter than a
+        trigram are found with one search of the vocabulary joined into a
+        single string. Both are built the first time they are needed.
+
+        Args:
+            index (dict): the index of a field
+            part (str): lowercase alphanumeric characters
+
+        Returns:
+            numpy array
+
+        """
+        vocab = index['sorted_vocab']
+        if len(part) < 3:
+            if 'joined' not in index:
+                words = vocab.tolist()
+                index['joined'] = '\n'.join(words)
+                index['starts'] = numpy.cumsum([0] + [len(w) + 1 for w in words[:-1]])
+            positions = [m.start() for m in re.finditer(re.escape(part), index['joined'])]
+            tokens = numpy.searchsorted(index['starts'], positions, side='right') - 1
+            return index['sorted_ids'][numpy.unique(tokens)]
+        if 'trigrams' not in index:
+            grams = {}
+            for i, word in enumerate(vocab.tolist()):
+                for g in {word[j:j+3] for j in range(len(word) - 2)}:
+                    grams.setdefault(g, []).append(i)
+            index['trigrams'] = {g: numpy.array(ids) for g, ids in grams.items()}
+        empty = numpy.zeros(0, dtype=numpy.int64)
+        postings = sorted((index['trigrams'].get(part[j:j+3], empty)
+                           for j in range(len(part) - 2)), key=len)
+        candidates = postings[0]
+        for p in postings[1:]:
+            candidates = numpy.intersect1d(candidates, p, assume_unique=True)
+        candidates = [i for i in candidates.tolist() if part in vocab[i]]
+        return index['sorted_ids'][candidates]
+
+    def _postings(self, index, token_ids):
+        """
+        Get the terms and term frequencies of some tokens.
+
+        Args:
+            index (dict): the index of a field
+            token_ids (numpy array)
+
+        Returns:
+            terms (numpy array), tf (numpy array)
+
+        """
+        rows = _csr_positions(index['indptr'], token_ids)
+        return index['terms'][rows], index['tf'][rows]
+
+    def contains(self, keywords, fields):
+        """
+        Find the GO terms with a field that contains any of some keywords.
+        This is a case sensitive substring match, like the `in` operator.
+
+        Candidates are found from the tokens of the vocabulary that contain
+        the longest alphanumeric part of the keyword, then checked exactly.
+
+        Args:
+            keywords (List[str]): words to look for
+            fields (List[str]): fields to look in
+
+        Returns:
+            numpy array ~ (num_terms,): boolean mask
+
+        """
+        mask = numpy.zeros(len(self.graph), dtype=bool)
+        for field in fields:
+            index = self._field(field)
+            texts = index['texts']
+            for keyword in keywords:
+                parts = TOKEN.findall(keyword.lower())
+                if parts:
+                    longest = max(parts, key=len)
+                    token_ids = self._substring_ids(index, longest)
+                    candidates = numpy.unique(self._postings(index, token_ids)[0])
+                else:
+                    candidates = numpy.arange(len(texts))
+                candidates = candidates[~mask[candidates]]
+                hits = [i for i in candidates if keyword in texts[i]]
+                mask[hits] = True
+        return mask
+
+    def _clause_matches(self, index, clause, prefix):
+        """
+        Find the terms that match a query clause and their BM25 scores.
+        A clause is a token or a phrase (a list of tokens that must occur
+        consecutively).
+
+        Args:
+            index (dict): the index of a field
+            clause (List[str]): tokens
+            prefix (bool): allow the last token of the clause to be a prefix
+
+        Returns:
+            terms (numpy array), scores (numpy array)
+
+        """
+        num_terms = len(index['texts'])
+        token_ids = [self._token_ids(index, t, prefix and j == len(clause) - 1)
+                     for j, t in enumerate(clause)]
+        scores = numpy.zeros(num_terms)
+        matched = numpy.ones(num_terms, dtype=bool)
+        for ids in token_ids:
+            terms, tf = self._postings(index, ids)
+            df = numpy.bincount(terms, minlength=num_terms)
+            present = df > 0
+            matched &= present
+            # document frequency of a prefix is the number of terms matching it
+            n = present.sum()
+            idf = numpy.log(1 + (num_terms - n + 0.5) / (n + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * index['lengths'][terms] /
+                              index['mean_length'])
+            numpy.add.at(scores, terms, idf * tf * (self.k1 + 1) / (tf + norm))
+        terms = numpy.flatnonzero(matched)
+        if len(clause) > 1:
+            terms = self._with_phrase(index, terms, token_ids)
+        return terms, scores[terms]
+
+    @staticmethod
+    def _with_phrase(index, terms, token_ids):
+        """
+        Select the terms whose token sequence contains a phrase.
+
+        Args:
+            index (dict): the index of a field
+            terms (numpy array): candidate terms
+            token_ids (List[numpy array]): the allowed token ids at each
+                position of the phrase
+
+        Returns:
+            numpy array: the terms that contain the phrase
+
+        """
+        positions = _csr_positions(index['stream_indptr'], terms)
+        stream = index['stream'][positions]
+        owner = numpy.repeat(numpy.arange(len(terms)),
+                             numpy.diff(index['stream_indptr'])[terms])
+        num_starts = len(stream) - len(token_ids) + 1
+        if num_starts <= 0:
+            return terms[:0]
+        starts = numpy.ones(num_starts, dtype=bool)
+        for j, ids in enumerate(token_ids):
+            starts &= numpy.isin(stream[j:num_starts + j], ids)
+            starts &= owner[j:num_starts + j] == owner[:num_starts]
+        return terms[numpy.unique(owner[:num_starts][starts])]
+
+    def search(self, query, fields, prefix=False):
+        """
+        Find the GO terms that match all of the clauses of a query.
+
+        A query is a string of tokens and "quoted phrases". A token
+        ending in '*' matches any token that begins with it.
+
+        Args:
+            query (str)
+            fields (List[str]): fields to look in
+            prefix (optional; bool): treat the last token of every clause as
+                a prefix
+
+        Returns:
+            terms (numpy array), scores (numpy array): the matching terms
+                and their BM25 scores summed over the fields
+
+        """
+        clauses = []
+        for phrase, word in QUERY.findall(query):
+            text = (phrase or word).lower()
+            tokens = TOKEN.findall(text)
+            if tokens:
+                clauses.append((tokens, prefix or text.endswith('*')))
+        num_terms = len(self.graph)
+        matched = numpy.ones(num_terms, dtype=bool) if clauses \
+                  else numpy.zeros(num_terms, dtype=bool)
+        scores = numpy.zeros(num_terms)
+        for tokens, is_prefix in clauses:
+            clause_matched = numpy.zeros(num_terms, dtype=bool)
+            for field in fields:
+                terms, s = self._clause_matches(self._field(field), tokens, is_prefix)
+                clause_matched[terms] = True
+                scores[terms] += s
+            matched &= clause_matched
+        terms = numpy.flatnonzero(matched)
+        return terms, scores[terms]
+
+
+class Query(object):
+    """
+    A boolean query over GO terms.
+
+    Queries are evaluated by a Searcher into a boolean mask over the terms
+    of its GOGraph and can be combined with & (and), | (or) and ~ (not).
+
+    Example:
+        (Keyword('apoptosis') | Keyword('cell death')) & ~TermID('GO:0006915')
+
+    """
+    def evaluate(self, searcher):
+        """
+        Evaluate the query.
+
+        Args:
+            searcher (Searcher)
+
+        Returns:
+            numpy array ~ (num_terms,): boolean mask
+
+        """
+        raise NotImplementedError
+
+    def __and__(self, other):
+        return And(self, other)
+
+    def __or__(self, other):
+        return Or(self, other)
+
+    def __invert__(self):
+        return Not(self)
+
+
+class Keyword(Query):
+    """
+    Match the GO terms with a field that contains a keyword.
+
+    Attributes:
+        keyword (str)
+        fields (List[str])
+
+    """
+    def __init__(self, keyword, fields=['name', 'def']):
+        """
+        Create a keyword query.
+
+        Args:
+            keyword (str): word to look for
+            fields (optional; List[str]): fields to look in
+
+        Returns:
+            Keyword
+
+        """
+        self.keyword = keyword
+        self.fields = fields
+
+    def evaluate(self, searcher):
+        indexed = [f for f in self.fields if f in TextIndex.fields]
+        others = [f for f in self.fields if f not in TextIndex.fields]
+        mask = searcher.text_index.contains([self.keyword], indexed)
+        if others:
+            # other fields, e.g., 'children', are not text and are checked
+            # term by term with the `in` operator
+            mask |= numpy.array([any(self.keyword in searcher.go[t][f] for f in others)
+                                 for t in searcher.graph.terms.tolist()], dtype=bool)
+        return mask
+
+
+class TermID(Query):
+    """
+    Match some GO ids. Ids that are not in the ontology match nothing.
+
+    Attributes:
+        terms (List[str])
+
+    """
+    def __init__(self, terms):
+        """
+        Create a GO id query.
+
+        Args:
+            terms (str or List[str]): GO ids
+
+        Returns:
+            TermID
+
+        """
+        self.terms = [terms] if isinstance(terms, str) else list(terms)
+
+    def evaluate(self, searcher):
+        mask = numpy.zeros(len(searcher.graph), dtype=bool)
+        known = [t for t in self.terms if t in searcher.graph.index]
+        mask[searcher.graph.get_indices(known)] = True
+        return mask
+
+
+class Namespace(Query):
+    """
+    Match the GO terms in a namespace.
+
+    Attributes:
+        namespace (str)
+
+    """
+    def __init__(self, namespace):
+        """
+        Create a namespace query.
+
+        Args:
+            namespace (str): e.g., 'biological_process'
+
+        Returns:
+            Namespace
+
+        """
+        self.namespace = namespace
+
+    def evaluate(self, searcher):
+        return searcher.namespaces == self.namespace
+
+
+class And(Query):
+    """
+    Match the GO terms that match all of some queries.
+
+    Attributes:
+        queries (List[Query])
+
+    """
+    def __init__(self, *queries):
+        self.queries = list(queries)
+
+    def evaluate(self, searcher):
+        mask = numpy.ones(len(searcher.graph), dtype=bool)
+        for query in self.queries:
+            mask &= query.evaluate(searcher)
+        return mask
+
+
+class Or(Query):
+    """
+    Match the GO terms that match any of some queries.
+
+    Attributes:
+        queries (List[Query])
+
+    """
+    def __init__(self, *queries):
+        self.queries = list(queries)
+
+    def evaluate(self, searcher):
+        mask = numpy.zeros(len(searcher.graph), dtype=bool)
+        for query in self.queries:
+            mask |= query.evaluate(searcher)
+        return mask
+
+
+class Not(Query):
+    """
+    Match the GO terms that do not match a query.
+
+    Attributes:
+        query (Query)
+
+    """
+    def __init__(self, query):
+        self.query = query
+
+    def evaluate(self, searcher):
+        return ~self.query.evaluate(searcher)
+
+
+def _load_attributes():
+    """
+    Read the gene attributes.
+
+    Args:
+        None
+
+    Returns:
+        dict
+
+    """
+    with open(ATTRIBUTENAME, 'r') as infile:
+        return json.load(infile)
+
+
+def load_go_data(dirname=GODATANAME, source=GONAME):
+    """
+    Load the compact GO data, compiling it from go.json if it is missing
+    or was compiled from different contents of go.json.
+
+    Args:
+        dirname (optional; str): the directory of the compact data.
+        source (optional; str): the go.json file created by parse_go.
+
+    Returns:
+        GOData
+
+    """
+    signature = resources.file_hash(source) if os.path.exists(source) else None
+    data = GOData.load(dirname, signature)
+    if data is None:
+        with open(source, 'r') as infile:
+            data = GOData.from_dict(json.load(infile), signature)
+        try:
+            data.save(dirname)
+            data = GOData.load(dirname, signature)
+        except OSError as err:
+            warnings.warn("Could not save the compact GO data: {}".format(err))
+    return data
 
 
 class Searcher(object):
     """
     A utility for searching the Gene Ontology.
 
+    The compiled GO data, annotations, text index, and gene attributes are
+    loaded once per process and shared through genemunge.resources.
+
     Attributes:
-        go (dict): the GO data.
+        data (GOData): the GO data in a compact, memory mapped format.
+        go (GOTerms): a read-only, dict-like view of the GO data.
+        graph (GOGraph): the GO data compiled into integer arrays.
+        namespaces (numpy array ~ (num_terms,)): the namespace of each term
+            in the graph.
+        closure (ClosureCache or None): cached descendants and ancestors.
+        annotations (Annotations): the gene annotations compiled into
+            integer arrays.
+        text_index (TextIndex): an inverted index over the text of the terms.
         attributes (dict): gene attributes
 
     """
-    def __init__(self):
+    def __init__(self, cache_closure=False, closure_max_bytes=None,
+                 precompute_propagated=False):
         """
         Create a object to search through the Gene Ontology.
 
         Args:
-            None
+            cache_closure (optional; bool): cache the descendants and ancestors
+                of each term so that repeated traversals are lookups.
+            closure_max_bytes (optional; int): a memory budget for the cache.
+                If None, the full closure is computed and saved next to go.json.
+            precompute_propagated (optional; bool): compute the genes
+                associated with each term and all of its descendants now,
+                instead of the first time they are needed.
 
         Returns:
             Searcher
 
         """
-        with open(GONAME, 'r') as infile:
-            self.go = json.load(infile)
-        with open(ATTRIBUTENAME, 'r') as infile:
-            self.attributes = json.load(infile)
+        # the compiled data are shared by all Searchers in the process
+        self.data = resources.get('go_data', load_go_data)
+        self.attributes = resources.get('gene_attributes', _load_attributes)
+        self.graph = resources.get('go_graph', self.data.graph)
+        self.namespaces = resources.get('go_namespaces', self.data.namespaces)
+        self.go = GOTerms(self)
+        self.closure = None
+        if cache_closure:
+            self.closure = ClosureCache(self.graph, max_bytes=closure_max_bytes)
+        self.annotations = resources.get('go_annotations', self.data.annotations)
+        self._membership = resources.get('go_membership', dict)
+        self.text_index = resources.get('go_text_index',
+                                        lambda: TextIndex(self.data, self.graph))
+        if precompute_propagated:
+            self.membership_matrix(propagate=True)
+
+    def _closure(self, direction, sources, inclusive=True):
+        """
+        Get the descendants or ancestors of some terms, from the closure cache
+        if there is one.
+
+        Args:
+            direction (str): 'descendants' or 'ancestors'
+            sources (numpy array): integer positions of the terms
+            inclusive (optional; bool): include the sources in the result
+
+        Returns:
+            numpy array: sorted integer positions
+
+        """
+        if self.closure is None:
+            return getattr(self.graph, direction)(sources, inclusive)
+        lookup = getattr(self.closure, direction)
+        closures = [lookup(i) for i in sources]
+        if not inclusive:
+            closures = [c[c != i] for c, i in zip(closures, sources)]
+        if len(closures) == 1:
+            return closures[0]
+        return numpy.unique(numpy.concatenate(closures))
 
     def traverse(self, term, inclusive=True):
         """
@@ -46,46 +1785,68 @@ class Searcher(object):
             list of GO ids (List[str])
 
         """
-        descendants = set([term]) if inclusive else set([])
-        children = [term]
-        descendant_count = -1
+        source = self.graph.get_indices([term])
+        return self.graph.get_terms(self._closure('descendants', source, inclusive))
 
-        while descendant_count < len(descendants):
-            descendant_count = len(descendants)
-            children = set(sum([self.go[t]['children'] for t in children], []))
-            children = children - set(descendants)
-            descendants = descendants.union(children)
+    def traverse_many(self, terms, inclusive=True):
+        """
+        Get all of the children of each of a list of GO categories.
 
-        return list(descendants)
+        Work is shared between terms with overlapping subtrees, so this is
+        much faster than calling traverse on each term.
+
+        Args:
+            terms (List[str]): GO ids
+            inclusive (optional; bool): include each given term in its
+                list of GO ids
+
+        Returns:
+            dict {str: List[str]}: the GO ids below each given term
 
-    def select_namespace(self, namespace):
         """
-        Get all of the GO identifiers associated with a particular namespace.
+        sources = self.graph.get_indices(terms)
+        if self.closure is None:
+            descendants = self.graph.descendants_many(sources)
+        else:
+            descendants = {i: self.closure.descendants(i) for i in sources}
+        result = {}
+        for term, i in zip(terms, sources):
+            d = descendants[i]
+            if not inclusive:
+                d = d[d != i]
+            result[term] = self.graph.get_terms(d)
+        return result
+
+    def ancestors(self, term, inclusive=True):
+        """
+        Get all of the parents of a given GO category, all the way up to the
+        root of its namespace.
 
         Args:
-            namespace (str): 'biological_process' or 'molecular_function'
+            term (str): GO id
+            inclusive (optional; bool): include the given term in the final
+                list of GO ids
 
         Returns:
-            list of go ids (List[str])
-
+            list of GO ids (List[str])
 
         """
-        return sorted([term for term in self.go if self.go[term]['namespace'] == namespace])
+        source = self.graph.get_indices([term])
+        return self.graph.get_terms(self._closure('ancestors', source, inclusive))
 
-    def _keyword_match(self, term, keyword, fields):
+    def select_namespace(self, namespace):
         """
-        Check if any of the fields of a given term of the gene ontology
-        are (or are not) associated with a given keyword.
+        Get all of the GO identifiers associated with a particular namespace.
 
         Args:
-            term (str): a GO id
-            keyword (str): keyword to look for
-            fields (List[str]): fields to look in
+            namespace (str): 'biological_process' or 'molecular_function'
+
         Returns:
-            bool
+            list of go ids (List[str])
+
 
         """
-        return any(keyword in self.go[term][f] for f in fields)
+        return self.graph.get_terms(numpy.flatnonzero(self.namespaces == namespace))
 
     def keyword_search(self, keywords, fields=['name', 'def'], exact=True,
                        exclude_keywords=None, exclude_ids=None):
@@ -107,38 +1868,72 @@ class Searcher(object):
 
         """
         assert type(keywords) == list, "keywords must be a list"
-        matches = [term for term in self.go if
-                   any(self._keyword_match(term, k, fields) for k in keywords)]
-        anti_matches = [] if exclude_keywords is None else [term for term in self.go if
-                   any(self._keyword_match(term, k, fields) for k in exclude_keywords)]
-        anti_ids = [] if exclude_ids is None else exclude_ids
-        # TODO: this exclusion works with 'exact' but doesn't exclude
-        # things that are picked up while traversing the graph
-        exact_terms = list(set(matches) - set(anti_matches) - set(anti_ids))
+        exclusions = [Keyword(k, fields) for k in exclude_keywords or []]
+        if exclude_ids is not None:
+            exclusions.append(TermID(exclude_ids))
+        return self.query(Or(*[Keyword(k, fields) for k in keywords]),
+                          exact=exact, exclude=Or(*exclusions))
+
+    def query(self, query, exact=True, exclude=None):
+        """
+        Search for GO identifiers that match a boolean query.
+
+        Example:
+            searcher.query(Keyword('apoptosis') & Namespace('biological_process'),
+                           exact=False, exclude=Keyword('neuron'))
+
+        Args:
+            query (Query): the terms to select
+            exact (optional; bool): if true, then this function only returns
+                the GO ids that match the query. if false, then this function
+                will also select all of the child GO terms.
+            exclude (optional; Query): do NOT include GO categories that match
+                this query. While traversing, excluded categories are not
+                entered, so their children are only selected if they can be
+                reached without passing through an excluded category.
+
+        Returns:
+            list of GO ids (List[str])
+
+        """
+        matches = query.evaluate(self)
+        excluded = None if exclude is None else exclude.evaluate(self)
+        if excluded is not None:
+            matches &= ~excluded
+        sources = numpy.flatnonzero(matches)
         if exact:
-            return exact_terms
-        return sorted(list(set(chain.from_iterable([self.traverse(t) for t in exact_terms]))))
+            return self.graph.get_terms(sources)
+        if excluded is None or not excluded.any():
+            return self.graph.get_terms(self._closure('descendants', sources))
+        return self.graph.get_terms(self.graph.descendants(sources, blocked=excluded))
 
-    def _get_proteins_from_term(self, term, evidence_codes):
+    def ranked_search(self, query, fields=['name', 'def'], prefix=False,
+                      limit=None):
         """
-        Get all of the genes associated with a
-        given GO identifier and some evidence codes.
+        Search for GO identifiers that match a query, ordered by relevance.
+
+        The query is a string of words and "quoted phrases", all of which
+        must occur in at least one of the fields. A word ending in '*'
+        matches any word that begins with it, e.g. 'apopto*'. Matching
+        ignores case and punctuation. Results are ranked by their BM25
+        scores, summed over the fields.
 
         Args:
-            term (str): a GO id
-            evidence_codes (None or List[str]):
+            query (str): e.g. '"cell cycle" kinase'
+            fields (List[str]): fields to look in
+            prefix (optional; bool): treat every word (and the last word of
+                every phrase) as a prefix
+            limit (optional; int): the maximum number of results
 
         Returns:
-            genes (List[str]): list of genes by UniprotKB id
+            List[Tuple[str, float]]: (GO id, score) pairs, best first
 
         """
-        proteins = []
-        codes = evidence_codes or self.go[term]["genes"].keys()
-        for code in codes:
-            proteins += self.go[term]["genes"][code]
-        return proteins
+        terms, scores = self.text_index.search(query, fields, prefix)
+        order = numpy.lexsort((terms, -scores))[:limit]
+        return list(zip(self.graph.get_terms(terms[order]), scores[order].tolist()))
 
-    def get_genes(self, terms, evidence_codes = None):
+    def get_genes(self, terms, evidence_codes=None, propagate=False, mask=None):
         """
         Get all of the genes associated with a list of
         GO idenifiers and some evidence codes.
@@ -146,16 +1941,290 @@ class Searcher(object):
         Args:
             terms (List[str]): a list of GO ids
             evidence_codes (None or List[str]):
+            propagate (optional; bool): also get the genes associated with
+                all of the descendants of the GO ids
+            mask (optional; numpy array): only keep the genes in a boolean
+                mask over the genes of convert.GeneUniverse('ensembl_gene_id')
+
+        Returns:
+            genes (List[str]): list of genes by ensembl_gene_id
+
+        """
+        if evidence_codes is not None:
+            assert type(evidence_codes) == list, \
+            "evidence_codes must be None or a list of GO evidence codes"
+        matrix, _, genes = self.membership_matrix(evidence_codes, propagate)
+        columns = numpy.unique(_csr_gather(matrix.indptr, matrix.indices,
+                                           self.graph.get_indices(terms)))
+        if mask is not None:
+            positions = self._universe_positions().take(columns)
+            columns = columns[(positions >= 0) & mask.take(positions)]
+        return genes[columns].tolist()
+
+    def _universe_positions(self):
+        """
+        Get the position of each annotated gene in the gene universe.
+
+        Returns:
+            numpy array ~ (num_genes,): -1 for genes that are not in the universe
+
+        """
+        return resources.get('go_universe_positions',
+                lambda: convert.GeneUniverse('ensembl_gene_id').align(self.annotations.genes))
+
+    def _membership_filename(self, evidence_codes, propagate):
+        """
+        Get the file that a membership matrix is saved to.
+        The name is a hash of the signature of the GO data, the evidence
+        codes, and whether the annotations are propagated.
+
+        Args:
+            evidence_codes (None or Tuple[str]): sorted evidence codes
+            propagate (bool)
+
+        Returns:
+            str or None: None if the GO data has no signature
+
+        """
+        source = str(self.data['source'])
+        if not source:
+            return None
+        key = repr((source, evidence_codes, propagate)).encode('utf-8')
+        return os.path.join(MEMBERSHIPNAME,
+                            hashlib.sha1(key).hexdigest() + '.npz')
+
+    def _save_membership(self, filename, matrix):
+        """
+        Save a membership matrix, if there is a filename.
+        The matrix is written to a temporary file that is renamed when it
+        is complete, so an interrupted save leaves no partial matrix.
+
+        Args:
+            filename (str or None)
+            matrix (scipy.sparse.csr_matrix)
+
+        Returns:
+            None
+
+        """
+        if filename is None:
+            return
+        try:
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+            partial = filename[:-len('.npz')] + '.partial.npz'
+            sparse.save_npz(partial, matrix)
+            os.replace(partial, filename)
+        except OSError as err:
+            warnings.warn("Could not save the GO membership matrix: {}".format(err))
+
+    def membership_matrix(self, evidence_codes=None, propagate=False):
+        """
+        Get a sparse matrix of the genes associated with each GO identifier.
+
+        Entry (i, j) is 1 if term i is annotated with gene j by one of the
+        evidence codes. If propagate is true, then the genes of every
+        descendant of a term are associated with the term as well.
+        Each matrix is saved next to the compact GO data the first time it
+        is built, and loaded from there by later processes.
+
+        Args:
+            evidence_codes (None or List[str]):
+            propagate (optional; bool): associate genes with all of the
+                ancestors of their GO terms
+
+        Returns:
+            matrix (scipy.sparse.csr_matrix ~ (num_terms, num_genes)),
+            terms (pandas.Index): the GO id of each row,
+            genes (pandas.Index): the ensembl_gene_id of each column
+
+        """
+        if evidence_codes is not None:
+            assert type(evidence_codes) == list, \
+            "evidence_codes must be None or a list of GO evidence codes"
+        key = (None if evidence_codes is None else tuple(sorted(evidence_codes)),
+               propagate)
+        if key not in self._membership:
+            filename = self._membership_filename(*key)
+            if filename is not None and os.path.exists(filename):
+                matrix = sparse.load_npz(filename).tocsr()
+            else:
+                if propagate:
+                    direct, _, _ = self.membership_matrix(evidence_codes)
+                    matrix = self.graph.propagate(direct)
+                else:
+                    matrix = self.annotations.matrix(evidence_codes)
+                self._save_membership(filename, matrix)
+            self._membership[key] = matrix
+        terms = pandas.Index(self.graph.terms)
+        return self._membership[key], terms, self.annotations.genes
+
+    def _enrichment(self, gene_lists, universe, evidence_codes, namespace,
+                    min_size, max_size, propagate):
+        """
+        Test many gene lists for over-representation in every GO category.
+        See batch_enrichment.
+
+        Returns:
+            table (pandas.DataFrame): see batch_enrichment
+            tested_terms (pandas.Index): the GO ids of the tested categories
+
+        """
+        if not isinstance(gene_lists, dict):
+            gene_lists = dict(enumerate(gene_lists))
+        matrix, terms, genes = self.membership_matrix(evidence_codes, propagate)
+        selected = numpy.ones(len(terms), dtype=bool)
+        if namespace is not None:
+            selected &= self.namespaces == namespace
+        in_universe = numpy.ones(len(genes), dtype=bool) if universe is None \
+                      else genes.isin(universe)
+        matrix = matrix[numpy.flatnonzero(selected)][:, numpy.flatnonzero(in_universe)]
+        genes = genes[in_universe]
+        # restrict the universe to the genes that are annotated at all
+        annotated = numpy.asarray(matrix.sum(axis=0)).ravel() > 0
+        term_sizes = numpy.asarray(matrix[:, annotated].sum(axis=1)).ravel()
+        tested = term_sizes >= min_size
+        if max_size is not None:
+            tested &= term_sizes <= max_size
+        matrix = matrix[numpy.flatnonzero(tested)][:, numpy.flatnonzero(annotated)]
+        genes, term_sizes = genes[annotated], term_sizes[tested]
+        tested_terms = terms[numpy.flatnonzero(selected)[tested]]
+        # one row per gene list
+        names = list(gene_lists)
+        rows = [numpy.unique(genes.get_indexer(gene_lists[n])) for n in names]
+        rows = [r[r >= 0] for r in rows]
+        list_sizes = numpy.array([len(r) for r in rows], dtype=numpy.int64)
+        lists = sparse.csr_matrix(
+                (numpy.ones(list_sizes.sum(), dtype=numpy.int32),
+                 numpy.concatenate(rows + [numpy.zeros(0, dtype=numpy.int64)]),
+                 numpy.concatenate([[0], numpy.cumsum(list_sizes)])),
+                shape=(len(names), len(genes)))
+        # only the categories that share genes with a list are stored;
+        # the others have a p-value of 1
+        overlap = sparse.csr_matrix(lists.dot(matrix.T))
+        overlap.eliminate_zeros()
+        overlap.sort_indices()
+        row = numpy.repeat(numpy.arange(len(names)), numpy.diff(overlap.indptr))
+        pvalues = _hypergeom_sf(overlap.data, len(genes),
+                                term_sizes[overlap.indices], list_sizes[row])
+        fdr = numpy.empty_like(pvalues)
+        for i in range(len(names)):
+            start, stop = overlap.indptr[i], overlap.indptr[i + 1]
+            fdr[start:stop] = _benjamini_hochberg(pvalues[start:stop],
+                                                  len(tested_terms))
+        table = pandas.DataFrame({
+                'list': pandas.Categorical.from_codes(row, pandas.Index(names)),
+                'term': tested_terms[overlap.indices],
+                'overlap': overlap.data.astype(numpy.int64),
+                'pvalue': pvalues,
+                'fdr': fdr})
+        return table, tested_terms
+
+    def batch_enrichment(self, gene_lists, universe=None, evidence_codes=None,
+                         namespace=None, min_size=1, max_size=None,
+                         propagate=True):
+        """
+        Test many gene lists for over-representation in every GO category
+        at once, using a one-sided hypergeometric test.
+
+        Genes outside of the universe are ignored. The universe is also
+        restricted to the genes annotated to at least one of the tested
+        categories. P-values are adjusted for the number of tested categories
+        by the Benjamini-Hochberg procedure, separately for each gene list.
+
+        Only the categories that share at least one gene with a list are
+        returned; the p-value and fdr of every other tested category are 1.
+
+        Args:
+            gene_lists (dict {str: List[str]} or List[List[str]]): lists of
+                genes by ensembl_gene_id
+            universe (optional; List[str]): all of the genes that could have
+                been in a list. if None, all annotated genes.
+            evidence_codes (None or List[str]):
+            namespace (optional; str): only test categories in this namespace
+            min_size (optional; int): only test categories with at least this
+                many genes in the universe
+            max_size (optional; int): only test categories with at most this
+                many genes in the universe
+            propagate (optional; bool): associate genes with all of the
+                ancestors of their GO terms
 
         Returns:
+            pandas.DataFrame: one row per (gene list, GO id) pair with a
+                non-zero overlap, ordered by gene list and then GO id, with
+                the columns 'list', 'term', 'overlap', 'pvalue' and 'fdr'
+
+        """
+        table, _ = self._enrichment(gene_lists, universe, evidence_codes,
+                                    namespace, min_size, max_size, propagate)
+        return table
+
+    def enrichment(self, genes, universe=None, evidence_codes=None,
+                   namespace=None, min_size=1, max_size=None, propagate=True):
+        """
+        Test a list of genes for over-representation in every GO category,
+        using a one-sided hypergeometric test.
+
+        See batch_enrichment for the details.
+
+        Args:
             genes (List[str]): list of genes by ensembl_gene_id
+            universe (optional; List[str]): all of the genes that could have
+                been in the list. if None, all annotated genes.
+            evidence_codes (None or List[str]):
+            namespace (optional; str): only test categories in this namespace
+            min_size (optional; int): only test categories with at least this
+                many genes in the universe
+            max_size (optional; int): only test categories with at most this
+                many genes in the universe
+            propagate (optional; bool): associate genes with all of the
+                ancestors of their GO terms
+
+        Returns:
+            pandas.DataFrame: one row per tested GO id, sorted by p-value,
+                with the columns 'name', 'overlap', 'pvalue' and 'fdr'
+
+        """
+        result, tested_terms = self._enrichment(
+                [genes], universe, evidence_codes, namespace, min_size,
+                max_size, propagate)
+        table = result.set_index('term')[['overlap', 'pvalue', 'fdr']]
+        table = table.reindex(tested_terms).fillna({'overlap': 0, 'pvalue': 1, 'fdr': 1})
+        table['overlap'] = table['overlap'].astype(numpy.int64)
+        table.insert(0, 'name', [self.go[t]['name'] for t in table.index])
+        return table.sort_values(['pvalue', 'overlap'], ascending=[True, False],
+                                 kind='mergesort')
+
+    def get_terms_for_genes(self, genes, evidence_codes=None):
+        """
+        Get all of the GO identifiers directly associated with each of
+        a list of genes and some evidence codes.
+
+        Args:
+            genes (List[str]): a list of genes by ensembl_gene_id
+            evidence_codes (None or List[str]):
+
+        Returns:
+            dict {str: List[str]}: the GO ids of each gene, sorted.
+                Unknown genes have no GO ids.
 
         """
         if evidence_codes is not None:
             assert type(evidence_codes) == list, \
             "evidence_codes must be None or a list of GO evidence codes"
-        all_proteins = [self._get_proteins_from_term(t, evidence_codes) for t in terms]
-        return sorted(list(set().union(*all_proteins)))
+        annotations = self.annotations
+        positions = annotations.genes.get_indexer(genes)
+        known = positions >= 0
+        rows = annotations.rows_for_genes(positions[known])
+        counts = numpy.diff(annotations.gene_indptr)[positions[known]]
+        code_mask = annotations.code_mask(evidence_codes)
+        keep = numpy.ones(len(rows), dtype=bool) if code_mask is None \
+               else code_mask[annotations.code[rows]]
+        terms = numpy.split(annotations.term[rows], numpy.cumsum(counts)[:-1])
+        keeps = numpy.split(keep, numpy.cumsum(counts)[:-1])
+        result = {gene: [] for gene in genes}
+        for gene, t, k in zip(numpy.asarray(genes)[known], terms, keeps):
+            result[gene] = self.graph.get_terms(numpy.unique(t[k]))
+        return result
 
     def get_housekeeping_genes(self):
         """
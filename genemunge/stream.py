@@ -0,0 +1,229 @@
+import os
+import pandas
+import numpy
+import tables
+
+from . import resources
+
+
+CSV_EXTENSIONS = {'.csv': ',', '.tsv': '\t', '.txt': '\t'}
+HDF_EXTENSIONS = ['.h5', '.hdf', '.hdf5']
+PARQUET_EXTENSIONS = ['.parquet', '.pq']
+
+
+def file_format(filename):
+    """
+    Get the format of a file from its extension.
+
+    Args:
+        filename (str)
+
+    Returns:
+        str: 'csv', 'hdf', or 'parquet'
+
+    """
+    extension = os.path.splitext(filename)[1].lower()
+    if extension in CSV_EXTENSIONS:
+        return 'csv'
+    if extension in HDF_EXTENSIONS:
+        return 'hdf'
+    if extension in PARQUET_EXTENSIONS:
+        return 'parquet'
+    raise ValueError("unknown file format {}".format(extension))
+
+
+def _import_parquet():
+    """
+    Import pyarrow.parquet, which is only needed for parquet files.
+
+    Args:
+        None
+
+    Returns:
+        module
+
+    """
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("reading or writing parquet files requires pyarrow")
+    return pyarrow
+
+
+def num_rows(filename, key='data'):
+    """
+    Get the number of rows in a file, if it can be found without reading it.
+
+    Args:
+        filename (str)
+        key (optional; str): the node of an HDF5 file
+
+    Returns:
+        int or None
+
+    """
+    kind = file_format(filename)
+    if kind == 'hdf':
+        with tables.open_file(filename, 'r') as infile:
+            node = infile.get_node('/' + key)
+            if isinstance(node, tables.Group) and 'values' in node:
+                return len(node.values)
+        with pandas.HDFStore(filename, 'r') as store:
+            return store.get_storer(key).nrows
+    if kind == 'parquet':
+        return _import_parquet().parquet.ParquetFile(filename).metadata.num_rows
+    return None
+
+
+def read_blocks(filename, chunksize=1000, key='data'):
+    """
+    Read a samples x genes matrix in blocks of rows.
+
+    CSV files must have the sample ids in the first column. HDF5 files can
+    be written by BlockWriter or by pandas in 'table' format.
+
+    Args:
+        filename (str): a .csv, .tsv, .h5, or .parquet file
+        chunksize (optional; int): the number of rows in each block
+        key (optional; str): the node of an HDF5 file
+
+    Returns:
+        iterator over pandas.DataFrame ~ (chunksize, num_genes)
+
+    """
+    kind = file_format(filename)
+    if kind == 'csv':
+        sep = CSV_EXTENSIONS[os.path.splitext(filename)[1].lower()]
+        yield from pandas.read_csv(filename, sep=sep, index_col=0, chunksize=chunksize)
+    elif kind == 'hdf':
+        with tables.open_file(filename, 'r') as infile:
+            node = infile.get_node('/' + key)
+            if isinstance(node, tables.Group) and 'values' in node:
+                columns = [c.decode('utf-8') for c in node.columns.read()]
+                for start in range(0, len(node.values), chunksize):
+                    stop = start + chunksize
+                    offsets = node.index_offsets[start:stop+1]
+                    index = resources.decode_strings(
+                            node.index_text[offsets[0]:offsets[-1]], offsets - offsets[0])
+                    yield pandas.DataFrame(node.values[start:stop], index=index,
+                                           columns=columns)
+                return
+        with pandas.HDFStore(filename, 'r') as store:
+            yield from store.select(key, chunksize=chunksize)
+    else:
+        parquet = _import_parquet().parquet
+        for batch in parquet.ParquetFile(filename).iter_batches(batch_size=chunksize):
+            yield batch.to_pandas()
+
+
+class BlockWriter(object):
+    """
+    Write a samples x genes matrix one block of rows at a time.
+
+    HDF5 output is stored as an extendable array of values with arrays of
+    the sample and gene ids, because HDFStore tables cannot hold tens of
+    thousands of columns. The sample ids are UTF-8 bytes with offsets.
+    Use read_blocks to read it back.
+
+    Attributes:
+        filename (str)
+        format (str): 'csv', 'hdf', or 'parquet'
+        key (str): the node of an HDF5 file
+        num_rows (int): the number of rows written so far
+
+    """
+    def __init__(self, filename, key='data'):
+        """
+        Create a BlockWriter. The file is created when the first block
+        is written, and overwritten if it exists.
+
+        Args:
+            filename (str): a .csv, .tsv, .h5, or .parquet file
+            key (optional; str): the node of an HDF5 file
+
+        Returns:
+            BlockWriter
+
+        """
+        self.filename = filename
+        self.format = file_format(filename)
+        self.key = key
+        self.num_rows = 0
+        self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, block):
+        """
+        Append a block of rows.
+
+        Args:
+            block (pandas.DataFrame ~ (num_rows, num_genes))
+
+        Returns:
+            None
+
+        """
+        if self.format == 'csv':
+            sep = CSV_EXTENSIONS[os.path.splitext(self.filename)[1].lower()]
+            block.to_csv(self.filename, sep=sep, mode='w' if self.num_rows == 0 else 'a',
+                         header=self.num_rows == 0)
+        elif self.format == 'hdf':
+            self._write_hdf(block)
+        else:
+            pyarrow = _import_parquet()
+            table = pyarrow.Table.from_pandas(block)
+            if self._file is None:
+                self._file = pyarrow.parquet.ParquetWriter(self.filename, table.schema)
+            self._file.write_table(table)
+        self.num_rows += len(block)
+
+    def _write_hdf(self, block):
+        """
+        Append a block of rows to an HDF5 file.
+
+        Args:
+            block (pandas.DataFrame ~ (num_rows, num_genes))
+
+        Returns:
+            None
+
+        """
+        if self._file is None:
+            self._file = tables.open_file(self.filename, 'w')
+            group = self._file.create_group('/', self.key)
+            self._file.create_earray(group, 'values', obj=block.values)
+            self._file.create_array(group, 'columns',
+                                    obj=numpy.array([str(c).encode('utf-8') for c in block.columns]))
+            self._file.create_earray(group, 'index_text', atom=tables.UInt8Atom(),
+                                     shape=(0,))
+            self._file.create_earray(group, 'index_offsets',
+                                     obj=numpy.zeros(1, dtype=numpy.int64))
+        else:
+            group = self._file.get_node('/' + self.key)
+            group.values.append(block.values.astype(group.values.dtype, copy=False))
+        # the sample ids are stored as by resources.encode_strings, so that
+        # each block is appended at once
+        text, offsets = resources.encode_strings([str(i) for i in block.index])
+        group.index_text.append(text)
+        group.index_offsets.append(offsets[1:] + group.index_offsets[-1])
+
+    def close(self):
+        """
+        Close the file.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -16,6 +16,7 @@ def setup_data():
     """
     import genemunge, subprocess, os
     genemunge.data.downloads.download_everything(force=True)
+    genemunge.convert.build_column_cache()
     genemunge.data.parse_go.make_godict(genemunge.data.parse_go.GOFILE, force=True)
     # process the gene attributes
     genemunge.data.gene_attributes.create_attributes_file()
@@ -67,7 +68,9 @@ setup(name='genemunge',
       packages=find_packages(),
       package_data={'genemunge': ['data/gene_attributes.json',
                                   'data/go.json',
+                                  'data/go_data/*.npy',
                                   'data/hgnc_complete_set.txt',
+                                  'data/hgnc_columns/*.npy',
                                   'data/gtex/gene_info.csv',
                                   'data/gtex/tissue_stats.h5']},
       install_requires=[
@@ -75,6 +78,7 @@ setup(name='genemunge',
           'numpy',
           'pandas',
           'pytest',
+          'scipy',
           'tables',
           'cytoolz'
           ],
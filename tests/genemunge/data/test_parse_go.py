@@ -1,3 +1,6 @@
+import gzip
+
+from genemunge import convert
 from genemunge.data import parse_go
 
 import pytest
@@ -72,5 +75,33 @@ def test_get_parents():
         ['GO:0006355', 'GO:1903047', 'GO:0000082']
 
 
+def test_add_annotations(tmp_path):
+    """Check that annotations with unknown evidence codes are skipped."""
+    godict = {}
+    parse_go.parse_group(example_group, godict)
+    uniprot_id = next(u for u in convert.load_columns(['uniprot_ids'])['uniprot_ids']
+                      if u and '|' not in u)
+    converter = convert.IDConverter('uniprot_ids', 'ensembl_gene_id')
+    ensembl_ids = list(converter.convert_long([uniprot_id])['ensembl_gene_id'])
+
+    gaf = str(tmp_path / 'annotations.gaf.gz')
+    with gzip.open(gaf, 'wb') as f:
+        f.write(b'!gaf-version: 2.2\n')
+        for qualifier, term, evidence in [('enables', 'GO:0000083', 'IDA'),
+                                          ('enables', 'GO:0000083', 'HDA'),
+                                          ('NOT|enables', 'GO:0000083', 'IMP'),
+                                          ('enables', 'GO:9999999', 'IDA')]:
+            fields = ['UniProtKB', uniprot_id, 'SYMBOL', qualifier, term,
+                      'PMID:1', evidence, '', 'P']
+            f.write(('\t'.join(fields) + '\n').encode('utf-8'))
+
+    parse_go.add_annotations(godict, gaf)
+    genes = godict['GO:0000083']['genes']
+    assert len(ensembl_ids) > 0
+    assert genes['IDA'] == ensembl_ids
+    assert 'HDA' not in genes
+    assert genes['IMP'] == []
+
+
 if __name__ == "__main__":
     pytest.main([__file__])
@@ -1,4 +1,7 @@
-from genemunge import convert
+import numpy as np
+import pandas as pd
+
+from genemunge import convert, resources
 
 import pytest
 
@@ -52,5 +55,152 @@ def test_converter_convert_list():
     assert converter.convert_list(cleaned_ids) == gene_symbols
 
 
+def test_column_cache():
+    """Check that the column cache matches the HGNC table."""
+    table = pd.read_table(convert.FILENAME, usecols=['symbol', 'entrez_id'], dtype=str)
+    columns = convert.load_columns(['symbol', 'entrez_id'])
+    for c in ['symbol', 'entrez_id']:
+        assert columns[c].dtype == object
+        assert list(columns[c]) == list(table[c].fillna(''))
+    text, offsets = resources.encode_strings(['', 'TP53', 'naïve', ''])
+    assert list(resources.decode_strings(text, offsets)) == ['', 'TP53', 'naïve', '']
+
+
+def test_converter_one_to_many():
+    """Check the one-to-many policies against the split HGNC table."""
+    table = pd.read_table(convert.FILENAME, usecols=['uniprot_ids', 'ensembl_gene_id'],
+                          dtype=str).dropna()
+    pairs = table.assign(uniprot_ids=table['uniprot_ids'].str.split('|')).explode('uniprot_ids')
+    targets = pairs.groupby('uniprot_ids')['ensembl_gene_id'].apply(list)
+    ids = list(targets.index[:200]) + ['not_an_id']
+    converter = convert.IDConverter('uniprot_ids', 'ensembl_gene_id')
+    assert converter.convert_list(ids, 'all') == [targets[i] for i in ids[:-1]] + [[]]
+    assert converter.convert_list(ids, 'first')[:-1] == [targets[i][0] for i in ids[:-1]]
+    unique = converter.convert_list(ids, 'unique_only')
+    for i, converted in zip(ids[:-1], unique):
+        if len(targets[i]) == 1:
+            assert converted == targets[i][0]
+        else:
+            assert converted != converted
+    long = converter.convert_long(ids)
+    assert len(long) == sum(len(targets[i]) for i in ids[:-1])
+    assert list(long['ensembl_gene_id']) == [t for i in ids[:-1] for t in targets[i]]
+
+
+def test_symbol_resolver():
+    """Check that each stage is tried in order."""
+    table = pd.read_table(convert.FILENAME, usecols=['symbol', 'prev_symbol', 'alias_symbol'],
+                          dtype=str)
+    symbol = table['symbol'].iloc[0]
+    prev = table.dropna(subset=['prev_symbol']).iloc[0]
+    alias = table.dropna(subset=['alias_symbol']).iloc[-1]
+    ids = [symbol, prev['prev_symbol'].split('|')[0],
+           alias['alias_symbol'].split('|')[-1], 'not_a_symbol']
+    resolved = convert.SymbolResolver().resolve(ids)
+    assert list(resolved.index) == ids
+    assert list(resolved['symbol'][:3]) == [symbol, prev['symbol'], alias['symbol']]
+    assert list(resolved['stage'][:3]) == ['symbol', 'prev_symbol', 'alias_symbol']
+    assert resolved['symbol'].isnull()[3] and resolved['stage'].isnull()[3]
+    assert not resolved['ambiguous'].any()
+
+
+def test_converter_convert_array():
+    """Check the array conversion against converting one id at a time."""
+    converter = convert.IDConverter('ensembl_gene_id', 'symbol')
+    ids = list(converter.conversion_table.index[:50]) + ['not_an_id'] * 3
+    expected = [converter.convert(i) for i in ids]
+    converted = converter.convert_array(np.array(ids, dtype=object), missing='')
+    assert list(converted) == expected[:-3] + [''] * 3
+    assert isinstance(converter.convert_array(pd.Index(ids)), pd.Index)
+    listed = converter.convert_list(ids)
+    assert listed[:-3] == expected[:-3]
+    assert all(x != x for x in listed[-3:])
+
+
+def test_converter_convert_cached():
+    """Check that the dictionary and LRU lookups agree with convert_list."""
+    converter = convert.IDConverter('ensembl_gene_id', 'symbol')
+    lru = convert.IDConverter('ensembl_gene_id', 'symbol', cache_size=10)
+    ids = list(converter.conversion_table.index[:50])
+    expected = converter.convert_list(ids)
+    assert [converter.convert(i) for i in ids] == expected
+    assert [lru.convert(i) for i in ids + ids] == expected + expected
+    assert lru._lookup_one.cache_info().currsize == 10
+    assert converter.convert('not_an_id') != converter.convert('not_an_id')
+    assert lru.convert('not_an_id') != lru.convert('not_an_id')
+
+
+def test_converter_convert_columns():
+    """Convert the columns of a DataFrame and aggregate duplicates."""
+    converter = convert.IDConverter('ensembl_gene_id', 'symbol')
+    genes = list(converter.conversion_table.index[:3])
+    symbols = converter.convert_list(genes)
+    x = np.random.rand(4, 5)
+    df = pd.DataFrame(x, columns=[genes[0], genes[1], genes[0], 'not_an_id', genes[2]])
+    summed = converter.convert_columns(df)
+    assert list(summed.columns) == symbols
+    assert np.allclose(summed.values, x[:, [0, 1, 4]] + np.outer(x[:, 2], [1, 0, 0]))
+    first = converter.convert_columns(df, on_duplicate='first', on_missing='keep')
+    assert list(first.columns) == symbols[:2] + ['not_an_id', symbols[2]]
+    assert np.allclose(first.values, x[:, [0, 1, 3, 4]])
+    assert np.allclose(converter.convert_columns(df, 'mean').values[:, 0], x[:, [0, 2]].mean(axis=1))
+    assert np.allclose(converter.convert_columns(df, 'max').values[:, 0], x[:, [0, 2]].max(axis=1))
+
+
+def test_converter_convert_columns_empty_target():
+    """Keep or drop a column whose id is known but has no target."""
+    converter = convert.IDConverter('ensembl_gene_id', 'symbol')
+    genes = list(converter.conversion_table.index[:2])
+    converter._targets = converter._targets.copy()
+    converter._targets[1] = np.nan
+    x = np.random.rand(4, 3)
+    df = pd.DataFrame(x, columns=[genes[0], genes[1], 'not_an_id'])
+    symbol = converter.convert(genes[0])
+    kept = converter.convert_columns(df, on_missing='keep')
+    assert list(kept.columns) == [symbol, genes[1], 'not_an_id']
+    assert np.allclose(kept.values, x)
+    dropped = converter.convert_columns(df)
+    assert list(dropped.columns) == [symbol]
+    assert np.allclose(dropped.values, x[:, [0]])
+
+
+def test_multi_converter():
+    """Check that a MultiConverter agrees with one IDConverter per target."""
+    targets = ['symbol', 'name', 'entrez_id', 'uniprot_ids', 'ensembl_gene_id']
+    multi = convert.MultiConverter('ensembl_gene_id', targets)
+    ids = list(multi.index[:100]) + ['not_an_id']
+    converted = multi.convert(ids)
+    assert list(converted.columns) == targets
+    assert list(converted.index) == ids
+    for target in targets:
+        expected = convert.IDConverter('ensembl_gene_id', target).convert_list(ids)
+        assert converted[target][:-1].tolist() == expected[:-1]
+    assert converted.iloc[-1].isnull().all()
+
+
+def test_clean_ensembl_ids_index():
+    """Clean an Index of Ensembl IDs, with and without the cache."""
+    index = pd.Index(['foo.bar', 'bar.baz', 'baz'], name='gene')
+    cleaned = convert.clean_ensembl_ids(index)
+    assert isinstance(cleaned, pd.Index) and cleaned.name == 'gene'
+    assert list(cleaned) == ['FOO', 'BAR', 'BAZ']
+    assert list(convert.clean_ensembl_ids(index.values)) == ['FOO', 'BAR', 'BAZ']
+    assert convert.clean_ensembl_ids(index, cache=True) is convert.clean_ensembl_ids(index, cache=True)
+
+
+def test_gene_universe():
+    """Check the category masks against the HGNC table."""
+    universe = convert.GeneUniverse('ensembl_gene_id')
+    table = pd.read_table(convert.FILENAME, dtype=str).set_index('ensembl_gene_id')
+    table = table.loc[universe.genes]
+    mask = universe.mask(locus_group='protein-coding gene', status='Approved')
+    expected = (table['locus_group'] == 'protein-coding gene') & (table['status'] == 'Approved')
+    assert (mask == expected.values).all()
+    family = table['gene_family'].dropna().iloc[0].split('|')[0]
+    expected = table['gene_family'].fillna('').str.split('|').apply(lambda x: family in x)
+    assert (universe.mask(gene_family=family) == expected.values).all()
+    assert list(universe.select(mask)) == list(table.index[mask])
+
+
 if __name__ == "__main__":
     pytest.main([__file__])
@@ -0,0 +1,35 @@
+import pandas as pd
+
+from genemunge import locate, convert
+
+
+def test_parse_locations():
+    """Check that bands nest within their arms and chromosomes."""
+    intervals = locate.parse_locations(['17', '17p', '17p13', '17p13.1',
+                                        '17p13.1-p12', '17q21', 'reserved'])
+    assert list(intervals.index) == [0, 1, 2, 3, 4, 5]
+    start, end = intervals['start'].values, intervals['end'].values
+    for outer, inner in [(0, 1), (1, 2), (2, 3), (4, 3), (0, 5)]:
+        assert start[outer] <= start[inner] and end[inner] <= end[outer]
+    # the p arm comes before the q arm
+    assert end[1] <= start[5]
+
+
+def test_location_index():
+    """Check region queries against a brute force search."""
+    table = pd.read_table(convert.FILENAME, usecols=['symbol', 'location'], dtype=str)
+    index = locate.LocationIndex()
+    regions = list(table['location'].dropna().iloc[:5]) + ['X', 'not_a_region']
+    intervals = locate.parse_locations(table['location'])
+    overlap = index.overlap(regions)
+    within = index.within(regions)
+    queries = locate.parse_locations(regions)
+    for i, region in enumerate(regions):
+        if i not in queries.index:
+            assert i not in overlap.index
+            continue
+        q = queries.loc[[i]].iloc[0]
+        hits = intervals[(intervals['start'] < q['end']) & (intervals['end'] > q['start'])]
+        inside = intervals[(intervals['start'] >= q['start']) & (intervals['end'] <= q['end'])]
+        assert sorted(overlap.loc[[i], 'symbol']) == sorted(set(table['symbol'][hits.index]))
+        assert sorted(within.loc[[i], 'symbol']) == sorted(set(table['symbol'][inside.index]))
@@ -1,6 +1,8 @@
 import numpy as np
 import pandas as pd
+from scipy import sparse
 from collections import namedtuple
+from cytoolz import partial
 
 from genemunge import normalize
 
@@ -43,6 +45,34 @@ def test_deduplicate():
     assert np.allclose(x[:, 3], df_dedup.values[:,2])
 
 
+def test_deduplicate_missing_labels():
+    """Check that columns with missing labels are dropped, as by groupby."""
+    x = np.random.rand(10, 5)
+    for columns in [['a', np.nan, 'b', 'c', 'b'], ['a', np.nan, 'b', 'c', 'd']]:
+        df = pd.DataFrame(x, columns=columns)
+        expected = df.groupby(df.columns, axis=1).sum()
+        df_dedup = normalize.deduplicate(df)
+        assert list(df_dedup.columns) == list(expected.columns)
+        assert np.allclose(df_dedup.values, expected.values)
+
+        df_sparse = pd.DataFrame.sparse.from_spmatrix(sparse.csr_matrix(x), columns=columns)
+        df_dedup = normalize.deduplicate(df_sparse)
+        assert list(df_dedup.columns) == list(expected.columns)
+        assert np.allclose(df_dedup.sparse.to_coo().toarray(), expected.values)
+
+
+def test_deduplicate_sparse():
+    """Check the deduplication of some sparse data."""
+    x = sparse.random(10, 5, density=0.4, format='csr')
+    df = pd.DataFrame.sparse.from_spmatrix(x, columns=['a', 'a', 'b', 'c', 'b'])
+
+    df_dedup = normalize.deduplicate(df)
+    expected = normalize.deduplicate(pd.DataFrame(x.toarray(), columns=df.columns))
+    assert normalize.is_sparse(df_dedup)
+    assert list(df_dedup.columns) == list(expected.columns)
+    assert np.allclose(df_dedup.sparse.to_coo().toarray(), expected.values)
+
+
 def test_impute(expression_data):
     """Check the imputation of some expression data."""
     scale = 0.5
@@ -57,6 +87,15 @@ def test_impute(expression_data):
                        imputed_data * ~zero_mask)
 
 
+def test_impute_inplace(expression_data):
+    """Check that imputing in place matches imputing a copy."""
+    counts = expression_data.counts.copy()
+    expected = normalize.impute(counts)
+    imputed = normalize.impute(counts, inplace=True)
+    assert imputed is counts
+    assert np.allclose(counts.values, expected.values)
+
+
 def test_normalizer_tpm_from_rpkm(expression_data):
     """Test the RPKM -> TPM conversion for some expression data."""
     identifier = 'symbol'
@@ -141,6 +180,112 @@ def test_clr_functions(expression_data):
     assert np.allclose(tpm, tpm_from_clr)
 
 
+def test_float32_buffers(expression_data):
+    """Check that float32 data stays float32 and is transformed in one buffer."""
+    norm = normalize.Normalizer(identifier='symbol')
+    gene_list = list(expression_data.counts.columns)
+    counts = expression_data.counts.astype(np.float32)
+    imputer = partial(normalize.impute, inplace=True)
+    expected = norm.clr_from_tpm(norm.tpm_from_counts(expression_data.counts, gene_list),
+                                 gene_list, normalize.impute)
+
+    clr = norm.clr_from_tpm(norm.tpm_from_counts(counts, gene_list), gene_list, imputer)
+    assert (clr.dtypes == np.float32).all()
+    assert np.allclose(clr.values, expected.values, atol=1e-4)
+
+    out = np.empty(counts.shape, dtype=np.float32)
+    tpm = norm.tpm_from_counts(counts, gene_list, out=out)
+    assert np.shares_memory(tpm.values, out)
+
+    tpm = counts.copy()
+    clr = norm.clr_from_tpm(norm.tpm_from_counts(tpm, gene_list, inplace=True),
+                            gene_list, imputer, inplace=True)
+    assert clr is tpm
+    assert np.allclose(clr.values, expected.values, atol=1e-4)
+
+
+def test_sparse_transforms(expression_data):
+    """Check that sparse data stays sparse until the log transform."""
+    norm = normalize.Normalizer(identifier='symbol')
+    gene_list = list(expression_data.counts.columns)[::-1]
+    counts = expression_data.counts.where(np.random.rand(*expression_data.counts.shape) < 0.1, 0)
+    counts_sparse = pd.DataFrame.sparse.from_spmatrix(sparse.csr_matrix(counts.values),
+                                                      index=counts.index, columns=counts.columns)
+
+    for transform in [norm.reindex, norm.tpm_from_counts, norm.tpm_from_rpkm]:
+        result = transform(counts_sparse, gene_list)
+        expected = transform(counts, gene_list)
+        assert normalize.is_sparse(result)
+        assert (result.columns == expected.columns).all()
+        assert np.allclose(result.sparse.to_coo().toarray(), expected.values)
+
+    tpm = norm.tpm_from_counts(counts_sparse, gene_list)
+    clr = norm.clr_from_tpm(tpm, gene_list, imputer=normalize.impute)
+    expected = norm.clr_from_tpm(norm.tpm_from_counts(counts, gene_list), gene_list,
+                                 imputer=normalize.impute)
+    assert not normalize.is_sparse(clr)
+    assert np.allclose(clr.values, expected.values)
+
+
+def test_allocated_bytes():
+    """Check the peak memory of the transforms."""
+    norm = normalize.Normalizer(identifier='symbol')
+    gene_list = list(norm.gene_lengths.index[:1000])
+    counts = pd.DataFrame(np.round(100 * np.random.rand(4000, 1000)).astype(np.float32),
+                          columns=gene_list)
+    imputer = partial(normalize.impute, inplace=True)
+    clr, peak = normalize.allocated_bytes(norm.clr_from_tpm, counts, gene_list, imputer)
+    assert clr.shape == counts.shape
+    assert peak < 1.5 * counts.values.nbytes
+    clr, peak = normalize.allocated_bytes(norm.clr_from_tpm, counts, gene_list, imputer,
+                                          inplace=True)
+    assert peak < 0.5 * counts.values.nbytes
+
+
+def test_alignment_plans(expression_data):
+    """Check that column alignment plans are cached and evicted."""
+    norm = normalize.Normalizer(identifier='symbol', plan_cache_size=2)
+    counts = expression_data.counts
+    gene_list = list(counts.columns[:500])
+    tpm = norm.tpm_from_counts(counts, gene_list)
+    plan = norm._plan(counts.columns, gene_list)
+    assert len(norm._plans) == 1
+    assert list(plan.genes) == gene_list
+    assert not plan.missing.any()
+
+    # indexes are keyed once, by a sample of their values
+    key = normalize._index_key(counts.columns)
+    assert normalize._index_key(counts.columns) is key
+    assert normalize._index_key(counts.columns.copy()) == key
+    assert normalize._index_key(counts.columns[::-1]) != key
+
+    # columns with the same key but other labels get their own plan
+    swapped = list(counts.columns)
+    swapped[1], swapped[2] = swapped[2], swapped[1]
+    swapped = pd.Index(swapped)
+    assert normalize._index_key(swapped) == key
+    other = norm._plan(swapped, gene_list)
+    assert other is not plan
+    assert list(other.positions[:3]) == [0, 2, 1]
+    assert list(norm._plan(counts.columns, gene_list).positions[:3]) == [0, 1, 2]
+    plan = norm._plan(counts.columns, gene_list)
+
+    # a frame with the same columns reuses the plan
+    tpm_copy = norm.tpm_from_counts(counts.copy(), gene_list)
+    assert norm._plan(counts.columns.copy(), gene_list) is plan
+    assert np.allclose(tpm.values, tpm_copy.values)
+
+    # references are placed last
+    references = gene_list[:10]
+    alr = norm.alr_from_tpm(tpm, references, gene_list)
+    assert list(alr.columns) == gene_list[10:]
+    assert len(norm._plans) == 2
+
+    norm.tpm_from_counts(counts)
+    assert len(norm._plans) == 2
+    assert norm._plan(counts.columns, gene_list) is not plan
+
+
 def test_alr_functions(expression_data):
     """Test the TPM -> ALR  transform for some expression data."""
     identifier = 'symbol'
@@ -183,6 +328,44 @@ def test_gtex_reindex(expression_data):
     assert (tpm.columns == norm.gene_lengths.index).all()
 
 
+def test_reindex_with_mask(expression_data):
+    """Reindex to the protein coding genes with a gene universe mask."""
+    norm = normalize.Normalizer(identifier='symbol')
+    assert norm._universe is None
+    mask = norm.universe.mask(locus_group='protein-coding gene')
+    reindexed = norm.reindex(expression_data.counts, mask)
+    coding = set(norm.universe.select(mask))
+    expected = [g for g in norm.gene_lengths.index if g in coding]
+    assert list(reindexed.columns) == expected
+
+
+def test_transform_file(expression_data, tmp_path):
+    """Check that transforming a file in blocks matches the in-memory transform."""
+    norm = normalize.Normalizer(identifier='symbol')
+    gene_list = list(expression_data.counts.columns)
+    counts = expression_data.counts.copy()
+    counts.index = ['sample_{}'.format(i) for i in range(len(counts))]
+    counts.to_csv(str(tmp_path / 'counts.csv'))
+    progress = []
+    num_rows = norm.transform_file('tpm_from_counts', str(tmp_path / 'counts.csv'),
+                                   str(tmp_path / 'tpm.h5'), chunksize=30,
+                                   progress=lambda done, total: progress.append((done, total)),
+                                   gene_list=gene_list)
+    assert num_rows == len(counts)
+    assert progress == [(30, None), (60, None), (90, None), (100, None)]
+    # read the HDF5 output back in blocks and write a tab separated file
+    norm.transform_file('clr_from_tpm', str(tmp_path / 'tpm.h5'), str(tmp_path / 'clr.tsv'),
+                        chunksize=40, progress=lambda done, total: progress.append((done, total)),
+                        gene_list=gene_list, imputer=normalize.impute)
+    assert progress[-3:] == [(40, 100), (80, 100), (100, 100)]
+    clr = pd.read_csv(str(tmp_path / 'clr.tsv'), sep='\t', index_col=0)
+    expected = norm.clr_from_tpm(norm.tpm_from_counts(counts, gene_list=gene_list),
+                                 gene_list=gene_list, imputer=normalize.impute)
+    assert (clr.index == counts.index).all()
+    assert (clr.columns == expected.columns).all()
+    assert np.allclose(clr.values, expected.values)
+
+
 def test_zscore_from_clr(expression_data):
     """Test the z-score transformation on CLR data."""
     identifier = 'symbol'
@@ -211,6 +394,32 @@ def test_ordinalize(expression_data):
     assert ((clr > cutoffs[0]) == (ords == 1+min_value)).all().all()
 
 
+def test_normalization_pipeline(expression_data, tmp_path):
+    """Check that a pipeline matches the chained Normalizer transforms."""
+    norm = normalize.Normalizer(identifier='symbol')
+    counts = expression_data.counts
+    gene_list = list(counts.columns)
+    tissues = pd.Series(np.random.choice(['Liver', 'Lung'], len(counts)), index=counts.index)
+    cutoffs = [-1, 1]
+
+    tpm = norm.tpm_from_counts(counts, gene_list, imputer=normalize.impute)
+    zscore = norm.z_score_from_clr(norm.clr_from_tpm(tpm, gene_list), tissues)
+    expected = norm.ordinalize(zscore, cutoffs)
+
+    pipeline = normalize.NormalizationPipeline(
+            ['reindex', 'impute', 'tpm_from_counts', 'clr_from_tpm', 'z_score_from_clr',
+             ('ordinalize', {'cutoffs': cutoffs})], gene_list=gene_list)
+    result = pipeline.fit_transform(counts, tissues, normalizer=norm)
+    assert (result.columns == expected.columns).all()
+    assert np.array_equal(result.values, expected.values)
+
+    # a saved pipeline runs without the Normalizer, on any order of the columns
+    pipeline.save(str(tmp_path / 'pipeline.pkl'))
+    loaded = normalize.NormalizationPipeline.load(str(tmp_path / 'pipeline.pkl'))
+    assert np.array_equal(loaded.transform(counts.iloc[:, ::-1], tissues).values,
+                          expected.values)
+
+
 def test_remove_unwanted_variation_noX():
     """Test the RUV2 implementation for data with no X."""
     num_samples = 100
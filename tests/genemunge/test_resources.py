@@ -0,0 +1,44 @@
+from genemunge import resources, search, convert, describe
+
+import pytest
+
+
+def test_shared_searcher_data():
+    """Check that Searchers share their compiled data."""
+    first = search.Searcher()
+    second = search.Searcher()
+    assert first.graph is second.graph
+    assert first.annotations is second.annotations
+    assert first.text_index is second.text_index
+
+
+def test_shared_conversion_table():
+    """Check that converters between the same ids share a table."""
+    first = convert.IDConverter('symbol', 'ensembl_gene_id')
+    second = convert.IDConverter('symbol', 'ensembl_gene_id')
+    assert first.conversion_table is second.conversion_table
+
+
+def test_file_hash(tmp_path):
+    """Check that a file hash follows the contents, not the modification time."""
+    import os
+    filename = tmp_path / 'go.json'
+    filename.write_text('{"GO:0008150": {}}')
+    signature = resources.file_hash(filename)
+    os.utime(filename, ns=(0, 0))
+    assert resources.file_hash(filename) == signature
+    filename.write_text('{"GO:0008150": []}')
+    assert resources.file_hash(filename) != signature
+
+
+def test_preload_and_clear():
+    """Preload the data, then release it."""
+    resources.clear()
+    resources.preload(['symbol'])
+    assert 'tissue_stats' in resources.loaded()
+    assert ('conversion_table', 'symbol', 'ensembl_gene_id') in resources.loaded()
+    describer = describe.Describer('symbol')
+    stats = describer.tissue_stats['mean']
+    resources.clear()
+    assert resources.loaded() == []
+    assert describe.Describer('symbol').tissue_stats['mean'] is not stats
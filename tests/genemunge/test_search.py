@@ -1,3 +1,5 @@
+import numpy as np
+
 from genemunge import search
 
 import pytest
@@ -13,6 +15,86 @@ def test_searcher_traverse():
     descendants = searcher.traverse(biological_process_id)
 
 
+def test_go_data():
+    """Check that the compact GO data matches go.json."""
+    import json
+    with open(search.GONAME, 'r') as infile:
+        go = json.load(infile)
+    searcher = search.Searcher()
+    assert isinstance(searcher.data['name_text'], np.memmap)
+    assert len(searcher.go) == len(go)
+    for term in list(go)[::100]:
+        for field in ['name', 'namespace', 'def', 'children']:
+            assert searcher.go[term][field] == go[term][field]
+        assert sorted(searcher.go[term]['parents']) == sorted(go[term]['parents'])
+        for code, genes in go[term]['genes'].items():
+            assert searcher.go[term]['genes'][code] == sorted(set(genes))
+
+
+def test_searcher_traverse_exclusive():
+    """Check that an exclusive traversal drops only the given GO ID."""
+    searcher = search.Searcher()
+    inclusive = searcher.traverse(biological_process_id)
+    exclusive = searcher.traverse(biological_process_id, inclusive=False)
+    assert biological_process_id not in exclusive
+    assert sorted(exclusive + [biological_process_id]) == sorted(inclusive)
+
+
+def test_searcher_traverse_many():
+    """Check that a batch traversal matches traversing one GO ID at a time."""
+    searcher = search.Searcher()
+    terms = [biological_process_id] + searcher.go[biological_process_id]['children']
+    descendants = searcher.traverse_many(terms)
+    for term in terms:
+        assert sorted(descendants[term]) == sorted(searcher.traverse(term))
+
+
+def test_searcher_closure_cache():
+    """Check that traversals from a size limited closure cache match
+    traversals of the graph."""
+    searcher = search.Searcher()
+    cached = search.Searcher(cache_closure=True, closure_max_bytes=10**5)
+    terms = searcher.go[biological_process_id]['children']
+    for term in terms:
+        assert cached.traverse(term) == searcher.traverse(term)
+        assert cached.ancestors(term) == searcher.ancestors(term)
+    assert cached.closure.nbytes <= 10**5
+
+
+def test_closure_cache_saved(tmp_path):
+    """Check that a saved closure is reloaded only if it fits in the budget."""
+    searcher = search.Searcher()
+    filename = str(tmp_path / 'go_closure.npz')
+    terms = [searcher.graph.index[t]
+             for t in searcher.go[biological_process_id]['children']]
+    full = search.ClosureCache(searcher.graph, filename=filename)
+    expected = [full.descendants(i) for i in terms]
+    with np.load(filename) as saved:
+        arrays = ['desc_indptr', 'desc_indices', 'anc_indptr', 'anc_indices']
+        assert search._npz_nbytes(saved, arrays) == full.nbytes
+
+    reloaded = search.ClosureCache(searcher.graph, max_bytes=full.nbytes,
+                                   filename=filename)
+    assert [reloaded.descendants(i).tolist() for i in terms] == \
+        [e.tolist() for e in expected]
+    assert reloaded.nbytes == full.nbytes
+
+    limited = search.ClosureCache(searcher.graph, max_bytes=10**5,
+                                  filename=filename)
+    assert [limited.descendants(i).tolist() for i in terms] == \
+        [e.tolist() for e in expected]
+    assert limited.nbytes <= 10**5
+
+
+def test_searcher_ancestors():
+    """Check that a GO ID is a descendant of each of its ancestors."""
+    searcher = search.Searcher()
+    term = searcher.go[biological_process_id]['children'][0]
+    ancestors = searcher.ancestors(term, inclusive=False)
+    assert biological_process_id in ancestors
+    assert all(term in searcher.traverse(a) for a in ancestors)
+
+
 def test_searcher_select_namespace():
     """Try to select all IDs in a given namespace."""
     searcher = search.Searcher()
@@ -34,6 +116,29 @@ def test_searcher_get_genes():
     bp_genes = searcher.get_genes([biological_process_id])
 
 
+def test_searcher_get_genes_propagated():
+    """Check that the propagated genes of a GO ID are the genes of all
+    of its descendants."""
+    searcher = search.Searcher(precompute_propagated=True)
+    term = searcher.go[biological_process_id]['children'][0]
+    assert searcher.get_genes([term], propagate=True) == \
+        searcher.get_genes(searcher.traverse(term))
+    assert searcher.get_genes([biological_process_id], propagate=True) == \
+        searcher.get_genes(searcher.select_namespace(biological_process_namespace))
+
+
+def test_searcher_get_genes_mask():
+    """Check that a gene universe mask filters the genes of a GO ID."""
+    from genemunge import convert
+    searcher = search.Searcher()
+    universe = convert.GeneUniverse('ensembl_gene_id')
+    mask = universe.mask(locus_group='protein-coding gene')
+    coding = set(universe.select(mask))
+    genes = searcher.get_genes([biological_process_id], propagate=True)
+    masked = searcher.get_genes([biological_process_id], propagate=True, mask=mask)
+    assert masked == [g for g in genes if g in coding]
+
+
 def test_searcher_get_genes_allbp():
     """Try to get all genes associated with IDs in a namespace."""
     searcher = search.Searcher()
@@ -41,6 +146,155 @@ def test_searcher_get_genes_allbp():
     all_bp_genes = searcher.get_genes(ids)
 
 
+def test_searcher_keyword_search():
+    """Check that a keyword search finds exactly the GO IDs that contain
+    the keyword."""
+    searcher = search.Searcher()
+    keyword = 'cell cycle'
+    terms = searcher.keyword_search([keyword])
+    expected = [t for t in searcher.go if
+                keyword in searcher.go[t]['name'] or keyword in searcher.go[t]['def']]
+    assert sorted(terms) == sorted(expected)
+
+
+def test_searcher_keyword_search_substrings():
+    """Check keyword searches for parts of words against a full scan,
+    including a field that is not text."""
+    searcher = search.Searcher()
+    for keyword in ['a', 'ce', 'ycl', 'regulat', 'tion of', 'zzz', ' ']:
+        terms = searcher.keyword_search([keyword])
+        expected = [t for t in searcher.go if
+                    keyword in searcher.go[t]['name'] or keyword in searcher.go[t]['def']]
+        assert sorted(terms) == sorted(expected)
+    child = searcher.go[biological_process_id]['children'][0]
+    parents = searcher.keyword_search([child], fields=['children'])
+    assert sorted(parents) == sorted(searcher.go[child]['parents'])
+    with pytest.raises(ValueError):
+        searcher.ranked_search('cell', fields=['children'])
+
+
+def test_searcher_keyword_search_exclusion():
+    """Check that excluded GO IDs are not picked up while traversing."""
+    searcher = search.Searcher()
+    excluded = searcher.keyword_search(['binding'])
+    terms = searcher.keyword_search(['regulation'], exact=False,
+                                    exclude_keywords=['binding'])
+    assert len(terms) > 0
+    assert not set(terms) & set(excluded)
+
+
+def test_searcher_keyword_search_unknown_exclusion():
+    """Check that excluding GO IDs that are not in the ontology is harmless."""
+    searcher = search.Searcher()
+    terms = searcher.keyword_search(['regulation'])
+    assert searcher.keyword_search(['regulation'], exclude_ids=['GO:9999999']) == terms
+    excluded = searcher.keyword_search(['regulation'],
+                                       exclude_ids=['GO:9999999', terms[0]])
+    assert excluded == terms[1:]
+
+
+def test_searcher_query():
+    """Check that a boolean query combines its parts."""
+    searcher = search.Searcher()
+    query = search.Keyword('regulation') & search.Namespace(biological_process_namespace) \
+            & ~search.Keyword('transcription')
+    terms = searcher.query(query)
+    assert sorted(terms) == sorted(
+        set(searcher.keyword_search(['regulation']))
+        & set(searcher.select_namespace(biological_process_namespace))
+        - set(searcher.keyword_search(['transcription'])))
+
+
+def test_searcher_ranked_search():
+    """Check that a ranked search returns matching GO IDs, best first."""
+    searcher = search.Searcher()
+    results = searcher.ranked_search('"cell cycle" regulation', limit=10)
+    scores = [score for term, score in results]
+    assert len(results) > 0
+    assert scores == sorted(scores, reverse=True)
+    for term, score in results:
+        text = searcher.go[term]['name'] + ' ' + searcher.go[term]['def']
+        text = ' '.join(search.TOKEN.findall(text.lower()))
+        assert 'cell cycle' in text and 'regulation' in text
+
+
+def test_searcher_get_terms_for_genes():
+    """Check that the genes of a GO ID map back to that GO ID."""
+    searcher = search.Searcher()
+    term = searcher.select_namespace(biological_process_namespace)[-1]
+    genes = searcher.get_genes([term])
+    terms = searcher.get_terms_for_genes(genes + ['foo'])
+    assert all(term in terms[gene] for gene in genes)
+    assert terms['foo'] == []
+
+
+def test_searcher_membership_matrix():
+    """Check that the rows of the membership matrix match get_genes."""
+    searcher = search.Searcher()
+    matrix, terms, genes = searcher.membership_matrix()
+    propagated, _, _ = searcher.membership_matrix(propagate=True)
+    assert matrix.shape == (len(terms), len(genes))
+    term = searcher.go[biological_process_id]['children'][0]
+    i = terms.get_loc(term)
+    assert sorted(genes[matrix[i].indices]) == searcher.get_genes([term])
+    assert sorted(genes[propagated[i].indices]) == \
+        searcher.get_genes(searcher.traverse(term))
+
+
+def test_searcher_membership_matrix_saved(tmp_path, monkeypatch):
+    """Check that membership matrices are saved and reloaded from disk."""
+    monkeypatch.setattr(search, 'MEMBERSHIPNAME', str(tmp_path))
+    searcher = search.Searcher()
+    searcher._membership.clear()
+    propagated, _, _ = searcher.membership_matrix(['EXP', 'IDA'], propagate=True)
+    assert len(list(tmp_path.glob('*.npz'))) == 2
+
+    def fail(matrix):
+        raise AssertionError("the propagated matrix was rebuilt")
+    searcher._membership.clear()
+    monkeypatch.setattr(searcher.graph, 'propagate', fail)
+    reloaded, _, _ = searcher.membership_matrix(['IDA', 'EXP'], propagate=True)
+    assert (reloaded != propagated).nnz == 0
+    searcher._membership.clear()
+
+
+def test_searcher_enrichment():
+    """Check that the genes of a GO ID are enriched in that GO ID."""
+    searcher = search.Searcher()
+    matrix, terms, genes = searcher.membership_matrix(propagate=True)
+    sizes = matrix.sum(axis=1).A1
+    term = terms[sizes == sizes[sizes >= 5].min()][0]
+    term_genes = searcher.get_genes(searcher.traverse(term))
+    enriched = searcher.enrichment(term_genes, min_size=5)
+    assert enriched.loc[term, 'overlap'] == len(term_genes)
+    assert enriched.loc[term, 'pvalue'] < 1e-6
+    assert (enriched['fdr'] >= enriched['pvalue']).all()
+    # the adjusted p-values match the procedure applied to every tested term
+    pvalues = enriched['pvalue'].values
+    order = np.argsort(pvalues)
+    ranked = pvalues[order] * len(pvalues) / np.arange(1, len(pvalues) + 1)
+    expected = np.empty(len(pvalues))
+    expected[order] = np.minimum(np.minimum.accumulate(ranked[::-1])[::-1], 1)
+    assert np.allclose(enriched['fdr'], expected)
+
+
+def test_searcher_batch_enrichment():
+    """Check that a batch of enrichment tests matches single tests."""
+    searcher = search.Searcher()
+    gene_lists = {'hk': searcher.get_housekeeping_genes()[:100],
+                  'tf': searcher.get_transcription_factors()[:100]}
+    batch = searcher.batch_enrichment(gene_lists, min_size=5, max_size=500)
+    assert list(batch.columns) == ['list', 'term', 'overlap', 'pvalue', 'fdr']
+    assert (batch['overlap'] > 0).all()
+    for name in gene_lists:
+        single = searcher.enrichment(gene_lists[name], min_size=5, max_size=500)
+        rows = batch[batch['list'] == name].set_index('term')
+        expected = single[single['overlap'] > 0]
+        assert sorted(rows.index) == sorted(expected.index)
+        for column in ['overlap', 'pvalue', 'fdr']:
+            assert np.allclose(rows.loc[expected.index, column], expected[column])
+
+
 def test_searcher_get_housekeeping_genes():
     """Try to get the list of housekeeping genes.  Check a known HK gene."""
     searcher = search.Searcher()